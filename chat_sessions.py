@@ -0,0 +1,261 @@
+"""
+Server-side conversation sessions for the Bedrock chat route.
+
+Without sessions the route is stateless: the frontend decides how much
+context to resend and every call carries whatever it sent.  With a
+``session_id`` in the request body (or the ``X-Session-Id`` header) the
+Lambda keeps the conversation here instead:
+
+  - each session is a rolling list of turns plus a short running summary;
+  - before every call the history is trimmed to ``CHAT_HISTORY_TOKENS``:
+    the oldest turns are folded into the summary (their first sentence,
+    capped at ``CHAT_SUMMARY_TOKENS``), so the input size stays bounded no
+    matter how long the conversation gets;
+  - ``build_payload`` assembles the turns into the Claude 3 (Messages),
+    Amazon Nova and Claude v2 (prompt/completion) request shapes, the same
+    ones the stateless route sends;
+  - ``usage`` reads the token counts Bedrock reports for each call, falling
+    back to the local estimate when the model does not report them.
+
+Stores (``CHAT_SESSION_STORE``):
+  memory           dict in the Lambda container (lost on cold start; default)
+  file:<dir>       one JSON file per session, a local stand-in for a shared
+                   key-value store (DynamoDB, ElastiCache) with the same
+                   ``get``/``put`` interface
+
+Environment variables (read at import):
+  CHAT_SESSION_STORE    see above ("memory")
+  CHAT_SESSION_TTL_S    idle seconds before a session expires (3600)
+  CHAT_MAX_SESSIONS     sessions kept by the memory store, LRU (1000)
+  CHAT_HISTORY_TOKENS   token budget for history + summary (1500)
+  CHAT_SUMMARY_TOKENS   token cap of the running summary (200)
+  CHAT_CHARS_PER_TOKEN  characters per token for local estimates (3.5)
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+STORE_SPEC = os.environ.get("CHAT_SESSION_STORE", "memory")
+SESSION_TTL_S = float(os.environ.get("CHAT_SESSION_TTL_S", "3600"))
+MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "1000"))
+HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", "1500"))
+SUMMARY_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", "200"))
+CHARS_PER_TOKEN = float(os.environ.get("CHAT_CHARS_PER_TOKEN", "3.5"))
+
+# Generation settings shared by every payload shape
+MAX_TOKENS = 800
+TEMPERATURE = 0.3
+TOP_P = 0.9
+
+SESSION_HEADER = "x-session-id"
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_.:-]{1,128}$")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; Bedrock's own counts replace it whenever they are reported."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def valid_session_id(session_id: Any) -> bool:
+    return isinstance(session_id, str) and bool(_SESSION_ID.match(session_id))
+
+
+def new_session() -> Dict[str, Any]:
+    return {"turns": [], "summary": "", "updated": time.time(), "calls": 0,
+            "input_tokens": 0, "output_tokens": 0}
+
+
+class MemoryStore:
+    """Sessions in this container's memory, LRU-bounded, with idle expiry."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_s: float = SESSION_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session["updated"] > self.ttl_s:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return json.loads(json.dumps(session))
+
+    def put(self, session_id: str, session: Dict[str, Any]) -> None:
+        with self._lock:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+
+class FileStore:
+    """One JSON file per session under ``directory``; writes are atomic renames."""
+
+    def __init__(self, directory: str, ttl_s: float = SESSION_TTL_S):
+        self.directory = directory
+        self.ttl_s = ttl_s
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        name = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(session_id)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                session = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if time.time() - session.get("updated", 0) > self.ttl_s:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return session
+
+    def put(self, session_id: str, session: Dict[str, Any]) -> None:
+        path = self._path(session_id)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(session, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def make_store(spec: str = STORE_SPEC):
+    if spec == "memory":
+        return MemoryStore()
+    if spec.startswith("file:"):
+        return FileStore(spec[len("file:"):])
+    raise ValueError(f"Unsupported CHAT_SESSION_STORE: {spec}")
+
+
+def _first_sentence(text: str, max_chars: int = 160) -> str:
+    sentence = _SENTENCE_END.split(text.strip(), 1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3].rstrip() + "..."
+
+
+def _summary_line(turn: Dict[str, Any]) -> str:
+    speaker = "User" if turn["role"] == "user" else "Assistant"
+    return f"{speaker}: {_first_sentence(turn['text'])}"
+
+
+def trim(session: Dict[str, Any], budget: int = HISTORY_TOKENS, summary_budget: int = SUMMARY_TOKENS) -> int:
+    """
+    Fold the oldest turns into the summary until history + summary fit ``budget``.
+
+    Turns are dropped in user/assistant pairs so the kept history always
+    starts with a user turn (the Messages API requires it).  Returns the
+    number of turns folded.
+    """
+    turns = session["turns"]
+    summary_lines = [line for line in session["summary"].split("\n") if line]
+    folded = 0
+
+    def total():
+        return sum(t["tokens"] for t in turns) + estimate_tokens("\n".join(summary_lines))
+
+    while turns and total() > budget:
+        pair = turns[:2] if len(turns) > 1 and turns[1]["role"] == "assistant" else turns[:1]
+        del turns[:len(pair)]
+        folded += len(pair)
+        summary_lines.extend(_summary_line(t) for t in pair)
+        # The summary itself is bounded: the oldest lines go first
+        while summary_lines and estimate_tokens("\n".join(summary_lines)) > summary_budget:
+            summary_lines.pop(0)
+    session["summary"] = "\n".join(summary_lines)
+    return folded
+
+
+def system_prompt(base: str, session: Optional[Dict[str, Any]]) -> str:
+    if session and session["summary"]:
+        return f"{base}\n\nSummary of the earlier conversation:\n{session['summary']}"
+    return base
+
+
+def build_payload(model_id: str, system: str, turns: List[Dict[str, Any]], user_prompt: str) -> Dict[str, Any]:
+    """Request body for ``invoke_model``: prior ``turns`` plus the new user prompt."""
+    history = [(t["role"], t["text"]) for t in turns] + [("user", user_prompt)]
+    # Anthropic Claude 3 models use Messages API; Claude 2 uses prompt/completion.
+    if "claude-3" in model_id:
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "system": system,
+            "messages": [{"role": role, "content": [{"type": "text", "text": text}]} for role, text in history],
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE,
+            "top_p": TOP_P,
+        }
+    # Amazon Nova (converse/messages API)
+    if "nova" in model_id:
+        return {
+            "system": [{"text": system}],
+            "messages": [{"role": role, "content": [{"text": text}]} for role, text in history],
+            "inferenceConfig": {"maxTokens": MAX_TOKENS, "temperature": TEMPERATURE, "topP": TOP_P},
+        }
+    # Anthropic v2 format: after the system prompt, each turn is "\n\nHuman:" / "\n\nAssistant:"
+    transcript = "".join(f"\n\n{'Human' if role == 'user' else 'Assistant'}: {text}" for role, text in history)
+    return {
+        "prompt": f"{system}{transcript}\n\nAssistant:",
+        "max_tokens_to_sample": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+        "top_p": TOP_P,
+    }
+
+
+def parse_reply(result: Dict[str, Any]) -> str:
+    """Assistant text from any of the three response shapes."""
+    if "content" in result:  # Claude 3 Messages API
+        text_blocks = [c.get("text", "") for c in result.get("content") or [] if c.get("type") == "text"]
+    elif isinstance(result.get("output"), dict) and "message" in result["output"]:
+        # Amazon Nova responds with output.message.content
+        content = result["output"].get("message", {}).get("content") or []
+        text_blocks = [c.get("text", "") for c in content if c.get("text")]
+    else:
+        text_blocks = [result.get("completion") or ""]
+    return (text_blocks[0] if text_blocks else "").strip()
+
+
+def usage(result: Dict[str, Any], response: Dict[str, Any], payload: Dict[str, Any], reply: str) -> Dict[str, Any]:
+    """Input/output tokens of one call: reported by Bedrock when available, else estimated."""
+    reported = result.get("usage") or {}
+    headers = (response.get("ResponseMetadata") or {}).get("HTTPHeaders") or {}
+    input_tokens = (reported.get("input_tokens") or reported.get("inputTokens")
+                    or headers.get("x-amzn-bedrock-input-token-count"))
+    output_tokens = (reported.get("output_tokens") or reported.get("outputTokens")
+                     or headers.get("x-amzn-bedrock-output-token-count"))
+    if input_tokens is not None and output_tokens is not None:
+        return {"input_tokens": int(input_tokens), "output_tokens": int(output_tokens), "estimated": False}
+    return {"input_tokens": estimate_tokens(json.dumps(payload, ensure_ascii=False)),
+            "output_tokens": estimate_tokens(reply), "estimated": True}
+
+
+def record(session: Dict[str, Any], user_prompt: str, reply: str, call_usage: Dict[str, Any]) -> None:
+    """
+    Append the exchange to the session and account its tokens.
+
+    ``reply`` must not be empty: Bedrock rejects empty text blocks, so an
+    empty assistant turn would break every later call of the session.
+    """
+    if not reply:
+        raise ValueError("Empty replies are not recorded in the session.")
+    session["turns"].append({"role": "user", "text": user_prompt, "tokens": estimate_tokens(user_prompt)})
+    session["turns"].append({"role": "assistant", "text": reply, "tokens": estimate_tokens(reply)})
+    session["calls"] += 1
+    session["input_tokens"] += call_usage["input_tokens"]
+    session["output_tokens"] += call_usage["output_tokens"]
+    session["updated"] = time.time()
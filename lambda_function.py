@@ -1,8 +1,13 @@
 import json
 import os
 import base64
+import time
 import boto3
 
+import chat_sessions
+import profiler
+import shadow
+
 # Reusable SageMaker Runtime client
 sagemaker_runtime = boto3.client("sagemaker-runtime")
 bedrock_runtime = boto3.client(
@@ -37,7 +42,40 @@ You are an expert and precise assistant in:
 Always respond as a chatbot: brief, friendly, and natural, without code. Be clear, concise, do not invent data. Explain with conceptual rigor and, when applicable, suggest good deployment and integration practices in AWS.
 """.strip()
 
+# Conversation sessions of the Bedrock route (see chat_sessions.py)
+chat_store = chat_sessions.make_store()
+
+
+def _request_headers(event):
+    return {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+
+
+def _wants_profile(event):
+    """
+    True if this invocation should be profiled: ``X-Profile`` header,
+    ``"profile": true`` in the JSON body or PROFILE_SAMPLE_RATE sampling.
+    """
+    request_headers = _request_headers(event)
+    if profiler.is_true(request_headers.get(profiler.PROFILE_HEADER, "")):
+        return True
+    body = event.get("body")
+    if body and event.get("isBase64Encoded"):
+        try:
+            body = base64.b64decode(body)
+        except ValueError:
+            body = None
+    return profiler.body_requests_profile(body) or profiler.sampled()
+
+
 def lambda_handler(event, context):
+    """
+    Lambda entry point; profiles the invocation on demand (see profiler.py).
+    """
+    with profiler.profile_block("lambda", _wants_profile(event), sink=print):
+        return _proxy(event, context)
+
+
+def _proxy(event, context):
     """
     Lambda that acts as a proxy to SageMaker endpoints.
     """
@@ -47,7 +85,7 @@ def lambda_handler(event, context):
     # CORS headers
     headers = {
         "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Content-Type",
+        "Access-Control-Allow-Headers": "Content-Type,X-Profile,X-Session-Id",
         "Access-Control-Allow-Methods": "OPTIONS,POST",
     }
 
@@ -97,79 +135,62 @@ def lambda_handler(event, context):
 
             model_id = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-v2")
 
-            # Anthropic Claude 3 models use Messages API; Claude 2 uses prompt/completion.
-            if "claude-3" in model_id:
-                payload = {
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "system": SYSTEM_PROMPT,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": user_prompt}
-                            ],
-                        }
-                    ],
-                    "max_tokens": 800,
-                    "temperature": 0.3,
-                    "top_p": 0.9,
-                }
-            # Amazon Nova (converse/messages API)
-            elif "nova" in model_id or "amazon.nova" in model_id:
-                payload = {
-                    "system": [
-                        {"text": SYSTEM_PROMPT}
-                    ],
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {"text": user_prompt}
-                            ],
-                        }
-                    ],
-                    "inferenceConfig": {
-                        "maxTokens": 800,
-                        "temperature": 0.3,
-                        "topP": 0.9,
-                    },
-                }
-            else:
-                payload = {
-                    # Anthropic v2 format: after the system prompt, it must be followed by "\n\nHuman:" and then "\n\nAssistant:"
-                    "prompt": f"{SYSTEM_PROMPT}\n\nHuman: {user_prompt}\n\nAssistant:",
-                    "max_tokens_to_sample": 800,
-                    "temperature": 0.3,
-                    "top_p": 0.9,
+            # Server-side session (chat_sessions.py) when the client sends an id;
+            # otherwise the call is stateless, as before
+            session_id = (payload.get("session_id") or payload.get("sessionId")
+                          or _request_headers(event).get(chat_sessions.SESSION_HEADER))
+            if session_id is not None and not chat_sessions.valid_session_id(session_id):
+                return {
+                    "statusCode": 400,
+                    "headers": headers,
+                    "body": json.dumps({"error": "'session_id' must be 1-128 characters of [A-Za-z0-9_.:-]."}),
                 }
+            session = None
+            if session_id:
+                session = chat_store.get(session_id) or chat_sessions.new_session()
+                chat_sessions.trim(session)
+
+            payload = chat_sessions.build_payload(
+                model_id,
+                chat_sessions.system_prompt(SYSTEM_PROMPT, session),
+                session["turns"] if session else [],
+                user_prompt,
+            )
 
-            bedrock_body = json.dumps(payload)
-
+            started = time.perf_counter()
             response = bedrock_runtime.invoke_model(
                 modelId=model_id,
                 accept="application/json",
                 contentType="application/json",
-                body=bedrock_body,
+                body=json.dumps(payload),
             )
-
             result = json.loads(response["body"].read())
-            if "content" in result:  # Claude 3 Messages API
-                content = result.get("content") or []
-                # Take the first text block
-                text_blocks = [c.get("text", "") for c in content if c.get("type") == "text"]
-                reply = (text_blocks[0] if text_blocks else "").strip()
-            elif "output" in result and isinstance(result["output"], dict) and "message" in result["output"]:
-                # Amazon Nova responds with output.message.content
-                content = result["output"].get("message", {}).get("content") or []
-                text_blocks = [c.get("text", "") for c in content if c.get("text")]
-                reply = (text_blocks[0] if text_blocks else "").strip()
-            else:
-                reply = (result.get("completion") or "").strip()
+            latency_ms = round((time.perf_counter() - started) * 1000.0, 1)
+
+            reply = chat_sessions.parse_reply(result)
+            call_usage = {**chat_sessions.usage(result, response, payload, reply), "latency_ms": latency_ms}
+            if not reply:
+                # An empty assistant turn would make Bedrock reject every later
+                # call of the session, so nothing is recorded
+                print("BEDROCK_USAGE:", json.dumps({"model_id": model_id, "session": bool(session),
+                                                    "empty_reply": True, **call_usage}))
+                return {
+                    "statusCode": 502,
+                    "headers": headers,
+                    "body": json.dumps({"error": "The model returned an empty response; please try again."}),
+                }
+            response_body = {"response": reply, "usage": call_usage}
+            if session is not None:
+                chat_sessions.record(session, user_prompt, reply, call_usage)
+                chat_store.put(session_id, session)
+                response_body["session_id"] = session_id
+                call_usage["history_turns"] = len(session["turns"])
+            print("BEDROCK_USAGE:", json.dumps({"model_id": model_id, "session": bool(session), **call_usage}))
 
             return {
                 "statusCode": 200,
                 "headers": headers,
-                "body": json.dumps({"response": reply}),
+                "body": json.dumps(response_body),
             }
 
         # DEEPSEEK ROUTE IN SAGEMAKER (Marketplace)
@@ -222,7 +243,12 @@ def lambda_handler(event, context):
 
         endpoint_name = SAGEMAKER_ENDPOINTS[model_key]
 
+        # Sampled requests are mirrored to the shadow endpoint, if any (shadow.py);
+        # the shadow call runs in the background and is never awaited here
+        shadow_call = shadow.mirror(model_key, body)
+
         # 5) Invoke SageMaker
+        started = time.perf_counter()
         response = sagemaker_runtime.invoke_endpoint(
             EndpointName=endpoint_name,
             ContentType="application/json",
@@ -230,6 +256,7 @@ def lambda_handler(event, context):
         )
 
         result = response["Body"].read().decode("utf-8")
+        shadow.compare(model_key, shadow_call, result, (time.perf_counter() - started) * 1000.0)
 
         return {
             "statusCode": 200,
@@ -11,10 +11,42 @@ from PIL import Image
 
 # Importamos solo la clase del modelo Clásico
 from code.modelcnn import CNN
+from code.instrumentation import instrumented, stage
+from code.profiler import profiled
+from code.serialization import encode_probabilities, is_default
+from code.thread_planner import configure, finalize
 
 # Configuración del logger
 logger = logging.getLogger(__name__)
 
+# predict_fn acepta una imagen o una lista de imágenes; los servidores con
+# batching dinámico usan esta marca para agrupar peticiones concurrentes.
+ACCEPTS_INPUT_LIST = True
+
+# Clases de la salida, en el orden de las columnas de probabilidades
+DIGITS = list(range(10))
+
+# Lote representativo con el que thread_planner mide (o calibra) el plan de hilos
+PLAN_BATCH = 8
+
+def _load_state_dict(model_dir, device):
+    """
+    Lee los pesos de ``model.safetensors`` (mapeado en memoria, sin pickle) si
+    existe, como lo genera ``scripts/build_artifacts.py``; si no, ``model.pth``.
+    """
+    safetensors_path = os.path.join(model_dir, "model.safetensors")
+    if os.path.exists(safetensors_path):
+        from safetensors.torch import load_file
+
+        logger.info("Cargando pesos desde %s", safetensors_path)
+        return load_file(safetensors_path, device=str(device))
+
+    model_path = os.path.join(model_dir, "model.pth")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Archivo de modelo no encontrado en: {model_path}")
+    return torch.load(model_path, map_location=device)
+
+@instrumented("model_fn")
 def model_fn(model_dir):
     """
     Carga el modelo CLÁSICO (CNN) desde el directorio.
@@ -22,24 +54,31 @@ def model_fn(model_dir):
     logger.info("Iniciando la carga del modelo Clásico (CNN)...")
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     logger.info(f"Usando dispositivo: {device}")
+    # Hilos intra-op según núcleos disponibles y workers (thread_planner.py)
+    plan = configure(model_dir)
     
-    model_path = os.path.join(model_dir, "model.pth")
-    
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Archivo de modelo no encontrado en: {model_path}")
-
     model = CNN()
-    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.load_state_dict(_load_state_dict(model_dir, device))
     model.to(device).eval()
     
     logger.info("Modelo Clásico (CNN) cargado exitosamente.")
     
+    plan_batch = torch.randn(PLAN_BATCH, 1, 28, 28, generator=torch.Generator().manual_seed(1)).to(device)
+
+    def run_plan_batch():
+        with torch.no_grad():
+            model(plan_batch)
+
+    finalize(plan, run_plan_batch, items_per_call=PLAN_BATCH)
+
     model_info = {
         "model": model,
         "transform": get_transform_cnn()
     }
     return model_info
 
+@profiled("input_fn")
+@instrumented("input_fn")
 def input_fn(request_body, request_content_type):
     """
     Deserializa los datos de entrada. Espera un JSON con "input" en base64.
@@ -51,8 +90,10 @@ def input_fn(request_body, request_content_type):
         if not input_b64:
             raise ValueError("El JSON de entrada debe contener la clave 'input' con la imagen en base64")
 
-        image_data = base64.b64decode(input_b64)
-        image_pil = Image.open(BytesIO(image_data))
+        with stage("decode"):
+            image_data = base64.b64decode(input_b64)
+            image_pil = Image.open(BytesIO(image_data))
+            image_pil.load()  # decodifica aquí y no en el primer convert()
         
         # --- Pre-procesamiento robusto ---
         # Asegura que la imagen sea 28x28 y en escala de grises, como espera el modelo.
@@ -61,39 +102,48 @@ def input_fn(request_body, request_content_type):
     else:
         raise ValueError(f"Content-Type no soportado: {request_content_type}")
 
+@instrumented("predict_fn")
 def predict_fn(image, model_info):
     """
     Realiza la inferencia usando el modelo CNN cargado.
+
+    ``image`` puede ser una imagen PIL o una lista de ellas; en ambos casos
+    la salida tiene una fila por imagen.
     """
     model = model_info["model"]
     transform = model_info["transform"]
+    images = image if isinstance(image, list) else [image]
     
-    logger.info("Aplicando transformación y realizando predicción (Clásica)...")
-    input_tensor = transform(image).unsqueeze(0)
+    logger.info("Aplicando transformación y realizando predicción (Clásica) sobre %d imagen(es)...", len(images))
+    with stage("transform"):
+        input_tensor = torch.stack([transform(img) for img in images])
     
     device = next(model.parameters()).device
     input_tensor = input_tensor.to(device)
-    with torch.no_grad():
+    with stage("model"), torch.no_grad():
         prediction = model(input_tensor)
         
     return prediction
 
+@profiled("output_fn")
+@instrumented("output_fn")
 def output_fn(prediction, response_content_type):
     """
     Serializa el resultado. Aplica Softmax a los logits del CNN.
     """
     logger.info(f"Serializando salida para content-type: {response_content_type}")
-    if response_content_type == 'application/json':
-        probabilities = F.softmax(prediction[0], dim=0)
-        predicted_idx = torch.argmax(probabilities).item()
-
-        response = {
-            'predicted_class': predicted_idx,
-            'probabilities': [f"{p:.6f}" for p in probabilities.tolist()]
-        }
-        return json.dumps(response)
-    else:
-        raise ValueError(f"Content-Type no soportado: {response_content_type}")
+    if not is_default(response_content_type):
+        # Formatos compactos (top-k, matriz densa, npy, msgpack): todas las filas del lote
+        return encode_probabilities(F.softmax(prediction, dim=1).cpu().numpy(), DIGITS, response_content_type)
+    # is_default() ya rechaza los Content-Type no soportados
+    probabilities = F.softmax(prediction[0], dim=0)
+    predicted_idx = torch.argmax(probabilities).item()
+
+    response = {
+        'predicted_class': predicted_idx,
+        'probabilities': [f"{p:.6f}" for p in probabilities.tolist()]
+    }
+    return json.dumps(response)
 
 def get_transform_cnn():
     """Transformación para el modelo CNN, incluye normalización."""
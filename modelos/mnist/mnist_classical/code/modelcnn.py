@@ -1,15 +1,18 @@
+import os
+import threading
+
 import torch
 import torch.nn as nn
 import numpy as np
 
-# --- Importaciones Cuánticas ---
-# Asegúrate de que cuda-quantum esté instalado en el entorno de SageMaker
-# (puedes añadir 'cuda-quantum' a tu requirements.txt si es necesario)
-try:
-    import cudaq
-    from cudaq import spin
-except ImportError:
-    print("Advertencia: No se pudo importar cudaq. La parte cuántica del modelo no funcionará.")
+# --- Backend cuántico ---
+# cudaq ya no se importa aquí: el backend se construye en ``get_backend()``
+# (lo llama ``model_fn``), una sola vez por proceso.
+#   QUANTUM_BACKEND  "cudaq", "torch" (simulador exacto en PyTorch) o "auto"
+#                    (cudaq si está instalado; si no, torch)
+#   CUDAQ_TARGET     target de cudaq (p. ej. "qpp-cpu", "nvidia"); vacío = el de por defecto
+QUANTUM_BACKEND = os.environ.get("QUANTUM_BACKEND", "auto").lower()
+CUDAQ_TARGET = os.environ.get("CUDAQ_TARGET", "")
 
 # --- Modelo CNN Clásico (tomado de tu lambda_function.py) ---
 class CNN(nn.Module):
@@ -37,28 +40,77 @@ class CNN(nn.Module):
 
 # --- Modelo Híbrido Cuántico-Clásico (HQNN) - Extraído de red_hibrida.ipynb ---
 
-# 1. Definición del Kernel Cuántico y Hamiltoniano
-# Estos son globales para el módulo, ya que no dependen de la instancia de la clase.
+# 1. Backends: el circuito es RY(x_i) en cada qubit, una cadena de CNOT y el
+# observable sum(Z_i).  Ambos backends calculan el mismo valor esperado.
 n_qubits = 4
 
-try:
-    kernel, features = cudaq.make_kernel(list)
-    qubits = kernel.qalloc(n_qubits)
-
-    # Codificación de características con rotaciones RY
-    for i in range(n_qubits):
-        kernel.ry(features[i], qubits[i])
-
-    # Entrelazamiento con compuertas CNOT
-    for i in range(n_qubits - 1):
-        kernel.cx(qubits[i], qubits[i + 1])
-
-    # Define el observable a medir (Suma de operadores Z)
-    hamiltonian = sum(spin.z(i) for i in range(n_qubits))
-except (NameError, AttributeError):
-    # Si cudaq no se pudo importar, estas variables no se crearán.
-    # Esto permite que el archivo se importe en entornos sin cudaq, aunque no se pueda ejecutar.
-    kernel, hamiltonian = None, None
+class CudaqBackend:
+    """Kernel y Hamiltoniano de cudaq, construidos una sola vez."""
+    name = "cudaq"
+
+    def __init__(self, n_qubits: int = n_qubits, target: str = CUDAQ_TARGET):
+        import cudaq
+        from cudaq import spin
+
+        if target:
+            cudaq.set_target(target)
+        self.cudaq = cudaq
+        self.kernel, features = cudaq.make_kernel(list)
+        qubits = self.kernel.qalloc(n_qubits)
+
+        # Codificación de características con rotaciones RY
+        for i in range(n_qubits):
+            self.kernel.ry(features[i], qubits[i])
+
+        # Entrelazamiento con compuertas CNOT
+        for i in range(n_qubits - 1):
+            self.kernel.cx(qubits[i], qubits[i + 1])
+
+        # Define el observable a medir (Suma de operadores Z)
+        self.hamiltonian = sum(spin.z(i) for i in range(n_qubits))
+
+    def expectation(self, x: torch.Tensor) -> torch.Tensor:
+        """Valor esperado por fila; lanza todos los observe_async antes de esperar ninguno."""
+        futures = [self.cudaq.observe_async(self.kernel, self.hamiltonian, row) for row in x.tolist()]
+        values = [future.get().expectation() for future in futures]
+        return torch.tensor(values, device=x.device, dtype=x.dtype)
+
+class TorchBackend:
+    """
+    Simulador exacto en PyTorch, sin cudaq.
+
+    Desde |0...0>, RY(x_i) deja cada qubit en cos(x_i/2)|0> + sin(x_i/2)|1> y
+    la cadena de CNOT convierte el bit k en la paridad de los bits 0..k, así
+    que <Z_k> = prod_{i<=k} cos(x_i) y <H> = sum_k prod_{i<=k} cos(x_i).
+    Es diferenciable y vectorizado sobre el lote.
+    """
+    name = "torch"
+
+    def expectation(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.cumprod(torch.cos(x), dim=1).sum(dim=1)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend(kind: str = QUANTUM_BACKEND):
+    """Backend cuántico del proceso; se construye en la primera llamada."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if kind == "auto":
+                    try:
+                        _backend = CudaqBackend()
+                    except ImportError:
+                        print("Advertencia: cudaq no está instalado; se usa el simulador de PyTorch.")
+                        _backend = TorchBackend()
+                elif kind == "cudaq":
+                    _backend = CudaqBackend()
+                elif kind == "torch":
+                    _backend = TorchBackend()
+                else:
+                    raise ValueError(f"QUANTUM_BACKEND no soportado: {kind}")
+    return _backend
 
 # 2. Función de Autograd para la Capa Cuántica
 class QuantumFunction(torch.autograd.Function):
@@ -67,17 +119,8 @@ class QuantumFunction(torch.autograd.Function):
     @staticmethod
     def forward(ctx, x: torch.Tensor):
         """Pase hacia adelante: ejecuta el circuito cuántico."""
-        if kernel is None or hamiltonian is None:
-            raise RuntimeError("El kernel cuántico no está inicializado. ¿Se importó cudaq correctamente?")
-        
         ctx.save_for_backward(x)
-        exp_vals_list = []
-        for i in range(x.shape[0]):
-            result_future = cudaq.observe_async(kernel, hamiltonian, x[i])
-            exp_vals_list.append(result_future.get().expectation())
-        
-        output = torch.tensor(exp_vals_list, device=x.device, dtype=x.dtype).reshape(-1, 1)
-        return output
+        return get_backend().expectation(x).reshape(-1, 1)
 
     @staticmethod
     def backward(ctx, grad_output: torch.Tensor):
@@ -85,23 +128,17 @@ class QuantumFunction(torch.autograd.Function):
         x, = ctx.saved_tensors
         batch_size, n_params = x.shape
         gradients = torch.zeros_like(x)
+        backend = get_backend()
 
         for i in range(n_params):
             x_plus = x.clone()
             x_minus = x.clone()
             x_plus[:, i] += np.pi / 2.0
             x_minus[:, i] -= np.pi / 2.0
-            
-            exp_vals_plus_list = []
-            exp_vals_minus_list = []
-            for j in range(batch_size):
-                future_plus = cudaq.observe_async(kernel, hamiltonian, x_plus[j])
-                future_minus = cudaq.observe_async(kernel, hamiltonian, x_minus[j])
-                exp_vals_plus_list.append(future_plus.get().expectation())
-                exp_vals_minus_list.append(future_minus.get().expectation())
-            
-            exp_vals_plus = torch.tensor(exp_vals_plus_list, device=x.device, dtype=x.dtype)
-            exp_vals_minus = torch.tensor(exp_vals_minus_list, device=x.device, dtype=x.dtype)
+
+            # Un solo envío con ambos desplazamientos de todo el lote
+            shifted = backend.expectation(torch.cat([x_plus, x_minus]))
+            exp_vals_plus, exp_vals_minus = shifted[:batch_size], shifted[batch_size:]
             
             gradient_component = 0.5 * (exp_vals_plus - exp_vals_minus)
             gradients[:, i] = (gradient_component * grad_output).sum(dim=1)
@@ -112,6 +149,10 @@ class QuantumFunction(torch.autograd.Function):
 class QuantumLayer(nn.Module):
     """Capa que encapsula la función cuántica."""
     def forward(self, x: torch.Tensor) -> torch.Tensor:
+        backend = get_backend()
+        if isinstance(backend, TorchBackend):
+            # El simulador de PyTorch es diferenciable: autograd normal, sin parameter-shift
+            return backend.expectation(x).reshape(-1, 1)
         return QuantumFunction.apply(x)
 
 # 4. Clase del Modelo Híbrido (antes HybridCNN)
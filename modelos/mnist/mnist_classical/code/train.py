@@ -0,0 +1,228 @@
+"""
+Entrenamiento sin notebook de ``CNN`` y ``Hybrid_QNN`` (``modelcnn.py``).
+
+Reemplaza el bucle de ``modelos/code/red_hibrida.ipynb``: en lugar de
+decodificar cada imagen con PIL a través del ``Dataset`` de torchvision, MNIST
+se carga una sola vez como un tensor uint8 contiguo ``(N, 28, 28)`` (en
+memoria compartida, así que los workers del DataLoader no lo copian) y cada
+lote se normaliza al vuelo con la misma media/desviación que el handler.
+
+  - División entrenamiento/validación 80/20 con semilla fija, como el notebook.
+  - ``--workers`` procesos arman los lotes en paralelo (un índice por lote,
+    no por imagen).
+  - Al final de cada época se guarda ``checkpoint.pt`` (modelo, optimizador,
+    época, historial y estado del generador); ``--resume`` continúa desde ahí.
+  - Cada época informa pérdida, precisión de validación y throughput
+    (imágenes/s) y se añade a ``train_history.json``.
+  - ``model.pth`` es el state dict de la época con mejor precisión de
+    validación: lo carga ``model_fn`` sin cambios (``build_artifacts.py`` lo
+    convierte a safetensors al empaquetar).
+
+El modelo híbrido entrena con ``QUANTUM_BACKEND=torch`` por defecto: el
+simulador exacto es diferenciable y evita parameter-shift.
+
+Este archivo se copia idéntico en ``mnist_classical/code`` y
+``mnist_quantum/code``.
+
+Uso (desde el directorio del modelo, para que ``code`` sea este paquete):
+  cd modelos/mnist/mnist_classical && python -m code.train --model cnn
+  cd modelos/mnist/mnist_quantum && python -m code.train --model hybrid --epochs 10 --workers 4
+  python -m code.train --model cnn --resume
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List
+
+os.environ.setdefault("QUANTUM_BACKEND", "torch")
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+
+from code.modelcnn import CNN, Hybrid_QNN
+
+# Normalización de cada modelo: debe coincidir con get_transform_cnn /
+# get_transform_hqnn de su inference.py
+MODELS = {
+    "cnn": {"cls": CNN, "mean": 0.5, "std": 0.5},
+    "hybrid": {"cls": Hybrid_QNN, "mean": 0.1307, "std": 0.3081},
+}
+
+CHECKPOINT = "checkpoint.pt"
+HISTORY = "train_history.json"
+
+
+def load_mnist(root: str, train: bool) -> Dict[str, torch.Tensor]:
+    """Imágenes uint8 ``(N, 28, 28)`` y etiquetas de MNIST, sin pasar por PIL."""
+    import torchvision
+
+    dataset = torchvision.datasets.MNIST(root=root, train=train, download=True)
+    images = dataset.data.contiguous().share_memory_()
+    labels = dataset.targets.contiguous().share_memory_()
+    return {"images": images, "labels": labels}
+
+
+class BatchDataset(Dataset):
+    """Un elemento es un lote entero: ``indices`` → tensor normalizado y etiquetas."""
+
+    def __init__(self, images: torch.Tensor, labels: torch.Tensor, batches: List[torch.Tensor],
+                 mean: float, std: float):
+        self.images = images
+        self.labels = labels
+        self.batches = batches
+        self.mean = mean
+        self.std = std
+
+    def __len__(self) -> int:
+        return len(self.batches)
+
+    def __getitem__(self, i: int):
+        idx = self.batches[i]
+        # Igual que ToTensor() + Normalize((mean,), (std,))
+        x = self.images[idx].unsqueeze(1).float().div_(255.0).sub_(self.mean).div_(self.std)
+        return x, self.labels[idx]
+
+
+def batches_of(indices: torch.Tensor, batch_size: int) -> List[torch.Tensor]:
+    return list(torch.split(indices, batch_size))
+
+
+def loader(data: Dict[str, torch.Tensor], indices: torch.Tensor, args, spec, shuffle_seed=None) -> DataLoader:
+    if shuffle_seed is not None:
+        generator = torch.Generator().manual_seed(shuffle_seed)
+        indices = indices[torch.randperm(len(indices), generator=generator)]
+    dataset = BatchDataset(data["images"], data["labels"], batches_of(indices, args.batch_size),
+                           spec["mean"], spec["std"])
+    return DataLoader(dataset, batch_size=None, num_workers=args.workers,
+                      pin_memory=torch.cuda.is_available(),
+                      prefetch_factor=4 if args.workers else None)
+
+
+def evaluate(model: nn.Module, batches: Iterator, loss_fn, device) -> Dict[str, float]:
+    model.eval()
+    total, correct, loss = 0, 0, 0.0
+    with torch.no_grad():
+        for x, y in batches:
+            x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+            output = model(x)
+            loss += loss_fn(output, y).item() * len(y)
+            correct += (output.argmax(1) == y).sum().item()
+            total += len(y)
+    return {"loss": loss / total, "accuracy": correct / total}
+
+
+def _save_atomic(obj: Any, path: str) -> None:
+    tmp = f"{path}.tmp"
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=sorted(MODELS), required=True)
+    parser.add_argument("--data-dir", default=os.environ.get("MNIST_DATA_DIR", os.path.expanduser("~/.cache/mnist")),
+                        help="Dónde está (o se descarga) MNIST")
+    parser.add_argument("--output-dir", default=".",
+                        help="Destino de model.pth, checkpoint e historial (por defecto, el directorio del modelo)")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Procesos del DataLoader (0: en el proceso principal)")
+    parser.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0: el valor de PyTorch)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--resume", action="store_true", help=f"Continúa desde <output-dir>/{CHECKPOINT}")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    spec = MODELS[args.model]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    train_full = load_mnist(args.data_dir, train=True)
+    test = load_mnist(args.data_dir, train=False)
+    print(f"MNIST cargado en {time.perf_counter() - started:.1f} s: "
+          f"{len(train_full['labels'])} de entrenamiento, {len(test['labels'])} de prueba")
+
+    # División 80/20 fija por semilla (la misma en cada reanudación)
+    permutation = torch.randperm(len(train_full["labels"]), generator=torch.Generator().manual_seed(args.seed))
+    train_size = int(0.8 * len(permutation))
+    train_idx, val_idx = permutation[:train_size], permutation[train_size:]
+
+    model = spec["cls"]().to(device)
+    # Como en el notebook: CrossEntropyLoss sobre la salida del modelo (también
+    # la de Hybrid_QNN, que ya aplica softmax)
+    loss_fn = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+
+    checkpoint_path = os.path.join(args.output_dir, CHECKPOINT)
+    start_epoch, history, best_accuracy = 0, [], -1.0
+    if args.resume and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location=device)
+        if checkpoint["model_kind"] != args.model:
+            parser.error(f"{checkpoint_path} es de --model {checkpoint['model_kind']}")
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        start_epoch, history, best_accuracy = checkpoint["epoch"], checkpoint["history"], checkpoint["best_accuracy"]
+        torch.set_rng_state(checkpoint["rng_state"].cpu())
+        print(f"Reanudando desde la época {start_epoch} (mejor precisión de validación {best_accuracy:.4f})")
+
+    val_loader = loader(train_full, val_idx, args, spec)
+    for epoch in range(start_epoch, args.epochs):
+        model.train()
+        train_loader = loader(train_full, train_idx, args, spec, shuffle_seed=args.seed + epoch)
+        epoch_started = time.perf_counter()
+        seen, running_loss = 0, 0.0
+        for x, y in train_loader:
+            x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+            loss = loss_fn(model(x), y)
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * len(y)
+            seen += len(y)
+        train_seconds = time.perf_counter() - epoch_started
+        validation = evaluate(model, val_loader, loss_fn, device)
+
+        record = {
+            "epoch": epoch + 1,
+            "train_loss": round(running_loss / seen, 6),
+            "val_loss": round(validation["loss"], 6),
+            "val_accuracy": round(validation["accuracy"], 6),
+            "train_seconds": round(train_seconds, 2),
+            "images_per_s": round(seen / train_seconds, 1),
+        }
+        history.append(record)
+        print(json.dumps(record), flush=True)
+
+        if validation["accuracy"] > best_accuracy:
+            best_accuracy = validation["accuracy"]
+            _save_atomic(model.state_dict(), os.path.join(args.output_dir, "model.pth"))
+        _save_atomic({
+            "model_kind": args.model,
+            "model": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "epoch": epoch + 1,
+            "history": history,
+            "best_accuracy": best_accuracy,
+            "rng_state": torch.get_rng_state(),
+        }, checkpoint_path)
+        with open(os.path.join(args.output_dir, HISTORY), "w", encoding="utf-8") as fh:
+            json.dump({"model": args.model, "history": history}, fh, indent=2)
+
+    # Precisión de prueba de los pesos que quedan en model.pth
+    model.load_state_dict(torch.load(os.path.join(args.output_dir, "model.pth"), map_location=device,
+                                     weights_only=True))
+    result = evaluate(model, loader(test, torch.arange(len(test["labels"])), args, spec), loss_fn, device)
+    print(f"Prueba: precisión {result['accuracy']:.4f}, pérdida {result['loss']:.4f} "
+          f"(mejor validación {best_accuracy:.4f}); pesos en {os.path.join(args.output_dir, 'model.pth')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,43 @@ import json
 import logging
 import os
 import base64
+import time
 from io import BytesIO
 
+# Inicio de las importaciones pesadas, para el perfil de arranque de model_fn
+_IMPORT_STARTED = time.perf_counter()
+
 import torch
 import torchvision.transforms as transforms
 from PIL import Image
 
 # Importamos solo la clase del modelo Híbrido
-from code.modelcnn import Hybrid_QNN
+from code.modelcnn import Hybrid_QNN, get_backend
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+from code.instrumentation import instrumented, stage
+from code.profiler import profiled
+from code.serialization import encode_probabilities, is_default
+from code.thread_planner import configure, finalize
 
 # Configuración del logger
 logger = logging.getLogger(__name__)
 
+# predict_fn acepta una imagen o una lista de imágenes; los servidores con
+# batching dinámico usan esta marca para agrupar peticiones concurrentes.
+ACCEPTS_INPUT_LIST = True
+
+# Clases de la salida, en el orden de las columnas de probabilidades
+DIGITS = list(range(10))
+
+# Lote representativo con el que thread_planner mide (o calibra) el plan de hilos
+PLAN_BATCH = 8
+
+# Tamaños de lote del calentamiento en model_fn: el primer observe del backend
+# cuántico (JIT/compilación de cudaq) se paga aquí y no en la primera petición.
+# MNIST_WARMUP_BATCHES="" lo desactiva.
+WARMUP_BATCHES = [int(b) for b in os.environ.get("MNIST_WARMUP_BATCHES", "1,8").split(",") if b.strip()]
+
 # --- Transformaciones para la imagen de entrada ---
 def get_transform_hqnn():
     """
@@ -25,6 +50,26 @@ def get_transform_hqnn():
         transforms.Normalize((0.1307,), (0.3081,)) # Valores estándar para MNIST
     ])
 
+def _load_state_dict(model_dir, device):
+    """
+    Lee los pesos de ``model.safetensors`` (mapeado en memoria, sin pickle) si
+    existe, como lo genera ``scripts/build_artifacts.py``; si no, ``model.pth``.
+    """
+    safetensors_path = os.path.join(model_dir, "model.safetensors")
+    if os.path.exists(safetensors_path):
+        from safetensors.torch import load_file
+
+        logger.info("Cargando pesos desde %s", safetensors_path)
+        return load_file(safetensors_path, device=str(device))
+
+    model_path = os.path.join(model_dir, "model.pth")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Archivo de modelo no encontrado en: {model_path}")
+    # Usamos weights_only=True para mayor seguridad, como recomienda la advertencia de PyTorch.
+    # Esto asume que el archivo .pth solo contiene los pesos y no código arbitrario.
+    return torch.load(model_path, map_location=device, weights_only=True)
+
+@instrumented("model_fn")
 def model_fn(model_dir):
     """
     Carga el modelo HÍBRIDO (Hybrid_QNN) desde el directorio.
@@ -32,30 +77,58 @@ def model_fn(model_dir):
     logger.info("Iniciando la carga del modelo Híbrido (Hybrid_QNN)...")
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     logger.info(f"Usando dispositivo: {device}")
+    # Hilos intra-op según núcleos disponibles y workers (thread_planner.py)
+    plan = configure(model_dir)
+    phases = {"import": round(_IMPORT_SECONDS, 4)}
+
+    started = time.perf_counter()
+    backend = get_backend()
+    phases["backend"] = round(time.perf_counter() - started, 4)
+    logger.info("Backend cuántico: %s", backend.name)
     
     # --- IMPORTANTE ---
-    # El script espera 'model.pth'. Asegúrate de que tu archivo de pesos
-    # 'hybrid_cnn_mnist_weights_cpu_v2.0.pth' sea renombrado a 'model.pth'
-    # antes de crear el archivo tar.gz.
-    model_path = os.path.join(model_dir, "model.pth")
-    
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Archivo de modelo no encontrado en: {model_path}")
-
+    # El script espera 'model.pth' (o 'model.safetensors'). Asegúrate de que tu
+    # archivo de pesos 'hybrid_cnn_mnist_weights_cpu_v2.0.pth' sea renombrado a
+    # 'model.pth' antes de crear el archivo tar.gz.
+    started = time.perf_counter()
     model = Hybrid_QNN()
-    # Usamos weights_only=True para mayor seguridad, como recomienda la advertencia de PyTorch.
-    # Esto asume que el archivo .pth solo contiene los pesos y no código arbitrario.
-    model.load_state_dict(torch.load(model_path, map_location=device, weights_only=True))
+    model.load_state_dict(_load_state_dict(model_dir, device))
     model.to(device).eval()
+    phases["load"] = round(time.perf_counter() - started, 4)
     
     logger.info("Modelo Híbrido (Hybrid_QNN) cargado exitosamente.")
+
+    if WARMUP_BATCHES:
+        # Entradas con la escala de las imágenes normalizadas; semilla fija
+        generator = torch.Generator().manual_seed(0)
+        with torch.no_grad():
+            for batch_size in WARMUP_BATCHES:
+                batch = torch.randn(batch_size, 1, 28, 28, generator=generator).to(device)
+                started = time.perf_counter()
+                model(batch)
+                phases[f"warmup_b{batch_size}"] = round(time.perf_counter() - started, 4)
+            # Repetición del primer lote: latencia en régimen estable, para comparar
+            started = time.perf_counter()
+            model(torch.randn(WARMUP_BATCHES[0], 1, 28, 28, generator=generator).to(device))
+            phases["steady_state"] = round(time.perf_counter() - started, 4)
+    logger.info("Perfil de arranque: %s", json.dumps({"phases": phases, "backend": backend.name}))
     
+    plan_batch = torch.randn(PLAN_BATCH, 1, 28, 28, generator=torch.Generator().manual_seed(1)).to(device)
+
+    def run_plan_batch():
+        with torch.no_grad():
+            model(plan_batch)
+
+    finalize(plan, run_plan_batch, items_per_call=PLAN_BATCH)
+
     model_info = {
         "model": model,
         "transform": get_transform_hqnn()
     }
     return model_info
 
+@profiled("input_fn")
+@instrumented("input_fn")
 def input_fn(request_body, request_content_type):
     """
     Deserializa los datos de entrada. Espera un JSON con "input" en base64.
@@ -67,8 +140,10 @@ def input_fn(request_body, request_content_type):
         if not input_b64:
             raise ValueError("El JSON de entrada debe contener la clave 'input' con la imagen en base64")
 
-        image_data = base64.b64decode(input_b64)
-        image_pil = Image.open(BytesIO(image_data))
+        with stage("decode"):
+            image_data = base64.b64decode(input_b64)
+            image_pil = Image.open(BytesIO(image_data))
+            image_pil.load()  # decodifica aquí y no en el primer convert()
         
         # --- Pre-procesamiento robusto ---
         # 1. Convertir a escala de grises ('L' mode en PIL)
@@ -79,36 +154,47 @@ def input_fn(request_body, request_content_type):
     else:
         raise ValueError(f"Content-Type no soportado: {request_content_type}")
 
+@instrumented("predict_fn")
 def predict_fn(image, model_info):
     """
     Realiza la inferencia usando el modelo Hybrid_QNN cargado.
+
+    ``image`` puede ser una imagen PIL o una lista de ellas; en ambos casos
+    la salida tiene una fila por imagen.
     """
     model = model_info["model"]
     transform = model_info["transform"]
+    images = image if isinstance(image, list) else [image]
     
-    logger.info("Aplicando transformación y realizando predicción (Híbrida)...")
-    input_tensor = transform(image).unsqueeze(0)
+    logger.info("Aplicando transformación y realizando predicción (Híbrida) sobre %d imagen(es)...", len(images))
+    with stage("transform"):
+        input_tensor = torch.stack([transform(img) for img in images])
     
     device = next(model.parameters()).device
     input_tensor = input_tensor.to(device)
-    with torch.no_grad():
+    with stage("model"), torch.no_grad():
         prediction = model(input_tensor)
         
     return prediction
 
+@profiled("output_fn")
+@instrumented("output_fn")
 def output_fn(prediction, response_content_type):
     """
     Serializa el resultado. La salida del modelo ya son probabilidades.
     """
     logger.info(f"Serializando salida para content-type: {response_content_type}")
-    if response_content_type == 'application/json':
-        probabilities = prediction[0]
-        predicted_idx = torch.argmax(probabilities).item()
-
-        response = {
-            'predicted_class': predicted_idx,
-            'probabilities': [f"{p:.6f}" for p in probabilities.tolist()]
-        }
-        
-        # Devuelve la respuesta como una cadena JSON, como esperaría un endpoint real.
-        return json.dumps(response)
\ No newline at end of file
+    if not is_default(response_content_type):
+        # Formatos compactos (top-k, matriz densa, npy, msgpack): todas las filas del lote
+        return encode_probabilities(prediction.cpu().numpy(), DIGITS, response_content_type)
+    # is_default() ya rechaza los Content-Type no soportados
+    probabilities = prediction[0]
+    predicted_idx = torch.argmax(probabilities).item()
+
+    response = {
+        'predicted_class': predicted_idx,
+        'probabilities': [f"{p:.6f}" for p in probabilities.tolist()]
+    }
+    
+    # Devuelve la respuesta como una cadena JSON, como esperaría un endpoint real.
+    return json.dumps(response)
\ No newline at end of file
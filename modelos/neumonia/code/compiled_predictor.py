@@ -0,0 +1,213 @@
+"""
+Clasificador de neumonía compilado a NumPy puro.
+
+``export()`` (offline, requiere scikit-learn) vuelca un estimador ajustado a
+un ``.npz`` sin comprimir con arrays planos; ``load()`` lo lee sin importar
+scikit-learn ni joblib y devuelve un ``CompiledPredictor`` con la misma
+interfaz que usa ``inference.py`` (``classes_``, ``predict_proba``,
+``predict``) y la misma salida que el estimador original.
+
+Estimadores soportados:
+  - ``LogisticRegression`` (binaria, multinomial u OvR): coeficientes e
+    intercepto;
+  - ``DecisionTreeClassifier``, ``RandomForestClassifier`` y
+    ``ExtraTreesClassifier``: los nodos de todos los árboles concatenados
+    (hijos, característica, umbral y probabilidades de cada hoja);
+  - cualquiera de los anteriores tras uno o varios ``StandardScaler`` en un
+    ``Pipeline`` (se funden en una sola media y escala).
+
+Lo genera ``scripts/compile_predictor.py``, que además comprueba la paridad
+con el estimador original sobre las características de entrenamiento.  El
+``.npz`` guarda el sha256 del ``model.joblib`` del que salió
+(``source_sha256``): ``model_fn`` no sirve un ``model.npz`` que no corresponda
+al ``model.joblib`` que lo acompaña.
+"""
+
+import hashlib
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def _expit(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class CompiledPredictor:
+    """``predict_proba``/``predict`` de un estimador exportado con ``export()``."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.kind = str(arrays["kind"])
+        self.classes_ = arrays["classes"]
+        self.feature_names_in_ = arrays["feature_names"]
+        self.scaler_mean = arrays.get("scaler_mean")
+        self.scaler_scale = arrays.get("scaler_scale")
+        self.source_sha256 = str(arrays["source_sha256"]) if "source_sha256" in arrays else None
+        if self.kind == "linear":
+            self.coef = arrays["coef"]
+            self.intercept = arrays["intercept"]
+            self.multi_class = str(arrays["multi_class"])
+        elif self.kind == "trees":
+            self.left = arrays["left"]
+            self.right = arrays["right"]
+            self.feature = arrays["feature"]
+            self.threshold = arrays["threshold"]
+            self.leaf_proba = arrays["leaf_proba"]
+            self.roots = arrays["roots"]
+        else:
+            raise ValueError(f"Tipo de predictor compilado desconocido: {self.kind}")
+
+    def _prepare(self, X: Any) -> np.ndarray:
+        if hasattr(X, "columns"):
+            X = X[list(self.feature_names_in_)]
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if self.scaler_mean is not None:
+            X = (X - self.scaler_mean) / self.scaler_scale
+        return X
+
+    def _linear_proba(self, X: np.ndarray) -> np.ndarray:
+        scores = X @ self.coef.T + self.intercept
+        if self.multi_class == "ovr":
+            if scores.shape[1] == 1:
+                positive = _expit(scores[:, 0])
+                return np.column_stack([1.0 - positive, positive])
+            proba = _expit(scores)
+            return proba / proba.sum(axis=1, keepdims=True)
+        if scores.shape[1] == 1:
+            # multinomial binaria: softmax sobre (-z, z), como scikit-learn
+            scores = np.column_stack([-scores[:, 0], scores[:, 0]])
+        scores = scores - scores.max(axis=1, keepdims=True)
+        proba = np.exp(scores)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def _trees_proba(self, X: np.ndarray) -> np.ndarray:
+        # scikit-learn recorre los árboles con X en float32
+        X = X.astype(np.float32).astype(np.float64)
+        rows = np.arange(X.shape[0])
+        total = np.zeros((X.shape[0], self.leaf_proba.shape[1]))
+        for root in self.roots:
+            node = np.full(X.shape[0], root, dtype=np.int64)
+            while True:
+                internal = self.left[node] != -1
+                if not internal.any():
+                    break
+                go_left = X[rows, self.feature[node]] <= self.threshold[node]
+                node = np.where(internal, np.where(go_left, self.left[node], self.right[node]), node)
+            total += self.leaf_proba[node]
+        return total / len(self.roots)
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        X = self._prepare(X)
+        if self.kind == "linear":
+            return self._linear_proba(X)
+        return self._trees_proba(X)
+
+    def predict(self, X: Any) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load(path: str) -> CompiledPredictor:
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files}
+    if int(arrays.get("format_version", 0)) != FORMAT_VERSION:
+        raise ValueError(f"Versión de formato no soportada en {path}")
+    return CompiledPredictor(arrays)
+
+
+def _tree_arrays(trees) -> Dict[str, np.ndarray]:
+    """Concatena los nodos de varios árboles, con los índices de hijos desplazados."""
+    left, right, feature, threshold, leaf_proba, roots = [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        t = tree.tree_
+        is_leaf = t.children_left == -1
+        left.append(np.where(is_leaf, -1, t.children_left + offset))
+        right.append(np.where(is_leaf, -1, t.children_right + offset))
+        feature.append(np.where(is_leaf, 0, t.feature))
+        threshold.append(t.threshold)
+        # Igual que DecisionTreeClassifier.predict_proba: el valor de la hoja normalizado
+        value = t.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        leaf_proba.append(value / normalizer)
+        roots.append(offset)
+        offset += t.node_count
+    return {
+        "left": np.concatenate(left).astype(np.int64),
+        "right": np.concatenate(right).astype(np.int64),
+        "feature": np.concatenate(feature).astype(np.int64),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "leaf_proba": np.concatenate(leaf_proba),
+        "roots": np.asarray(roots, dtype=np.int64),
+    }
+
+
+def export(estimator: Any, path: str, feature_names, source_sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Vuelca ``estimator`` (ajustado) a ``path``; devuelve un resumen de lo exportado.
+
+    ``source_sha256`` es el hash del ``model.joblib`` de origen (``file_sha256``).
+    """
+    from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.tree import DecisionTreeClassifier
+
+    arrays: Dict[str, Any] = {"format_version": np.asarray(FORMAT_VERSION)}
+    if isinstance(estimator, Pipeline):
+        *preprocessing, (_, final) = estimator.steps
+        for name, step in preprocessing:
+            if not isinstance(step, StandardScaler):
+                raise ValueError(f"Paso de Pipeline no soportado: {name} ({type(step).__name__})")
+            mean = step.mean_ if step.with_mean else np.zeros(step.n_features_in_)
+            scale = step.scale_ if step.with_std else np.ones(step.n_features_in_)
+            if "scaler_mean" in arrays:
+                # ((x - m1) / s1 - m2) / s2 == (x - (m1 + m2 * s1)) / (s1 * s2)
+                previous_mean, previous_scale = arrays["scaler_mean"], arrays["scaler_scale"]
+                arrays["scaler_mean"] = previous_mean + mean * previous_scale
+                arrays["scaler_scale"] = previous_scale * scale
+            else:
+                arrays["scaler_mean"], arrays["scaler_scale"] = mean, scale
+        estimator = final
+
+    if isinstance(estimator, LogisticRegression):
+        # Misma regla que LogisticRegression.predict_proba para elegir OvR o softmax
+        multi_class = getattr(estimator, "multi_class", "auto")
+        ovr = multi_class in ("ovr", "warn") or (multi_class in ("auto", "deprecated") and (
+            len(estimator.classes_) <= 2 or estimator.solver == "liblinear"))
+        arrays.update(kind=np.asarray("linear"), coef=estimator.coef_.astype(np.float64),
+                      intercept=estimator.intercept_.astype(np.float64),
+                      multi_class=np.asarray("ovr" if ovr else "multinomial"))
+        summary = {"kind": "linear", "estimator": type(estimator).__name__}
+    elif isinstance(estimator, DecisionTreeClassifier):
+        arrays.update(kind=np.asarray("trees"), **_tree_arrays([estimator]))
+        summary = {"kind": "trees", "estimator": type(estimator).__name__, "trees": 1}
+    elif isinstance(estimator, (RandomForestClassifier, ExtraTreesClassifier)):
+        arrays.update(kind=np.asarray("trees"), **_tree_arrays(estimator.estimators_))
+        summary = {"kind": "trees", "estimator": type(estimator).__name__, "trees": len(estimator.estimators_)}
+    else:
+        raise ValueError(f"Estimador no soportado: {type(estimator).__name__}")
+
+    fitted_names = getattr(estimator, "feature_names_in_", None)
+    if fitted_names is not None and list(fitted_names) != list(feature_names):
+        raise ValueError(f"Columnas del estimador {list(fitted_names)} != {list(feature_names)}")
+    arrays["classes"] = np.asarray(estimator.classes_)
+    arrays["feature_names"] = np.asarray(list(feature_names))
+    if source_sha256:
+        arrays["source_sha256"] = np.asarray(source_sha256)
+        summary["source_sha256"] = source_sha256
+    np.savez(path, **arrays)
+    return summary
@@ -0,0 +1,131 @@
+"""
+Caché persistente de características para el pipeline de neumonía.
+
+Las características (``FEATURE_COLUMNS``) dependen solo de los bytes de la
+imagen y de los parámetros de preprocesado, no del clasificador, así que se
+guardan por ``sha256(imagen)`` + versión de preprocesado.  Reenviar el mismo
+estudio, o volver a puntuar un archivo completo con un ``model.joblib``
+reentrenado, se salta la decodificación, ``procesar_imagen`` y
+``extract_features``.
+
+El almacén es un SQLite (una fila de ~160 bytes por imagen: clave binaria y
+el vector float64) en modo WAL, de modo que varios workers o procesos de
+``batch_transform.py`` pueden compartir el mismo archivo.  Cuando supera el
+tamaño máximo se expulsan las entradas usadas hace más tiempo (LRU).
+
+Variables de entorno (las lee ``inference.py``):
+  NEUMONIA_FEATURE_CACHE     ruta del archivo SQLite (vacío: caché apagada)
+  NEUMONIA_FEATURE_CACHE_MB  tamaño máximo aproximado en MiB (64)
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tamaño estimado de una fila en disco (clave, vector, marca de uso e índices)
+ROW_BYTES = 160
+# Parámetros por consulta (SQLite antiguo limita a 999)
+QUERY_CHUNK = 500
+# Al expulsar se deja la tabla en esta fracción del máximo, para no expulsar en cada escritura
+EVICT_TO = 0.9
+
+
+class FeatureCache:
+    """Vectores de características por imagen, en un SQLite acotado por tamaño."""
+
+    def __init__(self, path: str, version: str, columns: Sequence[str], max_mb: float = 64.0):
+        self.path = path
+        self.version = version.encode("utf-8")
+        self.columns = list(columns)
+        self.max_entries = max(1, int(max_mb * 1024 * 1024 / ROW_BYTES))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._connection()
+        # COUNT(*) recorre la tabla: solo se comprueba el tamaño cada 1 % de escrituras
+        self._check_every = max(1, self.max_entries // 100)
+        self._writes = self._check_every
+        self.hits = 0
+        self.misses = 0
+        logger.info("Caché de características en %s (versión %s, máx. %d entradas)",
+                    path, version, self.max_entries)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión de este proceso; tras un fork (``serve_local.py --preload``) se abre otra."""
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS features ("
+                " key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS features_last_used ON features (last_used)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def key(self, image_bytes: bytes) -> bytes:
+        """Clave de una imagen: sha256 de sus bytes y de la versión de preprocesado."""
+        return hashlib.sha256(self.version + b"\0" + image_bytes).digest()
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[Dict[str, float]]]:
+        """Características de cada clave, o ``None`` si no está en la caché."""
+        rows: Dict[bytes, bytes] = {}
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), QUERY_CHUNK):
+                chunk = list(keys[start:start + QUERY_CHUNK])
+                placeholders = ",".join("?" * len(chunk))
+                chunk_rows = dict(conn.execute(
+                    f"SELECT key, vector FROM features WHERE key IN ({placeholders})", chunk))
+                if chunk_rows:
+                    conn.execute(f"UPDATE features SET last_used = ? WHERE key IN ({','.join('?' * len(chunk_rows))})",
+                                 [now, *chunk_rows])
+                rows.update(chunk_rows)
+        found = [self._decode(rows[k]) if k in rows else None for k in keys]
+        hits = sum(f is not None for f in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, Dict[str, float]]]) -> None:
+        now = time.time()
+        rows = [(key, self._encode(feats), now) for key, feats in items]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO features VALUES (?, ?, ?)", rows)
+            conn.execute("COMMIT")
+            self._writes += len(rows)
+            if self._writes >= self._check_every:
+                self._writes = 0
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        count = conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * EVICT_TO)
+        conn.execute(
+            "DELETE FROM features WHERE key IN (SELECT key FROM features ORDER BY last_used LIMIT ?)", (excess,))
+        logger.info("Caché de características: %d entradas expulsadas", excess)
+
+    def _encode(self, feats: Dict[str, float]) -> bytes:
+        return np.array([feats.get(c, 0.0) for c in self.columns], dtype=np.float64).tobytes()
+
+    def _decode(self, blob: bytes) -> Dict[str, float]:
+        return dict(zip(self.columns, np.frombuffer(blob, dtype=np.float64).tolist()))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,14 +1,54 @@
-import os, io, json, base64
+import os, io, json, base64, hashlib, logging, threading, zipfile
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from typing import Dict, NamedTuple, Optional
 import numpy as np
 import pandas as pd
 import cv2
-import joblib
 from skimage.measure import label, regionprops
 from skimage import morphology
 
+from instrumentation import instrumented, stage
+from profiler import profiled
+from serialization import encode_probabilities, is_default
+from feature_cache import FeatureCache
+from compiled_predictor import CompiledPredictor, file_sha256, load as load_compiled
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
 # Limita el tamaño máximo del lado mayor para controlar memoria/latencia
 MAX_SIDE = 512
 
+# Varias radiografías por petición: lista JSON ("images"), multipart/form-data
+# o zip.  Decodificar y preprocesar con OpenCV/NumPy libera el GIL, así que cada
+# imagen va a un pool de hilos; las características se clasifican juntas.
+ACCEPTS_INPUT_LIST = True
+MAX_IMAGES = int(os.environ.get("NEUMONIA_MAX_IMAGES", "64"))
+THREADS = int(os.environ.get("NEUMONIA_THREADS", "0")) or (os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Caché de características por imagen (feature_cache.py); la clave incluye la
+# versión de preprocesado, no el clasificador.  Sube FEATURES_VERSION al cambiar
+# procesar_imagen/extract_features de forma que cambien sus resultados.
+FEATURE_CACHE_PATH = os.environ.get("NEUMONIA_FEATURE_CACHE", "")
+FEATURE_CACHE_MB = float(os.environ.get("NEUMONIA_FEATURE_CACHE_MB", "64"))
+FEATURES_VERSION = 1
+
+_feature_cache = None
+
+# model.npz (scripts/compile_predictor.py) es el mismo clasificador en NumPy
+# puro: se carga sin scikit-learn ni joblib.  auto: model.npz si existe y si no
+# model.joblib; compiled / joblib fuerzan uno de los dos.  Si junto al npz hay
+# un model.joblib distinto del que se compiló (se reentrenó sin recompilar),
+# auto usa el joblib y compiled falla.
+MODEL_FORMAT = os.environ.get("NEUMONIA_MODEL_FORMAT", "auto").lower()
+
+# Clase del modelo → etiqueta; el orden de ``proba`` es el de estas clases
+LABELS = {0: "normal", 1: "neumonia", 2: "neumonia_viral", 3: "neumonia_bacteriana"}
+
 FEATURE_COLUMNS = ['hu0','hu1','hu2','hu3','hist_mean','hist_std','hist_kurtosis',
                    'fourier_mean','fourier_std','area']
 
@@ -68,25 +108,64 @@ def extract_features(img):
     feats["area"] = round_to_sig_figs(area, 6)
     return feats
 
-def _prepare_dataframe(feats):
-    data = {k: [feats.get(k, 0.0)] for k in FEATURE_COLUMNS}
+def preprocessing_version():
+    """Huella de todo lo que determina las características de una imagen."""
+    params = {"version": FEATURES_VERSION, "max_side": MAX_SIDE, "columns": FEATURE_COLUMNS,
+              "procesar_imagen": procesar_imagen.__defaults__, "adjust_image": adjust_image.__defaults__}
+    return hashlib.sha256(json.dumps(params).encode("utf-8")).hexdigest()[:16]
+
+class Study(NamedTuple):
+    """Imagen de entrada con caché activa: o sus píxeles o sus características ya calculadas."""
+    key: bytes
+    image: Optional[np.ndarray]
+    features: Optional[Dict[str, float]]
+
+def _prepare_dataframe(feats_list):
+    # Una fila por imagen, con las columnas en el orden de entrenamiento
+    data = {k: [feats.get(k, 0.0) for feats in feats_list] for k in FEATURE_COLUMNS}
     return pd.DataFrame(data)
 
+def _prepare_matrix(feats_list):
+    # Igual que _prepare_dataframe, sin DataFrame: para el predictor compilado
+    return np.array([[feats.get(k, 0.0) for k in FEATURE_COLUMNS] for feats in feats_list], dtype=np.float64)
+
+@instrumented("model_fn")
 def model_fn(model_dir):
-    return joblib.load(os.path.join(model_dir, "model.joblib"))
+    global _feature_cache
+    if FEATURE_CACHE_PATH and _feature_cache is None:
+        _feature_cache = FeatureCache(FEATURE_CACHE_PATH, preprocessing_version(), FEATURE_COLUMNS,
+                                      max_mb=FEATURE_CACHE_MB)
+    if MODEL_FORMAT not in ("auto", "compiled", "joblib"):
+        raise ValueError(f"NEUMONIA_MODEL_FORMAT no soportado: {MODEL_FORMAT}")
+    compiled_path = os.path.join(model_dir, "model.npz")
+    joblib_path = os.path.join(model_dir, "model.joblib")
+    if MODEL_FORMAT == "compiled" or (MODEL_FORMAT == "auto" and os.path.isfile(compiled_path)):
+        compiled = load_compiled(compiled_path)
+        if not os.path.isfile(joblib_path) or compiled.source_sha256 == file_sha256(joblib_path):
+            return compiled
+        message = (f"{compiled_path} no se compiló a partir de {joblib_path} "
+                   "(¿se reentrenó sin correr scripts/compile_predictor.py?)")
+        if MODEL_FORMAT == "compiled":
+            raise ValueError(message)
+        logger.warning("%s; se usa model.joblib", message)
+    import joblib
 
-def input_fn(request_body, request_content_type):
-    if request_content_type == "application/json":
-        payload = json.loads(request_body)
-        img_b64 = payload.get("image")
-        if img_b64 is None:
-            raise ValueError("JSON debe traer key 'image' en base64.")
-        image_bytes = base64.b64decode(img_b64)
-    elif request_content_type == "image/jpeg":
-        image_bytes = request_body
-    else:
-        raise ValueError(f"Content-Type no soportado: {request_content_type}")
+    # mmap_mode: con un joblib sin comprimir (scripts/build_artifacts.py) los
+    # arrays de NumPy se mapean en memoria en lugar de copiarse
+    return joblib.load(joblib_path, mmap_mode="r")
 
+def _map(func, items):
+    """``map`` sobre el pool de hilos; con una sola imagen corre en el hilo actual."""
+    global _pool
+    if len(items) <= 1 or THREADS == 1:
+        return [func(item) for item in items]
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="neumonia")
+    return list(_pool.map(func, items))
+
+def _decode(image_bytes):
     img_array = np.frombuffer(image_bytes, dtype=np.uint8)
     img = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
     if img is None:
@@ -97,20 +176,142 @@ def input_fn(request_body, request_content_type):
     if max_side > MAX_SIDE:
         scale = MAX_SIDE / max_side
         new_size = (int(w * scale), int(h * scale))
-        img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+        with stage("resize"):
+            img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
     return img
 
+def _load(batch):
+    """Decodifica las imágenes; con caché, solo las que no tienen características guardadas."""
+    if _feature_cache is None:
+        return _map(_decode, batch)
+    keys = [_feature_cache.key(image_bytes) for image_bytes in batch]
+    cached = _feature_cache.get_many(keys)
+    missing = [i for i, feats in enumerate(cached) if feats is None]
+    decoded = dict(zip(missing, _map(_decode, [batch[i] for i in missing])))
+    return [Study(key, decoded.get(i), feats) for i, (key, feats) in enumerate(zip(keys, cached))]
+
+def _multipart_images(body, content_type):
+    """Cuerpos de las partes de un multipart/form-data (el boundary viene en el Content-Type)."""
+    header = f"Content-Type: {content_type}\r\n\r\n".encode("latin-1")
+    message = BytesParser().parsebytes(header + body)
+    if not message.is_multipart():
+        raise ValueError("Cuerpo multipart sin partes o sin boundary.")
+    return [part.get_payload(decode=True) for part in message.get_payload()]
+
+def _zip_images(body):
+    """Archivos de un zip en orden alfabético, sin directorios ni metadatos de macOS."""
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        names = sorted(n for n in archive.namelist()
+                       if not n.endswith("/") and not n.startswith("__MACOSX/")
+                       and not os.path.basename(n).startswith("."))
+        return [archive.read(n) for n in names]
+
+@profiled("input_fn")
+@instrumented("input_fn")
+def input_fn(request_body, request_content_type):
+    """
+    Devuelve una imagen (array en escala de grises) o una lista de imágenes.
+
+    Una imagen: JSON ``{"image": base64}`` o el JPEG/PNG como cuerpo.  Varias:
+    JSON ``{"images": [base64, ...]}``, multipart/form-data (una imagen por
+    parte) o un zip (``application/zip``), hasta NEUMONIA_MAX_IMAGES.  Con
+    NEUMONIA_FEATURE_CACHE cada imagen es un ``Study`` y las que ya están en la
+    caché no se decodifican.
+    """
+    media_type = (request_content_type or "").split(";")[0].strip().lower()
+    if media_type == "application/json":
+        payload = json.loads(request_body)
+        images_b64 = payload.get("images", payload.get("image"))
+        if images_b64 is None:
+            raise ValueError("JSON debe traer key 'image' (o 'images') en base64.")
+        if isinstance(images_b64, list):
+            batch = [base64.b64decode(b) for b in images_b64]
+        else:
+            batch, image_bytes = None, base64.b64decode(images_b64)
+    elif media_type in ("image/jpeg", "image/png"):
+        batch, image_bytes = None, request_body
+    elif media_type == "multipart/form-data":
+        batch = _multipart_images(request_body, request_content_type)
+    elif media_type in ("application/zip", "application/x-zip-compressed"):
+        batch = _zip_images(request_body)
+    else:
+        raise ValueError(f"Content-Type no soportado: {request_content_type}")
+
+    if batch is None:
+        with stage("decode"):
+            return _load([image_bytes])[0]
+    if not batch:
+        raise ValueError("La petición no trae imágenes.")
+    if len(batch) > MAX_IMAGES:
+        raise ValueError(f"Demasiadas imágenes en una petición ({len(batch)} > {MAX_IMAGES}).")
+    with stage("decode"):
+        return _load(batch)
+
+def _features(img):
+    if isinstance(img, Study):
+        img = img.image
+    with stage("procesar_imagen"):
+        img_proc = procesar_imagen(img)
+    with stage("extract_features"):
+        return extract_features(img_proc)
+
+@instrumented("predict_fn")
 def predict_fn(input_data, model):
-    img_proc = procesar_imagen(input_data)
-    feats = extract_features(img_proc)
-    df = _prepare_dataframe(feats)
-    pred = model.predict(df)[0]
-    proba = model.predict_proba(df)[0] if hasattr(model, "predict_proba") else None
-    return {"prediction": int(pred),
-            "label": {0: "normal", 1: "neumonia", 2: "neumonia_viral", 3: "neumonia_bacteriana"}.get(int(pred), "desconocido"),
-            "proba": proba.tolist() if proba is not None else None}
+    """
+    Clasifica una imagen o una lista de imágenes.
+
+    Las características de todas las imágenes van en un único DataFrame y una
+    sola llamada al modelo; con una lista devuelve una lista de resultados en
+    el mismo orden.  Cada resultado lleva ``classes`` (``model.classes_``, el
+    orden de ``proba``) para los formatos compactos de ``output_fn``.
+    """
+    images = input_data if isinstance(input_data, list) else [input_data]
+    with stage("features"):
+        feats = [img.features if isinstance(img, Study) else None for img in images]
+        pending = [i for i, f in enumerate(feats) if f is None]
+        for i, f in zip(pending, _map(_features, [images[i] for i in pending])):
+            feats[i] = f
+        if _feature_cache is not None:
+            _feature_cache.put_many((images[i].key, feats[i]) for i in pending if isinstance(images[i], Study))
+        if isinstance(model, CompiledPredictor):
+            df = _prepare_matrix(feats)
+        else:
+            df = _prepare_dataframe(feats)
+    with stage("model"):
+        if isinstance(model, CompiledPredictor):
+            # Su predict es la clase de mayor probabilidad: basta con una llamada
+            probas = model.predict_proba(df)
+            preds = model.classes_[probas.argmax(axis=1)]
+        else:
+            # predict y el argmax de predict_proba no coinciden en todos los
+            # estimadores (p. ej. SVC(probability=True)): se usa predict
+            preds = model.predict(df)
+            probas = model.predict_proba(df) if hasattr(model, "predict_proba") else None
+    classes = [int(c) for c in model.classes_] if hasattr(model, "classes_") else None
+    results = [{"prediction": int(pred),
+                "label": LABELS.get(int(pred), "desconocido"),
+                "proba": probas[i].tolist() if probas is not None else None,
+                "classes": classes}
+               for i, pred in enumerate(preds)]
+    return results if isinstance(input_data, list) else results[0]
 
+@profiled("output_fn")
+@instrumented("output_fn")
 def output_fn(prediction, content_type):
-    if content_type == "application/json":
-        return json.dumps(prediction)
-    return json.dumps(prediction)
+    try:
+        default = is_default(content_type)
+    except ValueError:
+        default = True  # como antes: cualquier otro Accept recibe el JSON de siempre
+    if default:
+        # ``classes`` solo sirve a los formatos compactos; el JSON no cambia
+        if isinstance(prediction, list):
+            return json.dumps({"predictions": [{k: v for k, v in r.items() if k != "classes"} for r in prediction]})
+        return json.dumps({k: v for k, v in prediction.items() if k != "classes"})
+
+    # Formatos compactos (serialization.py): matriz de probabilidades por imagen
+    results = prediction if isinstance(prediction, list) else [prediction]
+    probas = [r["proba"] for r in results]
+    if any(p is None for p in probas):
+        raise ValueError("El modelo no expone predict_proba; solo está disponible application/json.")
+    classes = [LABELS.get(c, str(c)) for c in results[0]["classes"]]
+    return encode_probabilities(probas, classes, content_type, labels=[r["label"] for r in results])
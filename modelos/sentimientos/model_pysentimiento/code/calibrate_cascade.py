@@ -0,0 +1,170 @@
+"""
+Calibra offline el umbral de margen de la cascada SVM → transformer.
+
+Clasifica un conjunto de textos con el transformer (referencia) y con un
+LinearSVC empaquetado (``svm_countvectorizer`` o ``svm_tfidfvectorizer``), y
+elige el menor umbral de margen tal que, escalando al transformer los textos
+con margen menor al umbral, la concordancia con el transformer alcance el
+objetivo.  Copia el SVM a ``<model-dir>/cascade/`` junto a ``cascade.json``.
+
+Uso:
+  python modelos/sentimientos/model_pysentimiento/code/calibrate_cascade.py \
+    --model-dir modelos/sentimientos/model_pysentimiento \
+    --svm-dir modelos/sentimientos/svm_tfidfvectorizer \
+    --texts resenas.jsonl --target-agreement 0.97
+
+``--texts`` acepta un .txt (un texto por línea) o un .jsonl con claves
+``text``/``input`` y, opcionalmente, ``label`` para reportar exactitud.
+"""
+
+import argparse
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from transformers import AutoConfig, AutoTokenizer
+
+from inference import (
+    CASCADE_CONFIG_FILE,
+    CASCADE_DIR,
+    ENGINE,
+    _build_results,
+    _load_onnx_session,
+    _load_torch_model,
+    _predict_probabilities,
+    _svm_scores,
+)
+
+
+def load_labeled_texts(path: str) -> Tuple[List[str], List[Optional[str]]]:
+    """Lee textos y etiquetas opcionales (``None`` si el registro no trae ``label``)."""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                texts.append(str(record.get("text") or record.get("input") or ""))
+                label = record.get("label")
+                labels.append(str(label).upper() if label is not None else None)
+            else:
+                texts.append(line)
+                labels.append(None)
+    return texts, labels
+
+
+def transformer_labels(model_dir: str, texts: List[str], batch_size: int) -> np.ndarray:
+    """Etiquetas del transformer con el mismo motor que sirve el handler (SENTIMENT_ENGINE)."""
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    if ENGINE == "onnx":
+        model_info = {"tokenizer": tokenizer, "engine": "onnx", "session": _load_onnx_session(model_dir),
+                      "id2label": AutoConfig.from_pretrained(model_dir).id2label}
+    else:
+        model = _load_torch_model(model_dir)
+        model_info = {"tokenizer": tokenizer, "engine": "torch", "model": model,
+                      "id2label": model.config.id2label}
+
+    labels = []
+    for start in range(0, len(texts), batch_size):
+        probabilities = _predict_probabilities(texts[start:start + batch_size], model_info)
+        labels.extend(r["label"] for r in _build_results(probabilities, model_info["id2label"]))
+    return np.asarray(labels)
+
+
+def choose_threshold(margins: np.ndarray, agrees: np.ndarray, target: float) -> float:
+    """
+    Menor umbral cuya concordancia esperada con el transformer alcanza ``target``.
+
+    Escalar los ``k`` textos de menor margen fija su concordancia en 1; el
+    resto conserva la del SVM.  Se recorre ``k`` creciente y se devuelve el
+    punto medio entre el último margen escalado y el primero que no.
+    """
+    order = np.argsort(margins, kind="stable")
+    sorted_margins = margins[order]
+    sorted_agrees = agrees[order].astype(np.int64)
+    n = len(margins)
+    # suffix[k] = aciertos del SVM entre los textos que quedan si se escalan los k primeros
+    suffix = np.concatenate([np.cumsum(sorted_agrees[::-1])[::-1], [0]])
+    for k in range(n + 1):
+        if (k + suffix[k]) / n >= target:
+            break
+    if k == 0:
+        return 0.0
+    if k == n:
+        return float(sorted_margins[-1]) + 1e-6
+    return float((sorted_margins[k - 1] + sorted_margins[k]) / 2.0)
+
+
+def evaluate(threshold: float, margins: np.ndarray, svm_labels: np.ndarray, ref_labels: np.ndarray,
+             gold: List[Optional[str]]) -> Dict[str, Any]:
+    """Concordancia, tasa de escalamiento y (si hay etiquetas) exactitud para un umbral."""
+    escalated = margins < threshold
+    cascade_labels = np.where(escalated, ref_labels, svm_labels)
+    stats = {
+        "threshold": threshold,
+        "escalation_rate": float(escalated.mean()),
+        "agreement": float((cascade_labels == ref_labels).mean()),
+    }
+    known = [i for i, label in enumerate(gold) if label is not None]
+    if known:
+        gold_arr = np.asarray([gold[i] for i in known])
+        stats["accuracy"] = {
+            "cascade": float((cascade_labels[known] == gold_arr).mean()),
+            "svm": float((svm_labels[known] == gold_arr).mean()),
+            "transformer": float((ref_labels[known] == gold_arr).mean()),
+        }
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", required=True, help="Directorio del modelo pysentimiento")
+    parser.add_argument("--svm-dir", required=True, help="Directorio con model.joblib y vectorizer.joblib del SVM")
+    parser.add_argument("--texts", required=True, help="Textos de calibración (.txt o .jsonl)")
+    parser.add_argument("--target-agreement", type=float, default=0.97,
+                        help="Concordancia mínima con el transformer (0-1)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    texts, gold = load_labeled_texts(args.texts)
+    if not texts:
+        raise ValueError(f"No se encontraron textos en {args.texts}")
+
+    svm_model = joblib.load(os.path.join(args.svm_dir, "model.joblib"))
+    svm_vectorizer = joblib.load(os.path.join(args.svm_dir, "vectorizer.joblib"))
+    svm_labels, margins = _svm_scores(texts, svm_model, svm_vectorizer)
+    svm_labels = np.asarray([str(label) for label in svm_labels])
+    ref_labels = transformer_labels(args.model_dir, texts, args.batch_size)
+
+    threshold = choose_threshold(margins, svm_labels == ref_labels, args.target_agreement)
+    config = evaluate(threshold, margins, svm_labels, ref_labels, gold)
+    config.update(
+        target_agreement=args.target_agreement,
+        n_texts=len(texts),
+        svm_source=os.path.basename(os.path.normpath(args.svm_dir)),
+        engine=ENGINE,
+        curve=[evaluate(float(t), margins, svm_labels, ref_labels, gold)
+               for t in np.quantile(margins, [0.1, 0.25, 0.5, 0.75, 0.9])],
+    )
+
+    cascade_dir = os.path.join(args.model_dir, CASCADE_DIR)
+    os.makedirs(cascade_dir, exist_ok=True)
+    for name in ("model.joblib", "vectorizer.joblib"):
+        shutil.copyfile(os.path.join(args.svm_dir, name), os.path.join(cascade_dir, name))
+    config_path = os.path.join(cascade_dir, CASCADE_CONFIG_FILE)
+    with open(config_path, "w", encoding="utf-8") as fh:
+        json.dump(config, fh, ensure_ascii=False, indent=2)
+
+    print(f"Umbral de margen: {threshold:.4f}")
+    print(f"Concordancia con el transformer: {config['agreement']:.4f} (objetivo {args.target_agreement})")
+    print(f"Textos escalados al transformer: {config['escalation_rate']:.1%}")
+    print(f"Configuración guardada en {config_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Exporta el modelo pysentimiento (``config.json`` + ``model.safetensors``) a un
+grafo ONNX, lo cuantiza dinámicamente a int8 y genera un reporte de
+concordancia contra el modelo fp32 de PyTorch.
+
+Uso:
+  python modelos/sentimientos/model_pysentimiento/code/export_onnx.py \
+    --model-dir modelos/sentimientos/model_pysentimiento
+
+Artefactos generados en ``--model-dir``:
+  model.int8.onnx   grafo cuantizado que sirve ``inference.py`` con SENTIMENT_ENGINE=onnx
+  onnx_report.json  concordancia de etiquetas, diferencias de probabilidad y latencias
+
+Requisitos (solo para exportar):
+  pip install onnx onnxruntime
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+from inference import (
+    ONNX_MODEL_FILE,
+    _build_results,
+    _load_onnx_session,
+    _load_torch_model,
+    _predict_probabilities,
+)
+
+
+FP32_ONNX_FILE = "model.fp32.onnx"
+REPORT_FILE = "onnx_report.json"
+OPSET = 14
+
+# Textos de referencia para el reporte cuando no se pasa --texts.  Mezclan
+# longitudes y polaridades para cubrir padding y truncamiento.
+SAMPLE_TEXTS = [
+    "Me encantó la película, la volvería a ver.",
+    "El servicio fue pésimo y la comida llegó fría.",
+    "No está mal, aunque esperaba algo más.",
+    "Hoy es martes.",
+    "¡Qué maravilla de lugar! Todo el personal fue muy amable con nosotros.",
+    "La entrega se retrasó tres días y nadie respondió mis correos.",
+    "El producto cumple con lo prometido, ni más ni menos.",
+    "Horrible experiencia, no lo recomiendo a nadie.",
+    "Gracias por la ayuda, resolvieron mi problema rapidísimo.",
+    "El clima estuvo nublado toda la tarde.",
+    "La batería dura poco pero la cámara es excelente y la pantalla se ve muy bien "
+    "incluso bajo el sol, así que en general estoy contento con la compra.",
+    "No sé qué pensar de la nueva actualización.",
+    "Es lo peor que he comprado en mi vida.",
+    "Buen precio, buena calidad.",
+    "La reunión quedó para el jueves a las diez.",
+    "Estoy muy decepcionado con el final de la serie, arruinaron a todos los personajes "
+    "que habían construido durante cinco temporadas.",
+]
+
+
+class _LogitsWrapper(torch.nn.Module):
+    """Expone ``logits`` como única salida con entradas posicionales para ``torch.onnx.export``."""
+
+    def __init__(self, model: torch.nn.Module, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *tensors: torch.Tensor) -> torch.Tensor:
+        return self.model(**dict(zip(self.input_names, tensors))).logits
+
+
+def export_fp32(model_dir: str, output_path: str) -> None:
+    """Exporta el modelo fp32 a ONNX con ejes dinámicos de lote y secuencia."""
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = _load_torch_model(model_dir, dtype="float32")
+
+    dummy = tokenizer(SAMPLE_TEXTS[:2], padding=True, truncation=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _LogitsWrapper(model, input_names),
+            tuple(dummy[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET,
+            do_constant_folding=True,
+        )
+
+
+def quantize_int8(fp32_path: str, int8_path: str) -> None:
+    """Cuantización dinámica (pesos int8, activaciones cuantizadas en tiempo de ejecución)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(model_input=fp32_path, model_output=int8_path, weight_type=QuantType.QInt8)
+
+
+def load_texts(path: str) -> List[str]:
+    """Lee textos de un .txt (uno por línea) o .jsonl (claves ``text``/``input``)."""
+    texts = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = record.get("text") or record.get("input") or ""
+            texts.append(str(line))
+    return texts
+
+
+def _time_batches(run, texts: List[str], batch_size: int, repeats: int) -> Tuple[np.ndarray, float]:
+    """Ejecuta ``run`` por lotes; devuelve las probabilidades y la mediana en ms por lote."""
+    probabilities = None
+    timings = []
+    for _ in range(repeats):
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            t0 = time.perf_counter()
+            chunks.append(run(texts[start:start + batch_size]))
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        probabilities = np.concatenate(chunks, axis=0)
+    return probabilities, statistics.median(timings)
+
+
+def agreement_report(model_dir: str, texts: List[str], batch_size: int, repeats: int) -> Dict[str, Any]:
+    """Compara el modelo fp32 de PyTorch contra el grafo int8 de ONNX Runtime."""
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = _load_torch_model(model_dir, dtype="float32")
+    id2label = model.config.id2label
+    torch_info = {"tokenizer": tokenizer, "engine": "torch", "model": model, "id2label": id2label}
+    onnx_info = {"tokenizer": tokenizer, "engine": "onnx", "session": _load_onnx_session(model_dir), "id2label": id2label}
+
+    # Una pasada de calentamiento por motor para no medir inicializaciones perezosas
+    _predict_probabilities(texts[:batch_size], torch_info)
+    _predict_probabilities(texts[:batch_size], onnx_info)
+
+    torch_probs, torch_ms = _time_batches(lambda b: _predict_probabilities(b, torch_info), texts, batch_size, repeats)
+    onnx_probs, onnx_ms = _time_batches(lambda b: _predict_probabilities(b, onnx_info), texts, batch_size, repeats)
+
+    torch_results = _build_results(torch_probs, id2label)
+    onnx_results = _build_results(onnx_probs, id2label)
+    diff = np.abs(torch_probs - onnx_probs)
+    disagreements = [
+        {"text": text, "fp32": a["label"], "int8": b["label"]}
+        for text, a, b in zip(texts, torch_results, onnx_results)
+        if a["label"] != b["label"]
+    ]
+
+    return {
+        "n_texts": len(texts),
+        "batch_size": batch_size,
+        "label_agreement": 1.0 - len(disagreements) / len(texts),
+        "max_abs_prob_diff": float(diff.max()),
+        "mean_abs_prob_diff": float(diff.mean()),
+        "latency_ms_per_batch": {"torch_fp32": torch_ms, "onnx_int8": onnx_ms},
+        "speedup": torch_ms / onnx_ms if onnx_ms > 0 else None,
+        "disagreements": disagreements[:20],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", required=True, help="Directorio con config.json, model.safetensors y tokenizer")
+    parser.add_argument("--texts", help="Archivo .txt o .jsonl con textos para el reporte de concordancia")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3, help="Repeticiones para medir latencia")
+    parser.add_argument("--keep-fp32", action="store_true", help="Conserva el grafo fp32 intermedio")
+    args = parser.parse_args()
+
+    fp32_path = os.path.join(args.model_dir, FP32_ONNX_FILE)
+    int8_path = os.path.join(args.model_dir, ONNX_MODEL_FILE)
+
+    print(f"Exportando grafo fp32 a {fp32_path}")
+    export_fp32(args.model_dir, fp32_path)
+    print(f"Cuantizando a int8 en {int8_path}")
+    quantize_int8(fp32_path, int8_path)
+
+    texts = load_texts(args.texts) if args.texts else SAMPLE_TEXTS
+    report = agreement_report(args.model_dir, texts, args.batch_size, args.repeats)
+    report["file_size_mb"] = {
+        "safetensors_fp32": os.path.getsize(os.path.join(args.model_dir, "model.safetensors")) / 2**20,
+        "onnx_fp32": os.path.getsize(fp32_path) / 2**20,
+        "onnx_int8": os.path.getsize(int8_path) / 2**20,
+    }
+    if not args.keep_fp32:
+        os.remove(fp32_path)
+
+    report_path = os.path.join(args.model_dir, REPORT_FILE)
+    with open(report_path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    print(f"Concordancia de etiquetas: {report['label_agreement']:.4f} sobre {report['n_texts']} textos")
+    print(f"Diferencia máxima de probabilidad: {report['max_abs_prob_diff']:.5f}")
+    print(f"Latencia por lote (ms): fp32={report['latency_ms_per_batch']['torch_fp32']:.2f} "
+          f"int8={report['latency_ms_per_batch']['onnx_int8']:.2f}")
+    print(f"Reporte guardado en {report_path}")
+
+
+if __name__ == "__main__":
+    main()
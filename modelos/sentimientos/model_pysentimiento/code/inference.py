@@ -1,17 +1,116 @@
+import contextlib
 import json
 import logging
+import mmap
 import os
-from typing import List, Dict, Any
+import struct
+import threading
+import time
+from typing import List, Dict, Any, Union
 
+# Marca el inicio de las importaciones pesadas (torch + transformers) para el
+# perfil de arranque que se reporta al final de ``model_fn``.
+_IMPORT_STARTED = time.perf_counter()
+
+import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
 import torch.nn.functional as F
 
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+from instrumentation import instrumented, stage
+from profiler import profiled
+from serialization import encode_probabilities, is_default
+from thread_planner import configure, finalize
 
 # Configure a basic logger. SageMaker will stream these logs to CloudWatch.
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Motor de inferencia: "torch" (fp32 eager, por defecto) u "onnx" (grafo ONNX
+# cuantizado a int8 servido con ONNX Runtime).  El grafo se genera offline con
+# ``export_onnx.py`` y debe empaquetarse junto a los demás artefactos.
+ENGINE = os.environ.get("SENTIMENT_ENGINE", "torch").lower()
+ONNX_MODEL_FILE = os.environ.get("SENTIMENT_ONNX_FILE", "model.int8.onnx")
+
+# Opciones de arranque en frío del motor PyTorch:
+#   SENTIMENT_MMAP=1       mapea model.safetensors en memoria en lugar de copiar los pesos
+#   SENTIMENT_DTYPE        "float32" (por defecto) o "bfloat16" para pesos bf16 en CPU
+#   SENTIMENT_WARMUP=1     ejecuta una inferencia de calentamiento dentro de model_fn
+USE_MMAP = os.environ.get("SENTIMENT_MMAP", "1") == "1"
+WEIGHTS_DTYPE = os.environ.get("SENTIMENT_DTYPE", "float32").lower()
+WARMUP = os.environ.get("SENTIMENT_WARMUP", "1") == "1"
+
+# Textos de calentamiento: uno corto y uno largo (llega al truncamiento) para
+# que el primer request real no pague la reserva de buffers más grandes.
+WARMUP_TEXTS = [
+    "Hola, ¿qué tal?",
+    " ".join(["El servicio fue bueno pero la espera fue demasiado larga."] * 64),
+]
+
+# Modo cascada (SENTIMENT_CASCADE=1): un LinearSVC barato clasifica todos los
+# textos y solo los de margen bajo se escalan al transformer en un único lote.
+# Los artefactos viven en ``<model_dir>/cascade/`` y los genera
+# ``calibrate_cascade.py``; SENTIMENT_CASCADE_THRESHOLD sobreescribe el umbral.
+CASCADE = os.environ.get("SENTIMENT_CASCADE", "0") == "1"
+CASCADE_DIR = "cascade"
+CASCADE_CONFIG_FILE = "cascade.json"
+
+# Columns of the compact formats (mapped id2label, in index order); set by
+# model_fn so they do not depend on which rows of a batch have probabilities.
+_class_columns: List[str] = []
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MiB (0.0 if unavailable)."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return 0.0
+
+
+class _StartupProfile:
+    """Records wall time and RSS of each cold-start phase and logs them as one JSON line."""
+
+    def __init__(self):
+        self.phases: Dict[str, Dict[str, float]] = {
+            "import": {"seconds": round(_IMPORT_SECONDS, 4)},
+        }
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = {
+                "seconds": round(time.perf_counter() - started, 4),
+                "rss_mb": round(_rss_mb(), 1),
+            }
+
+    def report(self, **extra: Any) -> Dict[str, Any]:
+        profile = {"phases": self.phases, **extra}
+        logger.info("Perfil de arranque: %s", json.dumps(profile))
+        return profile
+
 
 def _map_label(label: str) -> str:
     """
@@ -39,6 +138,207 @@ def _map_label(label: str) -> str:
     return mapping.get(label, "NEUTRO")
 
 
+def _mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a ``.safetensors`` file into memory and return zero-copy tensors.
+
+    The file is mapped copy-on-write (``ACCESS_COPY``): pages are read lazily
+    from the page cache and shared with any other process mapping the same
+    file, and nothing is copied unless a tensor is modified.
+    """
+    with open(path, "rb") as fh:
+        buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_len = struct.unpack("<Q", buffer[:8])[0]
+    header = json.loads(buffer[8:8 + header_len])
+    data_start = 8 + header_len
+
+    tensors = {}
+    for name, meta in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES[meta["dtype"]]
+        begin, end = meta["data_offsets"]
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        if end == begin:
+            tensors[name] = torch.empty(meta["shape"], dtype=dtype)
+            continue
+        tensor = torch.frombuffer(
+            buffer, dtype=dtype, count=(end - begin) // itemsize, offset=data_start + begin
+        ).reshape(meta["shape"])
+        if (data_start + begin) % itemsize:
+            # Desalineado: copiamos este tensor para no penalizar los kernels
+            tensor = tensor.clone()
+        tensors[name] = tensor
+    return tensors
+
+
+# ``_empty_parameters`` only acts in the thread that entered it: the registry
+# or a threaded server may be building other models at the same time.
+_meta_state = threading.local()
+_meta_patch_lock = threading.Lock()
+_meta_patch_installed = False
+
+
+def _install_meta_patch() -> None:
+    """Wrap ``torch.nn.Module.register_parameter`` once, for the whole process."""
+    global _meta_patch_installed
+    with _meta_patch_lock:
+        if _meta_patch_installed:
+            return
+        original = torch.nn.Module.register_parameter
+
+        def register_parameter(module, name, param):
+            original(module, name, param)
+            if param is not None and getattr(_meta_state, "depth", 0):
+                module._parameters[name] = torch.nn.Parameter(
+                    module._parameters[name].to("meta"), requires_grad=param.requires_grad
+                )
+
+        torch.nn.Module.register_parameter = register_parameter
+        _meta_patch_installed = True
+
+
+@contextlib.contextmanager
+def _empty_parameters():
+    """
+    Move module parameters to the ``meta`` device as they are registered.
+
+    Each layer still allocates its parameter with ``torch.empty`` (uninitialized
+    memory, released at once), but the parameter is swapped for a ``meta``
+    tensor before the layer's ``reset_parameters`` runs, so the random
+    initialization is skipped and the full set of weights never exists in
+    memory.  Buffers stay on CPU because non-persistent ones (e.g.
+    ``position_ids``) are not in the checkpoint.
+
+    The wrapper around ``register_parameter`` is installed process-wide on
+    first use and left in place; it only changes behaviour in the thread that
+    is inside this context, so models built concurrently by other threads
+    are unaffected.
+    """
+    _install_meta_patch()
+    _meta_state.depth = getattr(_meta_state, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _meta_state.depth -= 1
+
+
+def _load_mmap_model(model_dir: str):
+    """
+    Build the model skeleton on ``meta`` and assign the memory-mapped weights.
+
+    Returns ``None`` when the checkpoint does not cover every parameter (e.g. a
+    different key prefix), so the caller can fall back to ``from_pretrained``.
+    """
+    weights_path = os.path.join(model_dir, "model.safetensors")
+    if not os.path.isfile(weights_path):
+        return None
+
+    config = AutoConfig.from_pretrained(model_dir)
+    with _empty_parameters():
+        model = AutoModelForSequenceClassification.from_config(config)
+    state_dict = _mmap_safetensors(weights_path)
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        logger.warning("Carga mmap incompleta (%d parámetros sin pesos, p. ej. %s); se usa from_pretrained.",
+                       len(missing), missing[0])
+        return None
+    return model
+
+
+def _load_torch_model(model_dir: str, use_mmap: bool = USE_MMAP, dtype: str = WEIGHTS_DTYPE) -> torch.nn.Module:
+    """
+    Load the PyTorch model in evaluation mode.
+
+    With ``use_mmap`` the safetensors weights are mapped instead of copied;
+    ``dtype="bfloat16"`` casts the weights to bf16 after loading, halving
+    their resident memory.
+    """
+    model = _load_mmap_model(model_dir) if use_mmap else None
+    if model is None:
+        model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    if dtype == "bfloat16":
+        model = model.to(torch.bfloat16)
+    elif dtype != "float32":
+        raise ValueError(f"SENTIMENT_DTYPE no soportado: {dtype}")
+    model.eval()
+    return model
+
+
+def _load_onnx_session(model_dir: str, onnx_file: str = ONNX_MODEL_FILE, threads: int = 0):
+    """
+    Create an ONNX Runtime session for the exported (quantized) graph.
+
+    ``onnxruntime`` is imported lazily so the default PyTorch engine does not
+    need it installed.  ``threads`` caps the intra-op pool (0: ORT default).
+    """
+    import onnxruntime as ort
+
+    onnx_path = os.path.join(model_dir, onnx_file)
+    if not os.path.isfile(onnx_path):
+        raise FileNotFoundError(
+            f"No se encontró el grafo ONNX '{onnx_file}' en el directorio del modelo. "
+            "Genéralo con export_onnx.py antes de empaquetar."
+        )
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _load_cascade(model_dir: str) -> Dict[str, Any]:
+    """
+    Load the SVM stage of the cascade and its calibrated margin threshold.
+
+    ``joblib`` (and therefore scikit-learn) is only imported when the cascade
+    is enabled.
+    """
+    import joblib
+
+    cascade_dir = os.path.join(model_dir, CASCADE_DIR)
+    model_path = os.path.join(cascade_dir, "model.joblib")
+    vectorizer_path = os.path.join(cascade_dir, "vectorizer.joblib")
+    config_path = os.path.join(cascade_dir, CASCADE_CONFIG_FILE)
+    if not all(os.path.isfile(p) for p in (model_path, vectorizer_path, config_path)):
+        raise FileNotFoundError(
+            f"El modo cascada requiere model.joblib, vectorizer.joblib y {CASCADE_CONFIG_FILE} "
+            f"en '{CASCADE_DIR}/'. Genéralos con calibrate_cascade.py."
+        )
+    with open(config_path, encoding="utf-8") as fh:
+        config = json.load(fh)
+    threshold = float(os.environ.get("SENTIMENT_CASCADE_THRESHOLD", config["threshold"]))
+    logger.info("Cascada SVM habilitada (umbral de margen %.4f)", threshold)
+    return {
+        "model": joblib.load(model_path),
+        "vectorizer": joblib.load(vectorizer_path),
+        "threshold": threshold,
+    }
+
+
+def _svm_scores(inputs: List[str], model: Any, vectorizer: Any):
+    """
+    Score texts with a linear SVM and return ``(labels, margins)``.
+
+    The margin is the gap between the two highest ``decision_function``
+    scores (or ``|score|`` for a binary model): a small margin means the SVM
+    is unsure and the text should be escalated.
+    """
+    scores = model.decision_function(vectorizer.transform(inputs))
+    if scores.ndim == 1:
+        labels = model.classes_[(scores > 0).astype(int)]
+        margins = np.abs(scores)
+    else:
+        top2 = np.partition(scores, -2, axis=1)[:, -2:]
+        labels = model.classes_[scores.argmax(axis=1)]
+        margins = top2[:, 1] - top2[:, 0]
+    return labels, margins
+
+
+@instrumented("model_fn")
 def model_fn(model_dir: str) -> Dict[str, Any]:
     """
     Load the Hugging Face sentiment analysis model from the model directory.
@@ -49,6 +349,11 @@ def model_fn(model_dir: str) -> Dict[str, Any]:
     AutoModelForSequenceClassification ensures the correct configuration
     and weights are loaded regardless of model file names.
 
+    When the ``SENTIMENT_ENGINE`` environment variable is ``onnx`` the
+    PyTorch weights are not loaded at all; instead an ONNX Runtime session
+    is created for the int8 graph produced by ``export_onnx.py``.  The
+    tokenizer and label mapping are shared by both engines.
+
     Parameters
     ----------
     model_dir: str
@@ -57,17 +362,62 @@ def model_fn(model_dir: str) -> Dict[str, Any]:
     Returns
     -------
     Dict[str, Any]
-        A dictionary holding the loaded model and tokenizer.  This object is
-        passed to predict_fn on every invocation.
+        A dictionary holding the loaded model (or ONNX session), the tokenizer
+        and the ``id2label`` mapping.  This object is passed to predict_fn on
+        every invocation.
     """
-    logger.info("Cargando modelo y tokenizer Hugging Face desde %s", model_dir)
-    tokenizer = AutoTokenizer.from_pretrained(model_dir)
-    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
-    model.eval()
+    logger.info("Cargando modelo y tokenizer Hugging Face desde %s (motor: %s)", model_dir, ENGINE)
+    # Intra-op threads from available cores and server workers (thread_planner.py)
+    plan = configure(model_dir)
+    if ENGINE == "onnx" and plan["mode"] == "calibrate":
+        # Calibration changes torch threads, which the ORT session ignores
+        plan["mode"] = "auto"
+    profile = _StartupProfile()
+    with profile.phase("load"):
+        tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        if ENGINE == "onnx":
+            config = AutoConfig.from_pretrained(model_dir)
+            model_info = {
+                "tokenizer": tokenizer,
+                "engine": "onnx",
+                "session": _load_onnx_session(model_dir, threads=plan.get("intra_op_threads", 0)),
+                "id2label": config.id2label,
+            }
+        elif ENGINE == "torch":
+            model = _load_torch_model(model_dir)
+            model_info = {
+                "tokenizer": tokenizer,
+                "engine": "torch",
+                "model": model,
+                "id2label": model.config.id2label,
+            }
+        else:
+            raise ValueError(f"Motor de inferencia no soportado: {ENGINE}")
+        if CASCADE:
+            model_info["cascade"] = _load_cascade(model_dir)
     logger.info("Modelo cargado correctamente.")
-    return {"tokenizer": tokenizer, "model": model}
+    global _class_columns
+    _class_columns = _label_columns(model_info["id2label"])
+
+    if WARMUP:
+        # Primera pasada: reserva buffers y resuelve rutas perezosas; segunda:
+        # confirma la latencia en régimen estable.
+        with profile.phase("warmup"):
+            _predict_probabilities(WARMUP_TEXTS, model_info)
+        with profile.phase("steady_state"):
+            _predict_probabilities(WARMUP_TEXTS, model_info)
 
+    finalize(plan, lambda: _predict_probabilities(WARMUP_TEXTS, model_info), items_per_call=len(WARMUP_TEXTS))
 
+    engine_options = {"engine": ENGINE, "cascade": CASCADE}
+    if ENGINE == "torch":
+        engine_options.update(mmap=USE_MMAP, dtype=WEIGHTS_DTYPE)
+    profile.report(**engine_options)
+    return model_info
+
+
+@profiled("input_fn")
+@instrumented("input_fn")
 def input_fn(request_body: str, request_content_type: str) -> List[str]:
     """
     Parse and validate the incoming request body.
@@ -109,54 +459,59 @@ def input_fn(request_body: str, request_content_type: str) -> List[str]:
     return inputs
 
 
-def predict_fn(inputs: List[str], model_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _predict_probabilities(inputs: List[str], model_info: Dict[str, Any]) -> np.ndarray:
     """
-    Perform sentiment classification on a batch of inputs.
-
-    Tokenizes the input texts, runs them through the loaded Hugging Face model,
-    computes probabilities via softmax and maps the resulting labels to the
-    Spanish descriptors defined in `_map_label`.  Each result includes the
-    predicted label and per‑class probabilities.
+    Run the configured engine over a batch and return softmax probabilities.
 
-    Parameters
-    ----------
-    inputs: List[str]
-        A list of raw text strings to analyse.
-    model_info: Dict[str, Any]
-        The dictionary returned by `model_fn` containing the model and tokenizer.
-
-    Returns
-    -------
-    List[Dict[str, Any]]
-        A list of prediction dictionaries.  Each dictionary contains two keys:
-        ``label`` (the mapped Spanish label) and ``probabilities`` (a mapping
-        of Spanish labels to probabilities).
+    Both engines share the tokenizer call (padding + truncation) so the
+    ONNX graph sees exactly the same token ids as the PyTorch model.
     """
     tokenizer: AutoTokenizer = model_info["tokenizer"]
-    model: AutoModelForSequenceClassification = model_info["model"]
 
+    if model_info.get("engine") == "onnx":
+        session = model_info["session"]
+        with stage("tokenize"):
+            encoding = tokenizer(inputs, padding=True, truncation=True, return_tensors="np")
+        input_names = {i.name for i in session.get_inputs()}
+        feeds = {k: v.astype(np.int64) for k, v in encoding.items() if k in input_names}
+        with stage("model"):
+            logits = session.run(None, feeds)[0]
+        # Softmax numéricamente estable en NumPy
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    model: AutoModelForSequenceClassification = model_info["model"]
     # Tokenize the input batch.  We use padding and truncation to handle
     # variable length sentences.  ``return_tensors='pt'`` yields PyTorch tensors.
-    encoding = tokenizer(
-        inputs,
-        padding=True,
-        truncation=True,
-        return_tensors="pt",
-    )
+    with stage("tokenize"):
+        encoding = tokenizer(
+            inputs,
+            padding=True,
+            truncation=True,
+            return_tensors="pt",
+        )
 
     # Forward pass without computing gradients.
-    with torch.no_grad():
+    with stage("model"), torch.no_grad():
         outputs = model(**encoding)
         logits = outputs.logits
-        probabilities = F.softmax(logits, dim=-1)
+        # ``float()`` deja el softmax en fp32 también cuando los pesos son bf16
+        probabilities = F.softmax(logits.float(), dim=-1)
+    return probabilities.numpy()
 
-    # id2label maps the numerical class index to the raw label (e.g. "NEG")
-    id2label = model.config.id2label
 
+def _label_columns(id2label: Dict[int, str]) -> List[str]:
+    """Mapped labels in ``id2label`` index order, as ``_build_results`` writes them."""
+    return [_map_label(id2label.get(j, "NEU")) for j in range(len(id2label))]
+
+
+def _build_results(probabilities: np.ndarray, id2label: Dict[int, str]) -> List[Dict[str, Any]]:
+    """Turn a ``(n_texts, n_labels)`` probability matrix into response dictionaries."""
     results: List[Dict[str, Any]] = []
-    for idx in range(len(inputs)):
+    for row in probabilities:
         # Get the index with the highest probability
-        pred_idx = int(torch.argmax(probabilities[idx]).item())
+        pred_idx = int(np.argmax(row))
         raw_label = id2label.get(pred_idx, "NEU")  # default to NEU if missing
         mapped_label = _map_label(raw_label)
 
@@ -164,33 +519,106 @@ def predict_fn(inputs: List[str], model_info: Dict[str, Any]) -> List[Dict[str,
         prob_dict = {}
         for j in range(probabilities.shape[1]):
             lbl = _map_label(id2label.get(j, "NEU"))
-            prob_dict[lbl] = float(probabilities[idx][j].item())
+            prob_dict[lbl] = float(row[j])
         results.append({
             "label": mapped_label,
             "probabilities": prob_dict,
         })
+    return results
+
 
+def _cascade_predict(inputs: List[str], model_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Classify with the SVM and escalate low-margin texts to the transformer.
+
+    SVM-resolved results carry ``probabilities: None`` because ``LinearSVC``
+    has no calibrated probabilities; every result reports its ``source`` and
+    the SVM ``margin``.
+    """
+    cascade = model_info["cascade"]
+    with stage("svm"):
+        labels, margins = _svm_scores(inputs, cascade["model"], cascade["vectorizer"])
+    results: List[Dict[str, Any]] = [
+        {"label": str(label), "probabilities": None, "source": "svm", "margin": float(margin)}
+        for label, margin in zip(labels, margins)
+    ]
+
+    escalated = np.flatnonzero(margins < cascade["threshold"])
+    if escalated.size:
+        probabilities = _predict_probabilities([inputs[i] for i in escalated], model_info)
+        for i, result in zip(escalated, _build_results(probabilities, model_info["id2label"])):
+            result.update(source="transformer", margin=float(margins[i]))
+            results[i] = result
+    logger.info("Cascada: %d de %d textos escalados al transformer", escalated.size, len(inputs))
     return results
 
 
-def output_fn(prediction: List[Dict[str, Any]], response_content_type: str) -> str:
+@instrumented("predict_fn")
+def predict_fn(inputs: List[str], model_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Perform sentiment classification on a batch of inputs.
+
+    Tokenizes the input texts, runs them through the loaded Hugging Face model
+    (or its ONNX Runtime counterpart), computes probabilities via softmax and
+    maps the resulting labels to the Spanish descriptors defined in
+    `_map_label`.  Each result includes the predicted label and per‑class
+    probabilities.
+
+    Parameters
+    ----------
+    inputs: List[str]
+        A list of raw text strings to analyse.
+    model_info: Dict[str, Any]
+        The dictionary returned by `model_fn` containing the model and tokenizer.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        A list of prediction dictionaries.  Each dictionary contains two keys:
+        ``label`` (the mapped Spanish label) and ``probabilities`` (a mapping
+        of Spanish labels to probabilities).  In cascade mode each dictionary
+        also has ``source`` ("svm" or "transformer") and ``margin``.
+    """
+    if "cascade" in model_info:
+        return _cascade_predict(inputs, model_info)
+    probabilities = _predict_probabilities(inputs, model_info)
+    # id2label maps the numerical class index to the raw label (e.g. "NEG")
+    with stage("postprocess"):
+        return _build_results(probabilities, model_info["id2label"])
+
+
+@profiled("output_fn")
+@instrumented("output_fn")
+def output_fn(prediction: List[Dict[str, Any]], response_content_type: str) -> Union[str, bytes]:
     """
-    Serialize the prediction into a JSON string.
+    Serialize the prediction according to the requested ``Accept``.
+
+    Plain ``application/json`` keeps the per-text dictionaries.  Compact
+    formats (``top_k``, dense JSON, ``application/x-npy`` and msgpack) carry a
+    ``(n_texts, n_labels)`` probability matrix instead; see ``serialization.py``.
 
     Parameters
     ----------
     prediction: List[Dict[str, Any]]
         The list of results returned by `predict_fn`.
     response_content_type: str
-        The desired MIME type for the response.  Only ``application/json`` is supported.
+        The desired MIME type for the response.
 
     Returns
     -------
-    str
-        A JSON encoded string containing the predictions.
+    Union[str, bytes]
+        The serialized predictions.
     """
     logger.info("Serializando salida para content-type: %s", response_content_type)
-    if response_content_type != "application/json":
-        raise ValueError(f"Content-Type no soportado: {response_content_type}")
-
-    return json.dumps({"predictions": prediction}, ensure_ascii=False)
+    if is_default(response_content_type):
+        return json.dumps({"predictions": prediction}, ensure_ascii=False)
+
+    # Column order is the id2label order kept by ``_build_results``, the same
+    # for every batch; rows the cascade resolved with the SVM become NaN.
+    classes = _class_columns
+    matrix = np.full((len(prediction), len(classes)), np.nan, dtype=np.float32)
+    for row, result in zip(matrix, prediction):
+        if result["probabilities"]:
+            row[:] = [result["probabilities"][label] for label in classes]
+    return encode_probabilities(matrix, classes, response_content_type,
+                                labels=[r["label"] for r in prediction])
@@ -0,0 +1,153 @@
+"""
+Instrumentación por etapas de los handlers de inferencia.
+
+``instrumented(nombre)`` envuelve model_fn/input_fn/predict_fn/output_fn y
+``stage(nombre)`` marca etapas internas (decodificación, preprocesado,
+tokenización, modelo...).  Por cada llamada se registra tiempo de pared,
+tiempo de CPU del hilo y delta de bloques asignados por Python, y se emite
+una línea de log JSON (``handler_metrics {...}``).
+
+Variables de entorno (se leen al importar):
+  HANDLER_METRICS=1              activa la instrumentación (por defecto apagada:
+                                 ``instrumented`` devuelve la función tal cual y
+                                 ``stage`` es un contexto vacío)
+  HANDLER_METRICS_RESPONSE=1     añade ``"metrics"`` al JSON de respuesta con las
+                                 etapas de input_fn, predict_fn y output_fn
+  HANDLER_METRICS_TRACEMALLOC=1  mide además el pico de memoria con tracemalloc
+                                 (incluye buffers de NumPy; más costoso y, con
+                                 etapas anidadas, el pico del padre es aproximado)
+
+Las etapas de una petición se acumulan por hilo: si ``predict_fn`` corre en
+otro hilo (lotes dinámicos) su registro aparece solo en el log.
+
+Este archivo se copia idéntico en cada ``code/`` porque cada modelo se
+empaqueta por separado.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("HANDLER_METRICS", "0") == "1"
+IN_RESPONSE = ENABLED and os.environ.get("HANDLER_METRICS_RESPONSE", "0") == "1"
+TRACE_MALLOC = ENABLED and os.environ.get("HANDLER_METRICS_TRACEMALLOC", "0") == "1"
+
+# Las funciones del handler que forman una petición, en orden
+REQUEST_FUNCTIONS = ("input_fn", "predict_fn", "output_fn")
+
+_NULL_STAGE = contextlib.nullcontext()
+_local = threading.local()
+
+if TRACE_MALLOC and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+class _Record:
+    """Mediciones de una función o etapa; ``stages`` guarda las etapas anidadas."""
+
+    __slots__ = ("name", "wall", "cpu", "blocks", "peak", "stages")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: List["_Record"] = []
+        self.peak = None
+        if TRACE_MALLOC:
+            tracemalloc.reset_peak()
+            self.peak = tracemalloc.get_traced_memory()[0]
+        self.blocks = sys.getallocatedblocks()
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+
+    def close(self) -> None:
+        self.wall = (time.perf_counter() - self.wall) * 1000.0
+        self.cpu = (time.thread_time() - self.cpu) * 1000.0
+        self.blocks = sys.getallocatedblocks() - self.blocks
+        if TRACE_MALLOC:
+            self.peak = (tracemalloc.get_traced_memory()[1] - self.peak) / 1024.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = {
+            "wall_ms": round(self.wall, 3),
+            "cpu_ms": round(self.cpu, 3),
+            "alloc_blocks": self.blocks,
+        }
+        if self.peak is not None:
+            data["alloc_peak_kb"] = round(self.peak, 1)
+        if self.stages:
+            data["stages"] = {s.name: s.as_dict() for s in self.stages}
+        return data
+
+
+def _stack() -> List[_Record]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextlib.contextmanager
+def _measure(name: str):
+    stack = _stack()
+    record = _Record(name)
+    if stack:
+        stack[-1].stages.append(record)
+    stack.append(record)
+    try:
+        yield record
+    finally:
+        stack.pop()
+        record.close()
+
+
+def stage(name: str):
+    """Contexto que mide una etapa interna; no hace nada si la instrumentación está apagada."""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _measure(name)
+
+
+def _attach_metrics(response: Any, metrics: Dict[str, Any]) -> Any:
+    """Inserta ``"metrics"`` en una respuesta que sea un objeto JSON serializado."""
+    if not isinstance(response, str) or not response.startswith("{") or not response.endswith("}"):
+        return response
+    body = response[1:-1].strip()
+    separator = ", " if body else ""
+    return "{" + body + separator + '"metrics": ' + json.dumps(metrics) + "}"
+
+
+def instrumented(name: str) -> Callable[[Callable], Callable]:
+    """Decorador para las funciones del handler; sin HANDLER_METRICS devuelve la función intacta."""
+
+    def decorator(func: Callable) -> Callable:
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if name == REQUEST_FUNCTIONS[0]:
+                _local.request = {}
+            with _measure(name) as record:
+                result = func(*args, **kwargs)
+            metrics = record.as_dict()
+            logger.info("handler_metrics %s", json.dumps({"fn": name, **metrics}))
+            request: Optional[Dict[str, Any]] = getattr(_local, "request", None)
+            if request is not None and name in REQUEST_FUNCTIONS:
+                request[name] = metrics
+                if name == REQUEST_FUNCTIONS[-1]:
+                    _local.request = None
+                    if IN_RESPONSE:
+                        result = _attach_metrics(result, request)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,147 @@
+"""
+Formatos de respuesta negociados por ``Accept`` para los handlers de inferencia.
+
+Cada ``output_fn`` conserva su JSON de siempre para ``application/json`` sin
+parámetros (es lo que esperan la Lambda y el frontend) y delega aquí los
+formatos compactos pensados para lotes y Batch Transform:
+
+  application/json; top_k=K      JSON con floats numéricos y solo las K clases
+                                 más probables de cada fila
+  application/json; format=dense JSON con la matriz de probabilidades completa
+                                 (``classes`` + ``probabilities``), sin
+                                 diccionarios por fila ni floats como texto
+  application/x-npy              matriz float32 ``(n, n_clases)`` en formato
+                                 ``.npy``; el orden de columnas es el de la
+                                 respuesta densa (``format=dense``)
+  application/x-msgpack          ``classes``, ``predictions`` y la matriz como
+                                 bytes float32 (``shape``/``dtype``); requiere
+                                 el paquete ``msgpack``
+
+``*/*`` o un Accept vacío equivalen a ``application/json``.  Las filas sin
+probabilidades (p. ej. textos resueltos por el SVM en la cascada) van como
+``null`` en JSON y como NaN en los formatos binarios.
+
+Variables de entorno:
+  RESPONSE_DECIMALS  decimales de las probabilidades en JSON compacto (6)
+
+Este archivo se copia idéntico en cada ``code/`` porque cada modelo se
+empaqueta por separado.
+"""
+
+import io
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+JSON = "application/json"
+NPY = "application/x-npy"
+MSGPACK = "application/x-msgpack"
+SUPPORTED = (JSON, NPY, MSGPACK)
+
+DECIMALS = int(os.environ.get("RESPONSE_DECIMALS", "6"))
+
+
+def parse_accept(accept: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    """
+    Primer tipo soportado de un Accept y sus parámetros (``top_k``, ``format``).
+
+    No se evalúan pesos ``q``: se respeta el orden en que el cliente los lista.
+    """
+    for item in (accept or JSON).split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        media_type = media_type.lower()
+        if media_type in ("*/*", "application/*", ""):
+            media_type = JSON
+        if media_type in SUPPORTED:
+            options = {}
+            for param in params:
+                key, _, value = param.partition("=")
+                options[key.strip().lower()] = value.strip().strip('"')
+            return media_type, options
+    raise ValueError(f"Content-Type no soportado: {accept}")
+
+
+def is_default(accept: Optional[str]) -> bool:
+    """True si el cliente pide el JSON de siempre del handler."""
+    media_type, options = parse_accept(accept)
+    return media_type == JSON and not ({"top_k", "format"} & options.keys())
+
+
+def _round_row(row: np.ndarray) -> Optional[List[float]]:
+    if np.isnan(row).any():
+        return None
+    return [round(float(p), DECIMALS) for p in row]
+
+
+def _top_k(row: np.ndarray, classes: Sequence[Any], k: int) -> Optional[Dict[str, List[Any]]]:
+    if not row.size or np.isnan(row).any():
+        return None
+    k = min(k, row.shape[0])
+    # argpartition + orden de solo k elementos: O(n_clases) por fila
+    idx = np.argpartition(-row, k - 1)[:k]
+    idx = idx[np.argsort(-row[idx], kind="stable")]
+    return {"labels": [classes[i] for i in idx], "probabilities": [round(float(row[i]), DECIMALS) for i in idx]}
+
+
+def encode_probabilities(probabilities: Any, classes: Sequence[Any], accept: Optional[str],
+                         labels: Optional[Sequence[Any]] = None) -> Union[str, bytes]:
+    """
+    Serializa una matriz de probabilidades ``(n, n_clases)`` según ``accept``.
+
+    ``labels`` fija la etiqueta predicha de cada fila (por defecto, la clase de
+    mayor probabilidad); sirve para filas sin probabilidades (NaN).
+    """
+    media_type, options = parse_accept(accept)
+    matrix = np.asarray(probabilities, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    classes = list(classes)
+
+    if media_type == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(matrix), allow_pickle=False)
+        return buffer.getvalue()
+
+    if labels is None:
+        labels = [classes[i] for i in np.nan_to_num(matrix, nan=-1.0).argmax(axis=1)] if matrix.size else []
+    labels = list(labels)
+
+    if media_type == MSGPACK:
+        try:
+            import msgpack
+        except ImportError:
+            raise ValueError("application/x-msgpack requiere el paquete 'msgpack' en el contenedor")
+        return msgpack.packb({
+            "classes": classes,
+            "predictions": labels,
+            "shape": list(matrix.shape),
+            "dtype": "float32",
+            "probabilities": np.ascontiguousarray(matrix).tobytes(),
+        }, use_bin_type=True)
+
+    top_k = options.get("top_k")
+    if top_k:
+        k = int(top_k)
+        if k < 1:
+            raise ValueError(f"top_k debe ser >= 1: {top_k}")
+        response = {"predictions": labels, "top_k": [_top_k(row, classes, k) for row in matrix]}
+    else:
+        response = {"classes": classes, "predictions": labels,
+                    "probabilities": [_round_row(row) for row in matrix]}
+    return json.dumps(response, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_labels(labels: Sequence[Any], accept: Optional[str]) -> Union[str, bytes]:
+    """Serializa solo etiquetas (modelos sin probabilidades, como ``LinearSVC``)."""
+    media_type, _ = parse_accept(accept)
+    if media_type == NPY:
+        raise ValueError("application/x-npy no está disponible: este modelo no produce probabilidades")
+    if media_type == MSGPACK:
+        try:
+            import msgpack
+        except ImportError:
+            raise ValueError("application/x-msgpack requiere el paquete 'msgpack' en el contenedor")
+        return msgpack.packb({"predictions": list(labels)}, use_bin_type=True)
+    return json.dumps({"predictions": list(labels)}, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,212 @@
+"""
+Plan de hilos de PyTorch según los núcleos disponibles y los workers del servidor.
+
+Cada worker de SageMaker (``SAGEMAKER_MODEL_SERVER_WORKERS``) carga su propia
+copia del modelo y, sin configurar nada, PyTorch abre un pool intra-op con
+todos los núcleos de la máquina: con varios workers la CPU queda
+sobresuscrita y la latencia de cola se dispara.  ``configure()`` (al inicio de
+``model_fn``) reparte los núcleos realmente disponibles (afinidad y cuota de
+cgroup) entre los workers y fija ``torch.set_num_threads``;
+``finalize()`` (al final de ``model_fn``) calibra si se pidió y registra el
+plan elegido.
+
+Medir y calibrar ejecutan inferencias durante al menos
+``THREAD_PLAN_CALIBRATION_S`` por candidato, así que solo se hacen si se
+piden (``THREAD_PLAN=calibrate`` o ``THREAD_PLAN_MEASURE=1``): en modo auto
+``model_fn`` no gasta tiempo de arranque ni memoria en inferencias extra.  Cuando el modelo se precarga en un proceso
+que luego se bifurca (``serve_local.py --workers N --preload``), el pool de
+OpenMP creado antes de ``fork`` no funciona en los hijos: con
+``PRELOAD_MODEL=1`` en el entorno durante ``model_fn`` (lo fija
+``serve_local.py``), ``finalize()`` no mide ni calibra y se queda con el
+reparto de ``configure()``.
+
+Variables de entorno (se leen al importar):
+  THREAD_PLAN                 auto (reparto núcleos / workers, por defecto),
+                              profile (usa thread_plan.json del artefacto, que
+                              genera scripts/tune_threads.py), calibrate (prueba
+                              varios hilos dentro del presupuesto en model_fn) u
+                              off (no toca PyTorch)
+  THREAD_PLAN_CALIBRATION_S   segundos por candidato al calibrar o medir (0.5)
+  THREAD_PLAN_MEASURE         1: mide y registra el throughput del plan elegido
+                              (0, por defecto)
+  TORCH_NUM_THREADS           fuerza los hilos intra-op (gana a cualquier plan)
+  TORCH_INTEROP_THREADS       hilos inter-op (1)
+  PRELOAD_MODEL               1: carga previa a fork, sin inferencias (se lee
+                              en cada finalize())
+
+Este archivo se copia idéntico en cada ``code/`` con PyTorch porque cada
+modelo se empaqueta por separado.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODE = os.environ.get("THREAD_PLAN", "auto").lower()
+CALIBRATION_SECONDS = float(os.environ.get("THREAD_PLAN_CALIBRATION_S", "0.5"))
+MEASURE = os.environ.get("THREAD_PLAN_MEASURE", "0") == "1"
+FORCED_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0"))
+INTEROP_THREADS = int(os.environ.get("TORCH_INTEROP_THREADS", "1"))
+PLAN_FILE = "thread_plan.json"
+
+# Un calibrado se queda con el menor número de hilos a este margen del mejor:
+# los núcleos que no aportan quedan libres para otros workers
+CALIBRATION_TOLERANCE = 0.05
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """Núcleos permitidos por la cuota de CPU del cgroup (v2 o v1), o ``None`` si no hay cuota."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as fh:
+            quota = int(fh.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as fh:
+            period = int(fh.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """Núcleos que este proceso puede usar: afinidad acotada por la cuota del cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.floor(limit)))
+    return cpus
+
+
+def server_workers() -> int:
+    try:
+        return max(1, int(os.environ.get("SAGEMAKER_MODEL_SERVER_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+
+def load_profile(model_dir: str, cpus: int) -> Optional[Dict[str, Any]]:
+    """Plan de ``thread_plan.json`` para ``cpus`` núcleos (o el más cercano por debajo)."""
+    path = os.path.join(model_dir, PLAN_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as fh:
+        plans = json.load(fh).get("plans", [])
+    fitting = [p for p in plans if p["cpus"] <= cpus]
+    if fitting:
+        return max(fitting, key=lambda p: p["cpus"])
+    return min(plans, key=lambda p: p["cpus"]) if plans else None
+
+
+def _set_threads(intra: int) -> None:
+    import torch
+
+    torch.set_num_threads(intra)
+    try:
+        # Solo se puede fijar una vez y antes de cualquier trabajo inter-op
+        torch.set_num_interop_threads(INTEROP_THREADS)
+    except RuntimeError:
+        pass
+
+
+def configure(model_dir: str) -> Dict[str, Any]:
+    """Decide y aplica los hilos intra-op de este worker; devuelve el plan."""
+    cpus = available_cpus()
+    workers = server_workers()
+    budget = max(1, cpus // workers)
+    plan: Dict[str, Any] = {"mode": MODE, "cpus": cpus, "workers": workers, "budget": budget}
+
+    if MODE == "off":
+        return plan
+    if FORCED_THREADS:
+        plan.update(mode="env", intra_op_threads=FORCED_THREADS)
+    elif MODE == "profile":
+        profile = load_profile(model_dir, cpus)
+        if profile is None:
+            logger.warning("THREAD_PLAN=profile sin %s en el artefacto; se usa el reparto automático", PLAN_FILE)
+            plan.update(mode="auto", intra_op_threads=budget)
+        else:
+            plan.update(intra_op_threads=min(profile["intra_op_threads"], budget), profile=profile)
+            if profile.get("workers") and profile["workers"] != workers:
+                logger.warning("El perfil recomienda %d workers para %d núcleos (SAGEMAKER_MODEL_SERVER_WORKERS=%d)",
+                               profile["workers"], profile["cpus"], workers)
+    elif MODE in ("auto", "calibrate"):
+        plan["intra_op_threads"] = budget
+    else:
+        raise ValueError(f"THREAD_PLAN no soportado: {MODE}")
+
+    _set_threads(plan["intra_op_threads"])
+    return plan
+
+
+def measure(run: Callable[[], Any], items_per_call: int = 1, seconds: float = CALIBRATION_SECONDS) -> Dict[str, float]:
+    """Throughput (elementos/s) y latencia media de ``run`` durante ``seconds``."""
+    run()  # la primera llamada no cuenta
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        run()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            break
+    return {
+        "throughput_items_per_s": round(calls * items_per_call / elapsed, 2),
+        "latency_ms": round(elapsed / calls * 1000.0, 3),
+    }
+
+
+def _candidates(budget: int) -> List[int]:
+    counts = {budget}
+    n = 1
+    while n < budget:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def finalize(plan: Dict[str, Any], run: Callable[[], Any], items_per_call: int = 1) -> Dict[str, Any]:
+    """
+    Calibra (``THREAD_PLAN=calibrate``), mide si ``THREAD_PLAN_MEASURE=1`` y
+    registra el plan elegido.
+
+    ``run`` ejecuta una inferencia representativa de ``items_per_call``
+    elementos con el modelo ya cargado; sin calibrar ni medir, o con
+    ``PRELOAD_MODEL=1``, no se llama.
+    """
+    if plan["mode"] == "off":
+        return plan
+    preload = os.environ.get("PRELOAD_MODEL", "0") == "1"
+    if preload and plan["mode"] == "calibrate":
+        logger.warning("THREAD_PLAN=calibrate no calibra con PRELOAD_MODEL=1; se usan %d hilos",
+                       plan["intra_op_threads"])
+    if preload or (plan["mode"] != "calibrate" and not MEASURE):
+        plan["measured"] = False
+    elif plan["mode"] == "calibrate":
+        results = {}
+        for threads in _candidates(plan["budget"]):
+            _set_threads(threads)
+            results[threads] = measure(run, items_per_call)
+        best = max(r["throughput_items_per_s"] for r in results.values())
+        chosen = min(t for t, r in results.items()
+                     if r["throughput_items_per_s"] >= best * (1 - CALIBRATION_TOLERANCE))
+        plan.update(intra_op_threads=chosen, calibration={str(t): r for t, r in results.items()})
+        _set_threads(chosen)
+        plan.update(results[chosen])
+    else:
+        plan.update(measure(run, items_per_call))
+    logger.info("Plan de hilos: %s", json.dumps(plan))
+    return plan
@@ -1,15 +1,72 @@
 import json
 import logging
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 
 import joblib
 
+from instrumentation import instrumented, stage
+from profiler import profiled
+from serialization import encode_labels, is_default
+from shared_analysis import SharedAnalysis
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Combined mode (SVM_COMBINED=1, off by default): a second SVM variant (its
+# own ``model.joblib`` and ``vectorizer.joblib``) in SVM_COMPANION_DIR, or in
+# ``<model_dir>/companion`` when the variable is unset, is scored on every
+# request next to this one.
+COMPANION_DIR = os.environ.get("SVM_COMPANION_DIR", "")
+COMBINED = os.environ.get("SVM_COMBINED", "0") == "1"
+
+
+def _load_pair(model_dir: str):
+    model_path = os.path.join(model_dir, "model.joblib")
+    vectorizer_path = os.path.join(model_dir, "vectorizer.joblib")
+
+    if not os.path.isfile(model_path) or not os.path.isfile(vectorizer_path):
+        raise FileNotFoundError(
+            "Los archivos 'model.joblib' y 'vectorizer.joblib' deben estar en el directorio del modelo."
+        )
+
+    logger.info("Cargando modelo SVM desde %s", model_path)
+    # mmap_mode: los arrays de un joblib sin comprimir se mapean en memoria
+    model = joblib.load(model_path, mmap_mode="r")
+    vectorizer = joblib.load(vectorizer_path, mmap_mode="r")
+    return model, vectorizer
+
+
+def _load_variants(model_dir: str, model: Any, vectorizer: Any) -> Dict[str, Any]:
+    """
+    Load the companion variant and the shared text analysis for combined mode.
 
+    Variants are named after their vectorizer class (``CountVectorizer``,
+    ``TfidfVectorizer``).  When the vectorizers do not analyze text the same
+    way, each one keeps its own ``transform``.
+    """
+    companion_dir = COMPANION_DIR or os.path.join(model_dir, "companion")
+    companion_model, companion_vectorizer = _load_pair(companion_dir)
+    name = type(vectorizer).__name__
+    companion_name = type(companion_vectorizer).__name__
+    if companion_name == name:
+        companion_name = f"{companion_name}_companion"
+    variants = {
+        name: {"model": model, "vectorizer": vectorizer},
+        companion_name: {"model": companion_model, "vectorizer": companion_vectorizer},
+    }
+    try:
+        analysis = SharedAnalysis({n: v["vectorizer"] for n, v in variants.items()})
+        logger.info("Modo combinado: %s y %s con análisis compartido (%d términos)",
+                    name, companion_name, analysis.vocabulary_size)
+    except ValueError as e:
+        analysis = None
+        logger.info("Modo combinado: %s y %s, cada uno con su vectorizador (%s)", name, companion_name, e)
+    return {"primary": name, "variants": variants, "analysis": analysis}
+
+
+@instrumented("model_fn")
 def model_fn(model_dir: str) -> Dict[str, Any]:
     """
     Load the scikit‑learn SVM model and its corresponding vectorizer.
@@ -20,6 +77,10 @@ def model_fn(model_dir: str) -> Dict[str, Any]:
     directory.  This function deserializes them and returns them in a
     dictionary for use during inference.
 
+    In combined mode (see ``SVM_COMBINED``) the dictionary also holds
+    the companion variant and the ``SharedAnalysis`` that vectorizes for
+    both.
+
     Parameters
     ----------
     model_dir: str
@@ -30,21 +91,16 @@ def model_fn(model_dir: str) -> Dict[str, Any]:
     Dict[str, Any]
         A dictionary containing the loaded scikit‑learn model and vectorizer.
     """
-    model_path = os.path.join(model_dir, "model.joblib")
-    vectorizer_path = os.path.join(model_dir, "vectorizer.joblib")
-
-    if not os.path.isfile(model_path) or not os.path.isfile(vectorizer_path):
-        raise FileNotFoundError(
-            "Los archivos 'model.joblib' y 'vectorizer.joblib' deben estar en el directorio del modelo."
-        )
-
-    logger.info("Cargando modelo SVM desde %s", model_path)
-    model = joblib.load(model_path)
-    vectorizer = joblib.load(vectorizer_path)
+    model, vectorizer = _load_pair(model_dir)
     logger.info("Modelo y vectorizador cargados correctamente.")
-    return {"model": model, "vectorizer": vectorizer}
+    model_info = {"model": model, "vectorizer": vectorizer}
+    if COMBINED:
+        model_info.update(_load_variants(model_dir, model, vectorizer))
+    return model_info
 
 
+@profiled("input_fn")
+@instrumented("input_fn")
 def input_fn(request_body: str, request_content_type: str) -> List[str]:
     """
     Deserialize the input coming from the client.
@@ -84,7 +140,31 @@ def input_fn(request_body: str, request_content_type: str) -> List[str]:
     return inputs
 
 
-def predict_fn(inputs: List[str], model_info: Dict[str, Any]) -> List[str]:
+def _predict_combined(inputs: List[str], model_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    variants = model_info["variants"]
+    analysis = model_info["analysis"]
+    with stage("vectorize"):
+        if analysis is not None:
+            features = analysis.transform(inputs)
+        else:
+            features = {name: v["vectorizer"].transform(inputs) for name, v in variants.items()}
+    with stage("model"):
+        predictions = {name: [str(p) for p in v["model"].predict(features[name])] for name, v in variants.items()}
+    # One result per text, so the local server can split batched requests
+    names = list(predictions)
+    results = []
+    for i in range(len(inputs)):
+        labels = {name: predictions[name][i] for name in names}
+        results.append({
+            "prediction": labels[model_info["primary"]],
+            "variants": labels,
+            "agreement": len(set(labels.values())) == 1,
+        })
+    return results
+
+
+@instrumented("predict_fn")
+def predict_fn(inputs: List[str], model_info: Dict[str, Any]) -> Union[List[str], List[Dict[str, Any]]]:
     """
     Vectorize the inputs and obtain predictions from the loaded SVM model.
 
@@ -92,6 +172,10 @@ def predict_fn(inputs: List[str], model_info: Dict[str, Any]) -> List[str]:
     class labels directly.  These labels correspond to the target values
     used during training (e.g. "NEGATIVO", "NEUTRO" or "POSITIVO").
 
+    In combined mode the texts are analyzed once for both variants and each
+    text gets a dictionary with this model's ``prediction``, every variant's
+    label under ``variants`` and whether they ``agree``.
+
     Parameters
     ----------
     inputs: List[str]
@@ -101,40 +185,64 @@ def predict_fn(inputs: List[str], model_info: Dict[str, Any]) -> List[str]:
 
     Returns
     -------
-    List[str]
-        The predicted class for each input text.
+    Union[List[str], List[Dict[str, Any]]]
+        The predicted class for each input text, or the combined-mode
+        dictionary of each text described above.
     """
+    if "variants" in model_info:
+        logger.info("Vectorizando %d textos para %d modelos...", len(inputs), len(model_info["variants"]))
+        return _predict_combined(inputs, model_info)
+
     model = model_info["model"]
     vectorizer = model_info["vectorizer"]
 
     logger.info("Vectorizando %d textos...", len(inputs))
-    X = vectorizer.transform(inputs)
+    with stage("vectorize"):
+        X = vectorizer.transform(inputs)
     logger.info("Realizando predicciones...")
-    predictions = model.predict(X)
+    with stage("model"):
+        predictions = model.predict(X)
     # ``model.predict`` returns a numpy array; convert to a Python list of strings
     return [str(p) for p in predictions]
 
 
-def output_fn(prediction: List[str], response_content_type: str) -> str:
+@profiled("output_fn")
+@instrumented("output_fn")
+def output_fn(prediction: Union[List[str], List[Dict[str, Any]]], response_content_type: str) -> Union[str, bytes]:
     """
     Serialize the predictions back to JSON.
 
-    The response body will always be of the form ``{"predictions": <list>}``.
+    The response body will always be of the form ``{"predictions": <list>}``;
+    in combined mode the JSON also carries ``variants``, ``agreement`` and
+    ``agreement_rate``, while the compact formats keep only ``predictions``.
+    ``application/x-msgpack`` carries the same object in binary form; the SVM
+    has no probabilities, so ``application/x-npy`` is rejected (see
+    ``serialization.py``).
 
     Parameters
     ----------
-    prediction: List[str]
-        A list of predicted labels returned by ``predict_fn``.
+    prediction: Union[List[str], List[Dict[str, Any]]]
+        The predicted labels (or the combined-mode dictionaries) returned by ``predict_fn``.
     response_content_type: str
-        The requested MIME type of the response.  Only ``application/json`` is supported.
+        The requested MIME type of the response.
 
     Returns
     -------
-    str
-        A JSON string containing the prediction results.
+    Union[str, bytes]
+        The serialized prediction results.
     """
     logger.info("Serializando salida para content-type: %s", response_content_type)
-    if response_content_type != "application/json":
-        raise ValueError(f"Content-Type no soportado: {response_content_type}")
-
-    return json.dumps({"predictions": prediction}, ensure_ascii=False)
\ No newline at end of file
+    if prediction and isinstance(prediction[0], dict):
+        labels = [p["prediction"] for p in prediction]
+        if not is_default(response_content_type):
+            return encode_labels(labels, response_content_type)
+        agreement = [p["agreement"] for p in prediction]
+        return json.dumps({
+            "predictions": labels,
+            "variants": {name: [p["variants"][name] for p in prediction] for name in prediction[0]["variants"]},
+            "agreement": agreement,
+            "agreement_rate": sum(agreement) / len(agreement),
+        }, ensure_ascii=False)
+    if is_default(response_content_type):
+        return json.dumps({"predictions": prediction}, ensure_ascii=False)
+    return encode_labels(prediction, response_content_type)
\ No newline at end of file
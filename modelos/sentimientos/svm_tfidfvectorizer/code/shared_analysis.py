@@ -0,0 +1,75 @@
+"""
+Análisis de texto compartido entre varios vectorizadores de la familia ``CountVectorizer``.
+
+Con ``svm_countvectorizer`` y ``svm_tfidfvectorizer`` sirviendo juntos (modo
+combinado de ``inference.py``), cada ``vectorizer.transform`` repetiría sobre
+el mismo texto el preprocesado, la tokenización, los n-gramas y la búsqueda
+en el vocabulario.  ``SharedAnalysis`` cuenta los términos una sola vez con
+un ``CountVectorizer`` sobre la unión de los vocabularios y de esa matriz
+saca, por selección de columnas, la entrada exacta de cada modelo:
+
+  - ``CountVectorizer``: los conteos (o 1/0 si ``binary=True``);
+  - ``TfidfVectorizer``: los mismos conteos pasados por su ``TfidfTransformer``
+    ajustado, que es lo que hace ``TfidfVectorizer.transform``.
+
+Solo se puede compartir si todos analizan el texto igual (mismos parámetros
+de ``ANALYSIS_PARAMS``); si no, el constructor lanza ``ValueError`` y el
+handler vuelve a un ``transform`` por modelo.
+
+Este archivo se copia idéntico en cada ``code/`` SVM.
+"""
+
+from typing import Any, Dict
+
+import numpy as np
+
+# Parámetros que determinan qué términos salen de un texto
+ANALYSIS_PARAMS = ("input", "encoding", "decode_error", "strip_accents", "lowercase", "preprocessor",
+                   "tokenizer", "analyzer", "stop_words", "token_pattern", "ngram_range")
+
+
+class SharedAnalysis:
+    """Un solo conteo de términos por texto, repartido entre varios vectorizadores ajustados."""
+
+    def __init__(self, vectorizers: Dict[str, Any]):
+        from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+        if not vectorizers:
+            raise ValueError("No hay vectorizadores que compartir")
+        for name, vectorizer in vectorizers.items():
+            if not isinstance(vectorizer, CountVectorizer) or not hasattr(vectorizer, "vocabulary_"):
+                raise ValueError(f"{name}: {type(vectorizer).__name__} no es un CountVectorizer ajustado")
+        params = [{p: v.get_params()[p] for p in ANALYSIS_PARAMS} for v in vectorizers.values()]
+        if any(p != params[0] for p in params[1:]):
+            raise ValueError(f"Los vectorizadores analizan el texto distinto: {params}")
+
+        union: Dict[str, int] = {}
+        for vectorizer in vectorizers.values():
+            for term in vectorizer.vocabulary_:
+                union.setdefault(term, len(union))
+        self.counter = CountVectorizer(vocabulary=union, **params[0])
+        self._TfidfVectorizer = TfidfVectorizer
+        self.vectorizers = vectorizers
+        # Columna j de cada vectorizador = columna columns[name][j] de la unión
+        self.columns = {}
+        for name, vectorizer in vectorizers.items():
+            columns = np.empty(len(vectorizer.vocabulary_), dtype=np.intp)
+            for term, j in vectorizer.vocabulary_.items():
+                columns[j] = union[term]
+            self.columns[name] = columns
+        self.vocabulary_size = len(union)
+
+    def transform(self, texts) -> Dict[str, Any]:
+        """Matriz de entrada de cada vectorizador, igual a su propio ``transform(texts)``."""
+        counts = self.counter.transform(texts)
+        features = {}
+        for name, vectorizer in self.vectorizers.items():
+            X = counts[:, self.columns[name]]
+            X.sort_indices()
+            if vectorizer.binary:
+                X.data.fill(1)
+            X = X.astype(vectorizer.dtype, copy=False)
+            if isinstance(vectorizer, self._TfidfVectorizer):
+                X = vectorizer._tfidf.transform(X, copy=False)
+            features[name] = X
+        return features
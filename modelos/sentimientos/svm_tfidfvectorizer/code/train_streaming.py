@@ -0,0 +1,216 @@
+"""
+Entrenamiento por bloques (out-of-core) de los SVM de sentimientos.
+
+El notebook ajusta ``CountVectorizer``/``TfidfVectorizer`` + ``LinearSVC`` con
+todo el corpus en memoria y cada dato nuevo obliga a reentrenar desde cero.
+Aquí el corpus (JSONL o CSV) se lee por bloques de ``--chunk-size`` filas y
+un ``SGDClassifier(loss="hinge")`` (un SVM lineal) aprende con
+``partial_fit``; la memoria queda acotada por el bloque y el tamaño de los
+coeficientes (``n_clases × --n-features``), no por el corpus.
+
+Vectorizadores (``--vectorizer``):
+  hashing-count  ``HashingVectorizer`` sin normalizar: conteos como
+                 ``CountVectorizer``, sin vocabulario que ajustar.
+  hashing-tfidf  ``HashingVectorizer`` + ``TfidfTransformer``; una primera
+                 pasada cuenta la frecuencia de documento de cada columna
+                 para fijar el idf (misma fórmula suavizada que
+                 ``TfidfVectorizer``).
+  frozen         un vectorizador ya ajustado (``--vocabulary-from``, p. ej. el
+                 ``vectorizer.joblib`` actual) con su vocabulario congelado.
+
+``--update`` continúa el entrenamiento del ``model.joblib`` existente con
+datos nuevos, reutilizando su ``vectorizer.joblib`` (el idf queda como se
+fijó al principio).
+
+En la primera pasada cada bloque se evalúa antes de aprender de él
+(validación progresiva), así que esa precisión es sobre textos no vistos; con
+``--epochs`` > 1 las pasadas siguientes ya conocen el corpus y no la
+informan (``progressive_accuracy`` null).  Se escriben ``model.joblib`` y
+``vectorizer.joblib`` en ``--model-dir``, que es obligatorio para no pisar por
+descuido los artefactos del notebook: el ``model_fn`` de ``inference.py`` los
+carga sin cambios (solo usa
+``vectorizer.transform`` y ``model.predict``).  El historial va a
+``train_history.json``, que ``build_artifacts.py`` no empaqueta.
+
+Este archivo se copia idéntico en ``svm_countvectorizer/code`` y
+``svm_tfidfvectorizer/code``.
+
+Uso:
+  python modelos/sentimientos/svm_tfidfvectorizer/code/train_streaming.py --data reviews.jsonl \
+    --model-dir build/svm_tfidf_streaming
+  python modelos/sentimientos/svm_countvectorizer/code/train_streaming.py --data dataset.csv \
+    --model-dir build/svm_count_streaming --text-column text --label-column sentiment_label --epochs 3
+  python modelos/sentimientos/svm_tfidfvectorizer/code/train_streaming.py --data nuevas.jsonl \
+    --model-dir build/svm_tfidf_streaming --update
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import joblib
+import numpy as np
+
+# Directorio del modelo que acompaña a este script: decide el --vectorizer por defecto
+PACKAGED_MODEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CLASSES = ["NEGATIVO", "NEUTRO", "POSITIVO"]
+HISTORY = "train_history.json"
+
+
+def read_chunks(path: str, text_column: str, label_column: str, chunk_size: int) -> Iterator[Tuple[List[str], List[str]]]:
+    """Bloques ``(textos, etiquetas)`` de un JSONL o CSV, sin cargar el archivo entero."""
+    if path.endswith((".jsonl", ".json")):
+        texts, labels = [], []
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                texts.append(str(row[text_column]))
+                labels.append(str(row[label_column]))
+                if len(texts) == chunk_size:
+                    yield texts, labels
+                    texts, labels = [], []
+        if texts:
+            yield texts, labels
+        return
+
+    import pandas as pd
+
+    for frame in pd.read_csv(path, usecols=[text_column, label_column], chunksize=chunk_size):
+        frame = frame.dropna()
+        yield frame[text_column].astype(str).tolist(), frame[label_column].astype(str).tolist()
+
+
+def hashing_vectorizer(n_features: int):
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    # Mismo análisis que CountVectorizer() (minúsculas, token_pattern por defecto);
+    # alternate_sign=False y norm=None: conteos no negativos
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+
+
+def fit_hashing_tfidf(chunks: Iterator[Tuple[List[str], List[str]]], n_features: int):
+    """Pipeline hashing + tf-idf con el idf de una pasada por el corpus."""
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.pipeline import Pipeline
+
+    hashing = hashing_vectorizer(n_features)
+    document_frequency = np.zeros(n_features, dtype=np.int64)
+    documents = 0
+    for texts, _ in chunks:
+        X = hashing.transform(texts)
+        # El hashing suma los términos repetidos: cada (fila, columna) aparece una vez
+        document_frequency += np.bincount(X.indices, minlength=n_features)
+        documents += X.shape[0]
+
+    tfidf = TfidfTransformer()
+    tfidf.fit(sparse.csr_matrix((1, n_features)))
+    # smooth_idf=True, como TfidfVectorizer
+    tfidf.idf_ = np.log((1 + documents) / (1 + document_frequency)) + 1.0
+    return Pipeline([("hashing", hashing), ("tfidf", tfidf)]), documents
+
+
+def _save_atomic(obj: Any, path: str) -> None:
+    tmp = f"{path}.tmp"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", required=True, help="Corpus JSONL (un objeto por línea) o CSV")
+    parser.add_argument("--model-dir", required=True, help="Destino de model.joblib y vectorizer.joblib")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--label-column", default="label")
+    parser.add_argument("--classes", nargs="+", default=DEFAULT_CLASSES, help="Todas las etiquetas posibles")
+    parser.add_argument("--vectorizer", choices=["hashing-count", "hashing-tfidf", "frozen"],
+                        help="Por defecto, hashing-tfidf junto al modelo tf-idf y si no hashing-count")
+    parser.add_argument("--vocabulary-from", help="vectorizer.joblib ajustado, para --vectorizer frozen")
+    parser.add_argument("--n-features", type=int, default=2 ** 20, help="Columnas del hashing")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--epochs", type=int, default=1, help="Pasadas por el corpus")
+    parser.add_argument("--alpha", type=float, default=1e-5, help="Regularización del SGDClassifier")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--update", action="store_true", help="Continúa el model.joblib existente con datos nuevos")
+    args = parser.parse_args()
+
+    from sklearn.linear_model import SGDClassifier
+
+    if args.vectorizer is None:
+        args.vectorizer = "hashing-tfidf" if "tfidf" in os.path.basename(PACKAGED_MODEL_DIR) else "hashing-count"
+
+    def chunks():
+        return read_chunks(args.data, args.text_column, args.label_column, args.chunk_size)
+
+    model_path = os.path.join(args.model_dir, "model.joblib")
+    vectorizer_path = os.path.join(args.model_dir, "vectorizer.joblib")
+    history: List[Dict[str, Any]] = []
+    if args.update:
+        model = joblib.load(model_path)
+        if not hasattr(model, "partial_fit"):
+            parser.error(f"{model_path} es un {type(model).__name__}, que no admite partial_fit; "
+                         "entrena primero con este script")
+        vectorizer = joblib.load(vectorizer_path)
+        history_path = os.path.join(args.model_dir, HISTORY)
+        if os.path.exists(history_path):
+            with open(history_path, encoding="utf-8") as fh:
+                history = json.load(fh).get("history", [])
+    else:
+        if args.vectorizer == "hashing-count":
+            vectorizer = hashing_vectorizer(args.n_features)
+        elif args.vectorizer == "hashing-tfidf":
+            started = time.perf_counter()
+            vectorizer, documents = fit_hashing_tfidf(chunks(), args.n_features)
+            print(f"idf calculado sobre {documents} textos en {time.perf_counter() - started:.1f} s", flush=True)
+        else:
+            if not args.vocabulary_from:
+                parser.error("--vectorizer frozen requiere --vocabulary-from")
+            vectorizer = joblib.load(args.vocabulary_from)
+        model = SGDClassifier(loss="hinge", alpha=args.alpha, random_state=args.seed)
+
+    classes = np.array(args.classes)
+    rng = np.random.default_rng(args.seed)
+    for epoch in range(args.epochs):
+        seen, correct, evaluated = 0, 0, 0
+        started = time.perf_counter()
+        for texts, labels in chunks():
+            X = vectorizer.transform(texts)
+            y = np.asarray(labels)
+            unknown = set(y) - set(classes)
+            if unknown:
+                raise SystemExit(f"Etiquetas fuera de --classes: {sorted(unknown)}")
+            if epoch == 0 and hasattr(model, "coef_"):
+                # Validación progresiva: el bloque se evalúa antes de aprender de él;
+                # desde la segunda pasada todos los textos ya se vieron
+                correct += int((model.predict(X) == y).sum())
+                evaluated += len(y)
+            order = rng.permutation(len(y))
+            model.partial_fit(X[order], y[order], classes=classes)
+            seen += len(y)
+        elapsed = time.perf_counter() - started
+        record = {
+            "epoch": len(history) + 1,
+            "data": os.path.basename(args.data),
+            "texts": seen,
+            "progressive_accuracy": round(correct / evaluated, 6) if evaluated else None,
+            "seconds": round(elapsed, 2),
+            "texts_per_s": round(seen / elapsed, 1) if elapsed else None,
+        }
+        history.append(record)
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+
+    os.makedirs(args.model_dir, exist_ok=True)
+    _save_atomic(model, model_path)
+    if not args.update:
+        _save_atomic(vectorizer, vectorizer_path)
+    with open(os.path.join(args.model_dir, HISTORY), "w", encoding="utf-8") as fh:
+        json.dump({"vectorizer": type(vectorizer).__name__, "history": history}, fh, indent=2, ensure_ascii=False)
+    print(f"Modelo guardado en {model_path}")
+
+
+if __name__ == "__main__":
+    main()
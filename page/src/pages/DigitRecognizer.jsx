@@ -5,6 +5,9 @@ import exampleDigitImg from '../assets/digit.png'; // Using an example digit ima
 
 const S3_SAMPLES_BASE = 'https://test-data-model-sagemaker.s3.us-east-1.amazonaws.com/mnist_samples';
 const S3_MANIFEST_URL = `${S3_SAMPLES_BASE}/manifest.txt`;
+// Predicciones precalculadas de las muestras (scripts/download_mnist_samples.py)
+const S3_PREDICTIONS_URL = `${S3_SAMPLES_BASE}/predictions.json`;
+const INDEX_MODEL_KEYS = { clasico: 'mnist_classical', hibrido: 'mnist_quantum' };
 
 const shuffleArray = (arr) => {
   const copy = [...arr];
@@ -24,6 +27,9 @@ const DigitRecognizer = () => {
   const [examples, setExamples] = useState([
     { type: 'image', value: exampleDigitImg, alt: 'Número 7 de ejemplo' },
   ]);
+  const [predictionIndex, setPredictionIndex] = useState(null);
+  // Muestra cargada en el canvas ({ name, sha256 }); se olvida al dibujar o borrar
+  const [selectedSample, setSelectedSample] = useState(null);
 
   const API_ENDPOINTS = {
     clasico: 'https://qigfixb3zd.execute-api.us-east-1.amazonaws.com/default/predict/mnist_classical',
@@ -66,6 +72,13 @@ const DigitRecognizer = () => {
     loadRandomExamples();
   }, [loadRandomExamples]);
 
+  useEffect(() => {
+    fetch(S3_PREDICTIONS_URL)
+      .then((res) => (res.ok ? res.json() : null))
+      .then((index) => setPredictionIndex(index?.samples ? index : null))
+      .catch((err) => console.warn('Sin índice de predicciones MNIST:', err));
+  }, []);
+
   const getCoords = (event) => {
     const canvas = canvasRef.current;
     const rect = canvas.getBoundingClientRect();
@@ -77,6 +90,7 @@ const DigitRecognizer = () => {
   };
 
   const startDrawing = (event) => {
+    setSelectedSample(null);
     const { offsetX, offsetY } = getCoords(event);
     getContext().beginPath();
     getContext().moveTo(offsetX, offsetY);
@@ -101,21 +115,58 @@ const DigitRecognizer = () => {
     context.fillStyle = 'black';
     context.fillRect(0, 0, context.canvas.width, context.canvas.height);
     setPredictions([]);
+    setSelectedSample(null);
+  };
+
+  const toTop3 = (probabilities) => probabilities
+    .map((prob, index) => ({ digit: index, probability: parseFloat(prob) }))
+    .sort((a, b) => b.probability - a.probability)
+    .slice(0, 3);
+
+  // SHA-256 en hexadecimal, como el que escribe scripts/download_mnist_samples.py
+  const sha256Hex = async (buffer) => {
+    if (!window.crypto?.subtle) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
   };
 
-  const loadAndDrawImage = (imageUrl) => {
+  const loadAndDrawImage = async (imageUrl) => {
     clearCanvas();
     const context = getContext();
+    // Se descargan los bytes para comparar su hash con el del índice de predicciones
+    let sha256 = null;
+    let src = imageUrl;
+    try {
+      const res = await fetch(imageUrl);
+      if (res.ok) {
+        const bytes = await res.arrayBuffer();
+        sha256 = await sha256Hex(bytes);
+        src = URL.createObjectURL(new Blob([bytes]));
+      }
+    } catch (err) {
+      console.warn('No se pudo verificar la muestra:', err);
+    }
     const img = new Image();
     img.crossOrigin = "anonymous";
-    img.src = imageUrl;
+    img.src = src;
     img.onload = () => {
       // Scale image to fit canvas
       context.drawImage(img, 0, 0, context.canvas.width, context.canvas.height);
+      if (src !== imageUrl) URL.revokeObjectURL(src);
+      setSelectedSample(sha256 ? { name: imageUrl.split('/').pop(), sha256 } : null);
     };
   };
 
   const handleSubmit = async () => {
+    // Muestra del carrusel sin modificar y con el mismo contenido que se indexó:
+    // respuesta precalculada, sin invocar el modelo
+    const entry = selectedSample && predictionIndex?.samples?.[selectedSample.name];
+    const cached = entry?.sha256 === selectedSample?.sha256 ? entry?.[INDEX_MODEL_KEYS[model]] : null;
+    if (Array.isArray(cached?.probabilities)) {
+      setPredictions(toTop3(cached.probabilities));
+      return;
+    }
+
     setIsLoading(true);
     setPredictions([]);
     const tempCanvas = document.createElement('canvas');
@@ -139,11 +190,7 @@ const DigitRecognizer = () => {
         setPredictions([]);
         return;
       }
-      const top3 = probabilities
-        .map((prob, index) => ({ digit: index, probability: parseFloat(prob) }))
-        .sort((a, b) => b.probability - a.probability)
-        .slice(0, 3);
-      setPredictions(top3);
+      setPredictions(toTop3(probabilities));
     } catch (error) {
       console.error("Error al realizar la predicción:", error);
     } finally {
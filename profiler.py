@@ -0,0 +1,245 @@
+"""
+Perfilador por muestreo bajo demanda para endpoints en vivo.
+
+Un hilo aparte toma ``sys._current_frames()`` cada ``PROFILE_INTERVAL_MS`` y
+cuenta las pilas de Python observadas; no instrumenta cada llamada, así que
+el costo es proporcional a la frecuencia de muestreo y no al código perfilado.
+Las pilas nativas (kernels de torch, OpenCV) aparecen como la función de
+Python que las llamó.
+
+Se activa por petición:
+  - con ``"profile": true`` en el JSON de entrada (o la cabecera ``X-Profile``
+    en la Lambda), o
+  - para una fracción del tráfico con ``PROFILE_SAMPLE_RATE`` (0.0 a 1.0).
+
+Variables de entorno:
+  PROFILE_SAMPLE_RATE   fracción de peticiones perfiladas (por defecto 0)
+  PROFILE_INTERVAL_MS   intervalo de muestreo (por defecto 5 ms)
+  PROFILE_FORMAT        "collapsed" (flamegraph.pl / speedscope) o "speedscope" (JSON)
+  PROFILE_DIR           directorio donde escribir los perfiles; vacío = al log
+  PROFILE_MAX_SECONDS   corte de seguridad si la petición nunca llega a output_fn
+  PROFILE_NAME          prefijo de los archivos de perfil (por defecto, el modelo)
+
+En los handlers, ``profiled("input_fn")`` arranca el perfilador y
+``profiled("output_fn")`` lo detiene y emite el perfil, cubriendo
+input_fn → predict_fn → output_fn.  Se muestrean todos los hilos de Python
+del proceso (el servidor de SageMaker atiende una petición por worker).
+
+Este archivo se copia idéntico en cada ``code/`` y en la raíz (Lambda).
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+FORMAT = os.environ.get("PROFILE_FORMAT", "collapsed").lower()
+OUTPUT_DIR = os.environ.get("PROFILE_DIR", "")
+MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "30"))
+# Nombre de los perfiles de petición; por defecto, el directorio del modelo
+PROFILE_NAME = os.environ.get("PROFILE_NAME") or os.path.basename(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILE_FIELD = "profile"
+PROFILE_HEADER = "x-profile"
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+_local = threading.local()
+
+Frame = Tuple[str, str, int]
+
+
+class SamplingProfiler:
+    """Cuenta pilas de Python de todos los hilos (salvo el propio) a intervalos fijos."""
+
+    def __init__(self, name: str, interval_ms: float = INTERVAL_MS, max_seconds: float = MAX_SECONDS):
+        self.name = name
+        self.interval = max(interval_ms, 0.5) / 1000.0
+        self.max_seconds = max_seconds
+        self.counts: "collections.Counter[Tuple[Frame, ...]]" = collections.Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{name}", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        deadline = self.started + self.max_seconds
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                self.counts[tuple(stack)] += 1
+            self.samples += 1
+            if time.perf_counter() > deadline:
+                logger.warning("Perfil '%s' detenido tras %.0f s sin cerrarse", self.name, self.max_seconds)
+                break
+
+    def collapsed(self) -> str:
+        """Formato de pilas colapsadas: ``raiz;...;hoja cuenta`` por línea."""
+        lines = []
+        for stack, count in self.counts.most_common():
+            names = ";".join(f"{fn} ({os.path.basename(path)}:{line})" for fn, path, line in stack)
+            lines.append(f"{names} {count}")
+        return "\n".join(lines)
+
+    def speedscope(self) -> Dict[str, Any]:
+        """Perfil ``sampled`` en el formato JSON de speedscope, con peso en milisegundos."""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Frame, int] = {}
+        samples, weights = [], []
+        interval_ms = self.interval * 1000.0
+        for stack, count in self.counts.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            samples.append(ids)
+            weights.append(count * interval_ms)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "profiler.py",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(self.duration * 1000.0, 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+def sampled() -> bool:
+    """Decide si perfilar una petición sin marca explícita según ``PROFILE_SAMPLE_RATE``."""
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+def is_true(value: Any) -> bool:
+    return value is True or str(value).strip().lower() in _TRUE_VALUES
+
+
+def body_requests_profile(body: Any, content_type: str = "application/json") -> bool:
+    """``True`` si el cuerpo JSON trae ``"profile": true``; solo se parsea si contiene la clave."""
+    if content_type != "application/json" or body is None:
+        return False
+    needle = f'"{PROFILE_FIELD}"'
+    if isinstance(body, (bytes, bytearray)):
+        if needle.encode() not in body:
+            return False
+    elif needle not in str(body):
+        return False
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(payload, dict) and is_true(payload.get(PROFILE_FIELD))
+
+
+def emit(profiler: SamplingProfiler, sink: Callable[[str], Any] = logger.info) -> Optional[str]:
+    """Escribe el perfil en ``PROFILE_DIR`` (devuelve la ruta) o lo manda a ``sink``."""
+    summary = (f"Perfil '{profiler.name}': {profiler.samples} muestras en "
+               f"{profiler.duration * 1000.0:.1f} ms")
+    if FORMAT == "speedscope":
+        content, extension = json.dumps(profiler.speedscope()), "speedscope.json"
+    else:
+        content, extension = profiler.collapsed(), "collapsed.txt"
+    if OUTPUT_DIR:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(OUTPUT_DIR, f"{profiler.name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+                                        f"-{threading.get_ident()}.{extension}")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        sink(f"{summary} → {path}")
+        return path
+    sink(f"{summary}\n{content}")
+    return None
+
+
+@contextlib.contextmanager
+def profile_block(name: str, enabled: bool, sink: Callable[[str], Any] = logger.info):
+    """Perfila el bloque si ``enabled``; en otro caso no hace nada."""
+    if not enabled:
+        yield None
+        return
+    profiler = SamplingProfiler(name).start()
+    try:
+        yield profiler
+    finally:
+        emit(profiler.stop(), sink)
+
+
+def profiled(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorador para los handlers de SageMaker.
+
+    En ``input_fn`` arranca un perfil si el cuerpo lo pide o la petición cae en
+    la muestra; en ``output_fn`` lo detiene y lo emite.  Las demás funciones
+    se devuelven sin envolver.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if name == "input_fn":
+            @functools.wraps(func)
+            def start_wrapper(request_body, request_content_type, *args, **kwargs):
+                dangling = getattr(_local, "profiler", None)
+                if dangling is not None:  # la petición anterior falló antes de output_fn
+                    dangling.stop()
+                _local.profiler = None
+                if body_requests_profile(request_body, request_content_type) or sampled():
+                    _local.profiler = SamplingProfiler(PROFILE_NAME).start()
+                return func(request_body, request_content_type, *args, **kwargs)
+
+            return start_wrapper
+
+        if name == "output_fn":
+            @functools.wraps(func)
+            def stop_wrapper(*args, **kwargs):
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler = getattr(_local, "profiler", None)
+                    if profiler is not None:
+                        _local.profiler = None
+                        emit(profiler.stop())
+
+            return stop_wrapper
+
+        return func
+
+    return decorator
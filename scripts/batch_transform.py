@@ -0,0 +1,364 @@
+"""
+Transformación por lotes offline con cualquier handler de ``modelos/``.
+
+Ejecuta ``input_fn → predict_fn → output_fn`` sobre una carpeta, un tarball o
+un JSONL de entradas, con un pool de procesos donde cada worker llama a
+``model_fn`` una sola vez.  Los registros se agrupan en chunks y cada chunk
+entra en una sola llamada a ``predict_fn`` cuando el handler admite lotes
+(mismas reglas que ``serve_local.py``).
+
+Entradas (un registro por archivo o por línea):
+  - carpeta o tarball (.tar, .tar.gz, .tgz): cada archivo es un registro; el
+    Content-Type se deduce de la extensión (.jpg → image/jpeg...) o de
+    ``--content-type``.  ``--wrap input`` envuelve cada archivo como
+    ``{"input": <base64>}`` (o el texto, para .txt), que es lo que esperan
+    los handlers MNIST y SVM;
+  - JSONL: cada línea es un cuerpo ``application/json`` (SplitType=Line).
+
+Salida con el formato de SageMaker Batch Transform (AssembleWith=Line): un
+archivo ``<entrada>.out`` con una línea por registro, en el orden de entrada.
+Con ``--unordered`` las líneas se escriben a medida que terminan los chunks y
+cada una es ``{"id": ..., "output": ...}`` para no perder la asociación
+(``--join-id`` añade el id también en modo ordenado).  Un registro que falla
+produce ``{"id": ..., "error": ...}`` en lugar de abortar el trabajo.
+
+Cada chunk terminado se guarda en ``<salida>.parts/``; al relanzar con la
+misma salida se saltan los chunks ya hechos (``--no-resume`` empieza de cero).
+``<salida>.parts/manifest.json`` guarda el tamaño de chunk, la identidad de
+la entrada y las opciones que cambian las líneas; si no coinciden con las de
+la corrida nueva, el trabajo se niega a reanudar.
+
+A los workers nunca hay más de ``2 × --workers`` chunks enviados sin
+terminar: la entrada se lee a medida que se procesa, no entera en memoria.
+
+Uso:
+  python scripts/batch_transform.py --model-dir modelos/neumonia \
+    --input radiografias.tar.gz --output-dir salida --workers 4 --chunk-size 16
+  python scripts/batch_transform.py --model-dir modelos/sentimientos/svm_tfidfvectorizer \
+    --input reseñas.jsonl --output-dir salida --chunk-size 512
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import sys
+import tarfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from handler_loader import DEFAULT_CONTENT_TYPE, Handler
+
+
+EXTENSION_CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".json": "application/json",
+    ".txt": "text/plain",
+    ".csv": "text/csv",
+}
+
+# Formatos de serialization.py que no caben en una línea de texto
+BINARY_ACCEPTS = ("application/x-npy", "application/x-msgpack")
+
+# (id, cuerpo, content-type)
+Record = Tuple[str, bytes, str]
+
+MANIFEST = "manifest.json"
+
+_worker_handler: Optional[Handler] = None
+_worker_accept = DEFAULT_CONTENT_TYPE
+
+
+def _content_type_for(name: str, default: Optional[str]) -> str:
+    if default:
+        return default
+    return EXTENSION_CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+
+
+def iter_sources(path: str) -> Iterator[Tuple[str, Callable[[], bytes], bool]]:
+    """
+    Recorre la entrada y produce ``(id, cargador, es_linea)``.
+
+    El cargador lee el cuerpo solo cuando hace falta, para que reanudar no
+    tenga que leer los registros de chunks ya terminados.
+    """
+    if os.path.isdir(path):
+        for root, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, path), (lambda p=full: open(p, "rb").read()), False
+    elif tarfile.is_tarfile(path):
+        archive = tarfile.open(path, "r:*")
+        for member in sorted((m for m in archive.getmembers() if m.isfile()), key=lambda m: m.name):
+            yield member.name, (lambda m=member: archive.extractfile(m).read()), False
+    else:
+        with open(path, "rb") as fh:
+            for number, line in enumerate(fh):
+                line = line.rstrip(b"\r\n")
+                if line.strip():
+                    yield f"{os.path.basename(path)}:{number + 1}", (lambda data=line: data), True
+
+
+def wrap_body(record_id: str, body: bytes, key: str) -> bytes:
+    """Envuelve un archivo como ``{key: base64}`` (o ``{key: texto}`` para .txt)."""
+    if record_id.lower().endswith(".txt"):
+        value = body.decode("utf-8").strip()
+    else:
+        value = base64.b64encode(body).decode("ascii")
+    return json.dumps({key: value}, ensure_ascii=False).encode("utf-8")
+
+
+def iter_chunks(path: str, chunk_size: int, content_type: Optional[str], wrap: Optional[str],
+                skip: Callable[[int], bool]) -> Iterator[Tuple[int, List[Record]]]:
+    """Agrupa los registros en chunks numerados; los chunks ``skip`` no se leen."""
+    pending: List[Tuple[str, Callable[[], bytes], bool]] = []
+    index = 0
+
+    def materialize(items):
+        records = []
+        for record_id, load, is_line in items:
+            body = load()
+            if wrap and not is_line:
+                records.append((record_id, wrap_body(record_id, body, wrap), "application/json"))
+            else:
+                ctype = (content_type or DEFAULT_CONTENT_TYPE) if is_line else _content_type_for(record_id, content_type)
+                records.append((record_id, body, ctype))
+        return records
+
+    for item in iter_sources(path):
+        pending.append(item)
+        if len(pending) == chunk_size:
+            if not skip(index):
+                yield index, materialize(pending)
+            index += 1
+            pending = []
+    if pending and not skip(index):
+        yield index, materialize(pending)
+
+
+def count_records(path: str) -> int:
+    return sum(1 for _ in iter_sources(path))
+
+
+def _init_worker(model_dir: str, accept: str) -> None:
+    global _worker_handler, _worker_accept
+    # Cada worker carga el modelo una sola vez
+    _worker_handler = Handler(model_dir).load()
+    _worker_accept = accept
+
+
+def _process_chunk(task: Tuple[int, List[Record]]) -> Tuple[int, List[Tuple[str, Dict[str, str]]]]:
+    """Ejecuta un chunk; devuelve ``(índice, [(id, {"output"|"error": texto})])``."""
+    index, records = task
+    handler = _worker_handler
+    results: Dict[int, Dict[str, str]] = {}
+    inputs, positions = [], []
+    for position, (record_id, body, ctype) in enumerate(records):
+        try:
+            inputs.append(handler.input_fn(body, ctype))
+            positions.append(position)
+        except Exception as e:
+            results[position] = {"error": f"input_fn: {e}"}
+
+    predictions = []
+    if inputs:
+        try:
+            predictions = handler.predict_many(inputs)
+        except Exception:
+            # Un registro malo no debe tumbar el chunk: se reintenta uno a uno
+            predictions = []
+            for data in inputs:
+                try:
+                    predictions.append(handler.predict_fn(data))
+                except Exception as e:
+                    predictions.append(e)
+
+    for position, prediction in zip(positions, predictions):
+        if isinstance(prediction, Exception):
+            results[position] = {"error": f"predict_fn: {prediction}"}
+            continue
+        try:
+            output = handler.output_fn(prediction, _worker_accept)
+            if isinstance(output, bytes):
+                output = output.decode("utf-8")
+            results[position] = {"output": output.replace("\n", " ")}
+        except Exception as e:
+            results[position] = {"error": f"output_fn: {e}"}
+    return index, [(records[i][0], results[i]) for i in range(len(records))]
+
+
+def format_line(record_id: str, result: Dict[str, str], join_id: bool) -> str:
+    if "error" in result:
+        return json.dumps({"id": record_id, "error": result["error"]}, ensure_ascii=False)
+    if not join_id:
+        return result["output"]
+    try:
+        output = json.loads(result["output"])
+    except ValueError:
+        output = result["output"]
+    return json.dumps({"id": record_id, "output": output}, ensure_ascii=False)
+
+
+def input_identity(path: str) -> Dict[str, Any]:
+    """Ruta, tamaño y fecha de la entrada (de la carpeta, su número de archivos)."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    identity = {"path": path, "mtime": stat.st_mtime}
+    if os.path.isdir(path):
+        identity["files"] = sum(len(filenames) for _, _, filenames in os.walk(path))
+    else:
+        identity["size"] = stat.st_size
+    return identity
+
+
+def check_manifest(parts_dir: str, manifest: Dict[str, Any]) -> None:
+    """Guarda el manifiesto de una corrida nueva o exige que coincida al reanudar."""
+    path = os.path.join(parts_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as fh:
+            previous = json.load(fh)
+        if previous != manifest:
+            raise SystemExit(f"Los chunks de {parts_dir} son de otra corrida ({previous}); usa --no-resume")
+    else:
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=2, ensure_ascii=False)
+
+
+def _part_path(parts_dir: str, index: int) -> str:
+    return os.path.join(parts_dir, f"chunk-{index:07d}.jsonl")
+
+
+def write_part(parts_dir: str, index: int, lines: List[str]) -> None:
+    path = _part_path(parts_dir, index)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write("".join(line + "\n" for line in lines))
+    os.replace(tmp, path)
+
+
+class Progress:
+    def __init__(self, total: int, already_done: int, interval: float = 5.0):
+        self.total = total
+        self.done = already_done
+        self.errors = 0
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._processed = 0
+        self._last = 0.0
+
+    def update(self, records: int, errors: int) -> None:
+        self.done += records
+        self.errors += errors
+        self._processed += records
+        now = time.perf_counter()
+        if now - self._last >= self.interval or self.done >= self.total:
+            self._last = now
+            print(self.line(), flush=True)
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        rate = self._processed / elapsed if elapsed else 0.0
+        remaining = (self.total - self.done) / rate if rate else float("inf")
+        return (f"{self.done}/{self.total} registros ({self.done / max(self.total, 1):.1%}), "
+                f"{rate:.1f} reg/s, errores {self.errors}, restante ~{remaining:.0f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", required=True, help="Directorio del modelo (con code/inference.py)")
+    parser.add_argument("--input", required=True, help="Carpeta, tarball o JSONL")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=32, help="Registros por llamada a predict_fn")
+    parser.add_argument("--content-type", help="Content-Type de los archivos (por defecto, según extensión)")
+    parser.add_argument("--accept", default=DEFAULT_CONTENT_TYPE,
+                        help="Accept para output_fn (p. ej. 'application/json; top_k=1')")
+    parser.add_argument("--wrap", metavar="CLAVE", help="Envuelve cada archivo como JSON {CLAVE: base64|texto}")
+    parser.add_argument("--unordered", action="store_true", help="Escribe según terminan los chunks (con ids)")
+    parser.add_argument("--join-id", action="store_true", help="Incluye el id del registro en cada línea")
+    parser.add_argument("--no-resume", action="store_true", help="Descarta checkpoints previos")
+    args = parser.parse_args()
+    if args.accept.split(";")[0].strip().lower() in BINARY_ACCEPTS:
+        parser.error("La salida es una línea de texto por registro; para respuestas compactas usa "
+                     "'application/json; top_k=K' o 'application/json; format=dense'")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, os.path.basename(os.path.normpath(args.input)) + ".out")
+    parts_dir = output_path + ".parts"
+    if args.no_resume:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir, exist_ok=True)
+    join_id = args.join_id or args.unordered
+
+    total = count_records(args.input)
+    check_manifest(parts_dir, {
+        "input": input_identity(args.input), "records": total, "chunk_size": args.chunk_size,
+        "model_dir": os.path.abspath(args.model_dir), "content_type": args.content_type,
+        "accept": args.accept, "wrap": args.wrap, "join_id": join_id,
+    })
+    n_chunks = (total + args.chunk_size - 1) // args.chunk_size
+    done_chunks = {i for i in range(n_chunks) if os.path.exists(_part_path(parts_dir, i))}
+    already = sum(min(args.chunk_size, total - i * args.chunk_size) for i in done_chunks)
+    print(f"{total} registros en {n_chunks} chunks de {args.chunk_size}; "
+          f"{len(done_chunks)} chunks ya hechos", flush=True)
+
+    progress = Progress(total, already)
+    chunks = iter_chunks(args.input, args.chunk_size, args.content_type, args.wrap, lambda i: i in done_chunks)
+    stream = open(output_path, "w", encoding="utf-8") if args.unordered else None
+    if stream is not None:
+        # En modo desordenado lo ya hecho se vuelca primero
+        for i in sorted(done_chunks):
+            with open(_part_path(parts_dir, i), encoding="utf-8") as fh:
+                shutil.copyfileobj(fh, stream)
+
+    def handle(finished) -> None:
+        if isinstance(finished, BaseException):
+            raise finished
+        index, results = finished
+        lines = [format_line(record_id, result, join_id) for record_id, result in results]
+        write_part(parts_dir, index, lines)
+        if stream is not None:
+            stream.write("".join(line + "\n" for line in lines))
+            stream.flush()
+        progress.update(len(results), sum(1 for _, r in results if "error" in r))
+
+    # Ventana acotada de chunks en vuelo: ``imap`` leería toda la entrada en
+    # su hilo alimentador y encolaría los cuerpos en memoria.  Los chunks se
+    # escriben en su parte según terminan; el orden lo da el ensamblado final.
+    window = max(1, args.workers) * 2
+    completed: "queue.Queue" = queue.Queue()
+    in_flight = 0
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(args.workers, initializer=_init_worker, initargs=(args.model_dir, args.accept)) as pool:
+        for task in chunks:
+            while in_flight >= window:
+                handle(completed.get())
+                in_flight -= 1
+            pool.apply_async(_process_chunk, (task,), callback=completed.put, error_callback=completed.put)
+            in_flight += 1
+        while in_flight:
+            handle(completed.get())
+            in_flight -= 1
+
+    if stream is not None:
+        stream.close()
+    else:
+        with open(output_path, "w", encoding="utf-8") as out:
+            for i in range(n_chunks):
+                with open(_part_path(parts_dir, i), encoding="utf-8") as fh:
+                    shutil.copyfileobj(fh, out)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    print(progress.line())
+    print(f"Salida en {output_path}")
+    if progress.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
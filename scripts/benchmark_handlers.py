@@ -0,0 +1,276 @@
+"""
+Benchmark de los handlers de ``modelos/`` a nivel de función.
+
+Para cada handler carga su ``model_fn`` en un proceso aparte (así el pico de
+RSS es solo suyo), genera entradas representativas (``sample_inputs.py``) y
+mide por separado ``input_fn``, ``predict_fn`` y ``output_fn`` para cada
+combinación de tamaño de lote y concurrencia.  Un lote de tamaño ``b`` son
+``b`` peticiones de un elemento que se agrupan en una sola llamada a
+``predict_fn`` cuando el handler lo admite (mismas reglas que
+``serve_local.py``).  ``--concurrency`` es el número de lotes en vuelo a la
+vez (hilos cliente); ``--torch-threads`` barre los hilos intra-op de PyTorch:
+cada valor es un proceso aparte con ``TORCH_NUM_THREADS`` fijado antes de
+``model_fn`` (0 deja el plan del handler, ``THREAD_PLAN``).
+
+Memoria por configuración: ``rss_delta_mb`` es lo que creció el RSS durante
+la configuración y ``peak_rss_mb`` el pico del proceso dentro de ella (se
+reinicia antes de cada una escribiendo en ``/proc/self/clear_refs``; fuera
+de Linux queda en ``null``).
+
+Uso:
+  python scripts/benchmark_handlers.py --output bench/baseline.json
+  python scripts/benchmark_handlers.py --handlers neumonia svm_countvectorizer \
+    --batch-sizes 1 8 32 --concurrency 1 4 --torch-threads 1 2 4 --compare bench/baseline.json --threshold 0.10
+
+Con ``--compare`` se reportan las configuraciones cuya latencia p50/p95 sube o
+cuyo throughput baja más que ``--threshold`` respecto a la línea base, y el
+proceso termina con código 1 si hay regresiones.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from handler_loader import DEFAULT_CONTENT_TYPE, Handler, discover_handlers, rss_mb
+from sample_inputs import ROOT_DIR, samples_for
+
+
+STAGES = ("input_fn", "predict_fn", "output_fn", "total")
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Percentil ``q`` (0-100) con interpolación lineal sobre valores ya ordenados."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(values_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(values_ms)
+    return {
+        "p50": round(percentile(ordered, 50), 4),
+        "p95": round(percentile(ordered, 95), 4),
+        "p99": round(percentile(ordered, 99), 4),
+        "mean": round(sum(ordered) / len(ordered), 4) if ordered else 0.0,
+    }
+
+
+def reset_peak_rss() -> bool:
+    """Reinicia el pico de RSS del proceso (VmHWM); ``False`` si el sistema no lo permite."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Pico de RSS del proceso desde el último ``reset_peak_rss`` (VmHWM, en MiB)."""
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def _run_batch(handler: Handler, samples, accept: str = DEFAULT_CONTENT_TYPE) -> Dict[str, float]:
+    """Una llamada completa sobre un lote; devuelve milisegundos por etapa y bytes de respuesta."""
+    t0 = time.perf_counter()
+    inputs = [handler.input_fn(s.body, s.content_type) for s in samples]
+    t1 = time.perf_counter()
+    predictions = handler.predict_many(inputs)
+    t2 = time.perf_counter()
+    response_bytes = 0
+    for prediction in predictions:
+        response_bytes += len(handler.output_fn(prediction, accept))
+    t3 = time.perf_counter()
+    return {
+        "input_fn": (t1 - t0) * 1000.0,
+        "predict_fn": (t2 - t1) * 1000.0,
+        "output_fn": (t3 - t2) * 1000.0,
+        "total": (t3 - t0) * 1000.0,
+        "response_bytes": response_bytes,
+    }
+
+
+def bench_handler(model_dir: str, batch_sizes: List[int], concurrency: List[int], iterations: int,
+                  warmup: int, seed: int, xray_dir: Optional[str],
+                  accept: str = DEFAULT_CONTENT_TYPE, torch_threads: int = 0) -> Dict[str, Any]:
+    """Mide un handler en todas las configuraciones.  Se ejecuta en un proceso hijo."""
+    if torch_threads:
+        # Antes de importar el handler: thread_planner lee TORCH_NUM_THREADS al importar
+        os.environ["TORCH_NUM_THREADS"] = str(torch_threads)
+    handler = Handler(model_dir)
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    handler.load()
+    load_seconds = time.perf_counter() - t0
+    if torch_threads and "torch" in sys.modules:
+        # También para los handlers sin plan de hilos
+        sys.modules["torch"].set_num_threads(torch_threads)
+
+    results = []
+    for batch_size in batch_sizes:
+        samples = samples_for(handler.name, batch_size * iterations, seed, xray_dir)
+        batches = [samples[i * batch_size:(i + 1) * batch_size] for i in range(iterations)]
+        for _ in range(warmup):
+            _run_batch(handler, batches[0], accept)
+        for in_flight in concurrency:
+            peak_reset = reset_peak_rss()
+            rss_start = rss_mb()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=in_flight) as pool:
+                timings = list(pool.map(lambda b: _run_batch(handler, b, accept), batches))
+            elapsed = time.perf_counter() - started
+            result = {
+                "handler": handler.name,
+                "batch_size": batch_size,
+                "concurrency": in_flight,
+                "torch_threads": torch_threads or None,
+                "accept": accept,
+                "iterations": iterations,
+                "throughput_items_per_s": round(batch_size * iterations / elapsed, 3),
+                "response_bytes_per_item": round(sum(t["response_bytes"] for t in timings) / (batch_size * iterations), 1),
+                "rss_delta_mb": round(rss_mb() - rss_start, 1),
+                "peak_rss_mb": round(peak_rss_mb(), 1) if peak_reset else None,
+            }
+            for stage in STAGES:
+                result[stage] = summarize([t[stage] for t in timings])
+            results.append(result)
+            print(f"  {handler.name} b={batch_size} c={in_flight} tt={torch_threads or '-'}: total p50={result['total']['p50']:.2f} ms "
+                  f"p99={result['total']['p99']:.2f} ms, {result['throughput_items_per_s']:.1f} items/s",
+                  flush=True)
+    return {
+        "handler": handler.name,
+        "torch_threads": torch_threads or None,
+        "load_seconds": round(load_seconds, 3),
+        "model_rss_mb": round(rss_mb() - rss_before, 1),
+        "results": results,
+    }
+
+
+def _concurrency(result: Dict[str, Any]) -> int:
+    # Las líneas base anteriores llamaban "threads" a la concurrencia
+    return result.get("concurrency", result.get("threads"))
+
+
+def _config_key(result: Dict[str, Any]):
+    return (result["handler"], result["batch_size"], _concurrency(result), result.get("torch_threads"),
+            result.get("accept", DEFAULT_CONTENT_TYPE))
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Configuraciones que empeoran más que ``threshold`` (fracción) respecto a la línea base."""
+    base_results = {_config_key(r): r for h in baseline["handlers"] for r in h["results"]}
+    regressions = []
+    for handler in current["handlers"]:
+        for result in handler["results"]:
+            base = base_results.get(_config_key(result))
+            if base is None:
+                continue
+            checks = [(f"total.{q}", base["total"][q], result["total"][q], True) for q in ("p50", "p95")]
+            checks.append(("throughput", base["throughput_items_per_s"], result["throughput_items_per_s"], False))
+            for metric, before, after, higher_is_worse in checks:
+                if before <= 0:
+                    continue
+                change = (after - before) / before
+                if (change > threshold) if higher_is_worse else (change < -threshold):
+                    regressions.append({
+                        "handler": result["handler"],
+                        "batch_size": result["batch_size"],
+                        "concurrency": _concurrency(result),
+                        "torch_threads": result.get("torch_threads"),
+                        "metric": metric,
+                        "baseline": before,
+                        "current": after,
+                        "change": round(change, 4),
+                    })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models-root", default=str(ROOT_DIR / "modelos"))
+    parser.add_argument("--handlers", nargs="*", help="Nombres de handler (por defecto, todos)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4],
+                        help="Lotes en vuelo a la vez (hilos cliente, no hilos de PyTorch)")
+    parser.add_argument("--torch-threads", nargs="+", type=int, default=[0],
+                        help="Hilos intra-op de PyTorch, un proceso por valor (0: el plan del handler)")
+    parser.add_argument("--iterations", type=int, default=50, help="Lotes medidos por configuración")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accept", default=DEFAULT_CONTENT_TYPE,
+                        help="Accept para output_fn (p. ej. 'application/json; top_k=1', application/x-npy)")
+    parser.add_argument("--xray-dir", help="Radiografías reales para el handler de neumonía")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados (línea base)")
+    parser.add_argument("--compare", help="Línea base JSON contra la que comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regresión tolerada (fracción)")
+    args = parser.parse_args()
+
+    catalog = discover_handlers(args.models_root)
+    names = args.handlers or sorted(catalog)
+    unknown = [n for n in names if n not in catalog]
+    if unknown:
+        parser.error(f"Handlers desconocidos: {unknown}. Disponibles: {sorted(catalog)}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "batch_sizes": args.batch_sizes,
+            "concurrency": args.concurrency,
+            "torch_threads": args.torch_threads,
+            "iterations": args.iterations,
+        },
+        "handlers": [],
+    }
+    # Un proceso "spawn" por handler: imports, modelo y pico de RSS aislados
+    ctx = mp.get_context("spawn")
+    for name in names:
+        for torch_threads in args.torch_threads:
+            label = f"{name} (torch_threads={torch_threads})" if torch_threads else name
+            print(f"Benchmark de {label}...", flush=True)
+            with ctx.Pool(1) as pool:
+                try:
+                    report["handlers"].append(pool.apply(bench_handler, (
+                        catalog[name], args.batch_sizes, args.concurrency, args.iterations,
+                        args.warmup, args.seed, args.xray_dir, args.accept, torch_threads)))
+                except Exception as e:
+                    print(f"  {label} omitido: {e}", flush=True)
+                    report["handlers"].append({"handler": name, "torch_threads": torch_threads or None,
+                                               "error": str(e), "results": []})
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(report, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESIÓN {r['handler']} b={r['batch_size']} c={r['concurrency']} "
+                  f"tt={r['torch_threads'] or '-'} {r['metric']}: "
+                  f"{r['baseline']} → {r['current']} ({r['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"Sin regresiones mayores a {args.threshold:.0%} frente a {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
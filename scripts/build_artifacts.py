@@ -0,0 +1,299 @@
+"""
+Construye el ``model.tar.gz`` de un modelo de ``modelos/`` de forma reproducible.
+
+Reemplaza los ``tar -czvf`` manuales de ``procesos.md``:
+  1. Copia los artefactos y ``code/`` a un directorio de staging, sin
+     ``__pycache__``, ``.ipynb_checkpoints``, tarballs previos ni notebooks.
+  2. Convierte los pesos a formatos que se cargan sin copiar ni deserializar:
+       - ``model.pth`` (state dict) → ``model.safetensors`` (los handlers MNIST
+         lo prefieren y lo mapean en memoria);
+       - ``*.joblib`` comprimidos → joblib sin comprimir, cuyos arrays de NumPy
+         quedan planos en el archivo y ``joblib.load(mmap_mode="r")`` los mapea.
+  3. Precompila ``code/`` a bytecode (``unchecked-hash``: no se revalida contra
+     la fecha del .py al arrancar).  Solo se usa si el intérprete del
+     contenedor tiene la misma versión que ``--python``.
+  4. Empaqueta de forma determinista: miembros ordenados, mtime fijo
+     (``SOURCE_DATE_EPOCH`` o 0), uid/gid 0 y cabecera gzip sin fecha; dos
+     builds de los mismos archivos dan el mismo sha256.
+     ``--compression none`` deja además el directorio sin comprimir para
+     desplegar desde un prefijo S3 (``CompressionType: None``), útil cuando
+     los pesos son grandes y no comprimen; ``--compress-level 1`` es un punto
+     intermedio.
+  5. Valida en un proceso limpio: extrae el tarball, mide el arranque en frío
+     (import del handler, ``model_fn``, primera petición) y ejecuta una
+     petición de humo con ``sample_inputs.py``.
+
+Escribe ``<salida>/<modelo>/model.tar.gz`` y ``build_report.json`` (tamaños,
+hash, conversiones, arranque en frío y diferencia con el build anterior).
+
+Uso:
+  python scripts/build_artifacts.py modelos/neumonia
+  python scripts/build_artifacts.py --all --output-dir build
+  python scripts/build_artifacts.py modelos/mnist/mnist_classical --compression none
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from handler_loader import DEFAULT_CONTENT_TYPE, discover_handlers
+from sample_inputs import ROOT_DIR, samples_for
+
+
+SAGEMAKER_MODEL_DIR = "/opt/ml/model"
+EXCLUDED_DIRS = {"__pycache__", ".ipynb_checkpoints"}
+EXCLUDED_SUFFIXES = (".tar.gz", ".tar", ".ipynb", ".pyc")
+# Restos de entrenamiento (code/train.py de MNIST) que no necesita el endpoint
+EXCLUDED_FILES = {"checkpoint.pt", "checkpoint.pt.tmp", "train_history.json"}
+# Firmas de los compresores que usa joblib
+_JOBLIB_COMPRESSED_MAGIC = (b"\x1f\x8b", b"x", b"BZh", b"\xfd7zXZ", b"\x5d\x00", b"\x04\x22\x4d\x18")
+
+
+def _ignore(_, names):
+    return [n for n in names if n in EXCLUDED_DIRS or n in EXCLUDED_FILES or n.endswith(EXCLUDED_SUFFIXES)
+            or n.startswith(".")]
+
+
+def stage(model_dir: Path, staging: Path) -> List[str]:
+    """Copia artefactos y code/ al staging; devuelve los archivos copiados."""
+    copied = []
+    for item in sorted(model_dir.iterdir()):
+        if _ignore(None, [item.name]):
+            continue
+        target = staging / item.name
+        if item.is_dir():
+            shutil.copytree(item, target, ignore=_ignore)
+        else:
+            # resolve(): los artefactos pueden ser enlaces simbólicos (LFS, blobs)
+            shutil.copy2(item.resolve(), target)
+        copied.append(item.name)
+    return copied
+
+
+def convert_weights(staging: Path, keep_originals: bool) -> List[Dict[str, Any]]:
+    """Convierte pesos a formatos mapeables en memoria; devuelve lo que se hizo."""
+    conversions = []
+    pth = staging / "model.pth"
+    if pth.exists() and not (staging / "model.safetensors").exists():
+        import torch
+        from safetensors.torch import save_file
+
+        state_dict = torch.load(pth, map_location="cpu", weights_only=True)
+        save_file({k: v.contiguous() for k, v in state_dict.items()}, str(staging / "model.safetensors"))
+        conversions.append({"from": "model.pth", "to": "model.safetensors",
+                            "tensors": len(state_dict)})
+        if not keep_originals:
+            pth.unlink()
+
+    for path in sorted(staging.glob("*.joblib")):
+        with open(path, "rb") as fh:
+            head = fh.read(6)
+        if not head.startswith(_JOBLIB_COMPRESSED_MAGIC):
+            continue
+        import joblib
+
+        obj = joblib.load(path)
+        size_before = path.stat().st_size
+        joblib.dump(obj, path, compress=0)
+        conversions.append({"from": path.name, "to": f"{path.name} (sin comprimir)",
+                            "bytes_before": size_before, "bytes_after": path.stat().st_size})
+    return conversions
+
+
+def precompile(staging: Path, python: str) -> None:
+    code_dir = staging / "code"
+    if code_dir.is_dir():
+        # -s/-p: el .pyc guarda la ruta del contenedor, no la del staging (si no, cada build cambia el hash)
+        subprocess.run([python, "-m", "compileall", "-q", "--invalidation-mode", "unchecked-hash",
+                        "-s", str(staging), "-p", SAGEMAKER_MODEL_DIR, str(code_dir)], check=True)
+
+
+def _normalize(info: tarfile.TarInfo, mtime: int) -> tarfile.TarInfo:
+    info.mtime = mtime
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    info.mode = 0o755 if info.isdir() else 0o644
+    return info
+
+
+def write_tarball(staging: Path, output: Path, compress_level: Optional[int]) -> None:
+    """Tar determinista del contenido de ``staging``; ``compress_level=None`` no comprime."""
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", 0))
+    paths = sorted(p for p in staging.rglob("*"))
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        for path in paths:
+            arcname = path.relative_to(staging).as_posix()
+            info = _normalize(tar.gettarinfo(str(path), arcname), mtime)
+            if info.isfile():
+                with open(path, "rb") as fh:
+                    tar.addfile(info, fh)
+            else:
+                tar.addfile(info)
+    data = buffer.getvalue()
+    if compress_level is None:
+        output.write_bytes(data)
+        return
+    with open(output, "wb") as raw:
+        # filename="" y mtime=0: la cabecera gzip no depende del momento del build
+        with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=compress_level, mtime=0) as gz:
+            gz.write(data)
+
+
+def sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cold_start(tarball: str, handler_name: str) -> Dict[str, Any]:
+    """Extrae el tarball y mide el arranque del handler.  Corre en un proceso nuevo."""
+    import handler_loader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        extract_dir = os.path.join(tmp, handler_name)
+        os.makedirs(extract_dir)
+        started = time.perf_counter()
+        with tarfile.open(tarball, "r:*") as tar:
+            tar.extractall(extract_dir)
+        extract_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        module = handler_loader.load_handler_module(extract_dir)
+        import_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        model = module.model_fn(extract_dir)
+        model_fn_s = time.perf_counter() - started
+
+        sample = samples_for(handler_name, 1)[0]
+        started = time.perf_counter()
+        response = module.output_fn(module.predict_fn(module.input_fn(sample.body, sample.content_type), model),
+                                    DEFAULT_CONTENT_TYPE)
+        first_request_ms = (time.perf_counter() - started) * 1000.0
+        if isinstance(response, bytes):
+            response = response.decode("utf-8")
+        json.loads(response)  # la respuesta de humo debe ser JSON válido
+
+    return {
+        "extract_s": round(extract_s, 3),
+        "import_s": round(import_s, 3),
+        "model_fn_s": round(model_fn_s, 3),
+        "first_request_ms": round(first_request_ms, 2),
+        "cold_start_s": round(extract_s + import_s + model_fn_s + first_request_ms / 1000.0, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        "smoke_response": response[:200],
+    }
+
+
+def build(model_dir: Path, output_root: Path, args) -> Dict[str, Any]:
+    name = model_dir.name
+    output_dir = output_root / name
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report_path = output_dir / "build_report.json"
+    previous = json.loads(report_path.read_text()) if report_path.exists() else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        staging = Path(tmp) / name
+        staging.mkdir()
+        files = stage(model_dir, staging)
+        conversions = convert_weights(staging, args.keep_originals) if args.convert else []
+        if args.precompile:
+            precompile(staging, args.python)
+
+        compress_level = None if args.compression == "none" else args.compress_level
+        tarball = output_dir / ("model.tar" if compress_level is None else "model.tar.gz")
+        write_tarball(staging, tarball, compress_level)
+        if compress_level is None:
+            uncompressed = output_dir / "uncompressed"
+            shutil.rmtree(uncompressed, ignore_errors=True)
+            shutil.copytree(staging, uncompressed)
+        members = sorted(p.relative_to(staging).as_posix() for p in staging.rglob("*") if p.is_file())
+        staged_bytes = sum(p.stat().st_size for p in staging.rglob("*") if p.is_file())
+
+    report = {
+        "model": name,
+        "source": str(model_dir),
+        "tarball": str(tarball),
+        "sha256": sha256(tarball),
+        "tarball_bytes": tarball.stat().st_size,
+        "staged_bytes": staged_bytes,
+        "compression": args.compression if compress_level is not None else "none",
+        "compress_level": compress_level,
+        "precompiled": args.precompile,
+        "files": files,
+        "members": members,
+        "conversions": conversions,
+    }
+    if args.validate:
+        with mp.get_context("spawn").Pool(1) as pool:
+            report["cold_start"] = pool.apply(cold_start, (str(tarball), name))
+    if previous:
+        report["previous_sha256"] = previous.get("sha256")
+        report["reproducible"] = previous.get("sha256") == report["sha256"]
+        if "cold_start" in report and "cold_start" in previous:
+            report["cold_start_delta_s"] = round(
+                report["cold_start"]["cold_start_s"] - previous["cold_start"]["cold_start_s"], 3)
+    report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_dirs", nargs="*", help="Directorios de modelo (con code/inference.py)")
+    parser.add_argument("--all", action="store_true", help="Construye todos los modelos de modelos/")
+    parser.add_argument("--output-dir", default=str(ROOT_DIR / "build"))
+    parser.add_argument("--compression", choices=("gzip", "none"), default="gzip")
+    parser.add_argument("--compress-level", type=int, default=6)
+    parser.add_argument("--convert", action=argparse.BooleanOptionalAction, default=True,
+                        help="Convierte pesos a safetensors / joblib sin comprimir")
+    parser.add_argument("--keep-originals", action="store_true", help="Conserva model.pth junto a safetensors")
+    parser.add_argument("--precompile", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--python", default=sys.executable,
+                        help="Intérprete con la versión de Python del contenedor para precompilar")
+    parser.add_argument("--validate", action=argparse.BooleanOptionalAction, default=True,
+                        help="Extrae, carga el handler y mide el arranque en frío")
+    args = parser.parse_args()
+
+    model_dirs = [Path(d) for d in args.model_dirs]
+    if args.all:
+        model_dirs += [Path(d) for d in discover_handlers(str(ROOT_DIR / "modelos")).values()]
+    if not model_dirs:
+        parser.error("Indica al menos un directorio de modelo o --all")
+
+    failed = False
+    for model_dir in model_dirs:
+        print(f"Construyendo {model_dir}...", flush=True)
+        try:
+            report = build(model_dir.resolve(), Path(args.output_dir), args)
+        except Exception as e:
+            print(f"  ERROR: {e}", flush=True)
+            failed = True
+            continue
+        line = f"  {report['tarball']} ({report['tarball_bytes'] / 1e6:.2f} MB, sha256 {report['sha256'][:12]})"
+        if "cold_start" in report:
+            cs = report["cold_start"]
+            line += (f"; arranque en frío {cs['cold_start_s']} s (import {cs['import_s']} s, "
+                     f"model_fn {cs['model_fn_s']} s, 1ª petición {cs['first_request_ms']} ms)")
+        print(line, flush=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
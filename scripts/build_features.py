@@ -0,0 +1,217 @@
+"""
+Construye la tabla de características de entrenamiento del modelo de neumonía.
+
+Recorre un árbol de radiografías (``<data-dir>/NORMAL/*.jpeg``,
+``<data-dir>/PNEUMONIA/*.jpeg``, a cualquier profundidad) y calcula
+``FEATURE_COLUMNS`` de cada imagen con un pool de procesos.  Las funciones
+son las del handler (``_decode`` → ``procesar_imagen`` → ``extract_features``
+de ``modelos/neumonia/code/inference.py``), importadas tal cual: las
+características de entrenamiento y las de inferencia no pueden divergir, y
+también se aplica la reducción a ``MAX_SIDE`` que hace el endpoint (el
+notebook leía la imagen a tamaño completo).
+
+Etiquetas, como en el notebook: carpeta NORMAL → 0 y PNEUMONIA → 1; con
+``--multi-class`` los nombres con "virus" → 2 y "bacteria" → 3.
+
+La salida se escribe por partes (``<output>.parts/part-NNNNN.parquet`` cada
+``--chunk-size`` imágenes), así que un corte no pierde lo ya calculado: al
+relanzar se saltan las imágenes que ya están en alguna parte.  Las partes
+guardan la versión de preprocesado (``preprocessing_version()``); si cambió,
+hay que empezar de cero con ``--restart``.  Al terminar se unen en
+``<output>`` (Parquet, o CSV si la extensión es ``.csv``), ordenadas por ruta,
+con las columnas ``path``, ``filename``, ``label`` y ``FEATURE_COLUMNS``; es la
+entrada de ``compile_predictor.py --features``.
+
+Uso:
+  python scripts/build_features.py --data-dir data_neumonia/chest_xray/train --output features_train.parquet
+  python scripts/build_features.py --data-dir chest_xray/train --output features.csv --workers 8 \
+    --limit-per-class 1000 --multi-class
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sample_inputs import ROOT_DIR
+
+DEFAULT_MODEL_DIR = ROOT_DIR / "modelos" / "neumonia"
+IMAGE_SUFFIXES = (".jpeg", ".jpg", ".png")
+CLASS_DIRS = {"NORMAL": 0, "PNEUMONIA": 1}
+MANIFEST = "manifest.json"
+
+_module = None
+
+
+def label_for(path: Path, data_dir: Path, multi_class: bool) -> Optional[int]:
+    """Etiqueta según la carpeta de clase (y el nombre del archivo con ``multi_class``)."""
+    parts = [p.upper() for p in path.relative_to(data_dir).parts[:-1]]
+    label = next((CLASS_DIRS[p] for p in reversed(parts) if p in CLASS_DIRS), None)
+    if label is None or not multi_class:
+        return label
+    name = path.name.lower()
+    if "virus" in name:
+        return 2
+    if "bacteria" in name:
+        return 3
+    return label
+
+
+def find_images(data_dir: Path, multi_class: bool, limit_per_class: Optional[int]) -> List[Tuple[str, int]]:
+    """(ruta relativa, etiqueta) de cada imagen, en orden; las que no cuelgan de una carpeta de clase se omiten."""
+    by_label: Dict[int, List[str]] = {}
+    for path in sorted(data_dir.rglob("*")):
+        if path.suffix.lower() not in IMAGE_SUFFIXES or path.name.startswith("."):
+            continue
+        label = label_for(path, data_dir, multi_class)
+        if label is not None:
+            by_label.setdefault(label, []).append(str(path.relative_to(data_dir)))
+    images = []
+    for label, paths in sorted(by_label.items()):
+        images.extend((p, label) for p in paths[:limit_per_class])
+    return images
+
+
+def _init_worker(model_dir: str) -> None:
+    global _module
+    # Un hilo por proceso: el paralelismo lo pone el pool
+    os.environ["NEUMONIA_THREADS"] = "1"
+    from handler_loader import load_handler_module
+    import cv2
+
+    cv2.setNumThreads(1)
+    _module = load_handler_module(model_dir)
+
+
+def _extract(task: Tuple[str, str, int]) -> Tuple[str, int, Optional[Dict[str, float]], Optional[str]]:
+    data_dir, rel_path, label = task
+    try:
+        with open(os.path.join(data_dir, rel_path), "rb") as fh:
+            image = _module._decode(fh.read())
+        return rel_path, label, _module._features(image), None
+    except Exception as exc:  # una imagen corrupta no detiene la corrida
+        return rel_path, label, None, f"{type(exc).__name__}: {exc}"
+
+
+class PartWriter:
+    """Partes numeradas de la tabla; cada una se escribe completa o no se escribe."""
+
+    def __init__(self, parts_dir: Path, columns: List[str]):
+        self.parts_dir = parts_dir
+        self.columns = columns
+        self.next_index = len(list(parts_dir.glob("part-*.parquet")))
+        self.rows: List[Dict[str, Any]] = []
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.rows.append(row)
+
+    def flush(self) -> None:
+        import pandas as pd
+
+        if not self.rows:
+            return
+        path = self.parts_dir / f"part-{self.next_index:05d}.parquet"
+        tmp = path.with_suffix(".tmp")
+        pd.DataFrame(self.rows, columns=self.columns).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        self.next_index += 1
+        self.rows = []
+
+
+def done_paths(parts_dir: Path) -> set:
+    import pandas as pd
+
+    done = set()
+    for part in sorted(parts_dir.glob("part-*.parquet")):
+        done.update(pd.read_parquet(part, columns=["path"])["path"])
+    return done
+
+
+def check_manifest(parts_dir: Path, manifest: Dict[str, Any], restart: bool) -> None:
+    path = parts_dir / MANIFEST
+    if restart and parts_dir.exists():
+        shutil.rmtree(parts_dir)
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        previous = json.loads(path.read_text(encoding="utf-8"))
+        if previous != manifest:
+            raise SystemExit(f"Las partes de {parts_dir} son de otra corrida ({previous}); usa --restart")
+    else:
+        path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+
+def merge(parts_dir: Path, output: Path) -> int:
+    import pandas as pd
+
+    parts = sorted(parts_dir.glob("part-*.parquet"))
+    frame = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True) if parts else pd.DataFrame()
+    if len(frame):
+        frame = frame.drop_duplicates("path").sort_values("path", kind="stable").reset_index(drop=True)
+    if output.suffix.lower() == ".csv":
+        frame.to_csv(output, index=False)
+    else:
+        frame.to_parquet(output, index=False)
+    return len(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", required=True, help="Raíz con las carpetas NORMAL/ y PNEUMONIA/")
+    parser.add_argument("--output", required=True, help="Tabla final (.parquet o .csv)")
+    parser.add_argument("--model-dir", default=str(DEFAULT_MODEL_DIR), help="Handler cuyas funciones se usan")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500, help="Imágenes por parte escrita")
+    parser.add_argument("--limit-per-class", type=int, help="Máximo de imágenes por etiqueta (como LIMIT_* del notebook)")
+    parser.add_argument("--multi-class", action="store_true", help="virus → 2, bacteria → 3 según el nombre")
+    parser.add_argument("--restart", action="store_true", help="Descarta las partes de una corrida anterior")
+    args = parser.parse_args()
+
+    from handler_loader import load_handler_module
+
+    module = load_handler_module(args.model_dir)
+    data_dir = Path(args.data_dir).resolve()
+    output = Path(args.output)
+    parts_dir = output.with_name(output.name + ".parts")
+    columns = ["path", "filename", "label", *module.FEATURE_COLUMNS]
+
+    manifest = {"preprocessing_version": module.preprocessing_version(), "data_dir": str(data_dir),
+                "multi_class": args.multi_class, "limit_per_class": args.limit_per_class}
+    check_manifest(parts_dir, manifest, args.restart)
+
+    images = find_images(data_dir, args.multi_class, args.limit_per_class)
+    done = done_paths(parts_dir)
+    pending = [(str(data_dir), p, label) for p, label in images if p not in done]
+    print(f"{len(images)} imágenes, {len(images) - len(pending)} ya procesadas, {len(pending)} pendientes", flush=True)
+
+    writer = PartWriter(parts_dir, columns)
+    failures = []
+    started = time.perf_counter()
+    if pending:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(args.workers, initializer=_init_worker, initargs=(args.model_dir,)) as pool:
+            results = pool.imap_unordered(_extract, pending, chunksize=max(1, min(32, len(pending) // (args.workers * 8))))
+            for count, (rel_path, label, feats, error) in enumerate(results, 1):
+                if feats is None:
+                    failures.append({"path": rel_path, "error": error})
+                else:
+                    writer.add({"path": rel_path, "filename": os.path.basename(rel_path), "label": label,
+                                **{c: feats.get(c, 0.0) for c in module.FEATURE_COLUMNS}})
+                if len(writer.rows) >= args.chunk_size:
+                    writer.flush()
+                if count % max(1, len(pending) // 20) == 0 or count == len(pending):
+                    elapsed = time.perf_counter() - started
+                    print(f"  {count}/{len(pending)} ({count / elapsed:.1f} imágenes/s)", flush=True)
+    writer.flush()
+
+    rows = merge(parts_dir, output)
+    for failure in failures:
+        print(f"  Error en {failure['path']}: {failure['error']}")
+    print(f"{rows} filas en {output} ({len(failures)} imágenes con error)")
+
+
+if __name__ == "__main__":
+    main()
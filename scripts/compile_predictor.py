@@ -0,0 +1,171 @@
+"""
+Compila el clasificador de neumonía (``model.joblib``) a ``model.npz``.
+
+El handler carga ``model.npz`` con NumPy (``compiled_predictor.py``) en lugar
+de deserializar el estimador con joblib: no importa scikit-learn al arrancar
+y cada petición se ahorra la validación de ``predict_proba`` sobre un
+DataFrame de una fila.  Se admiten regresión logística, árboles de decisión
+y bosques (RandomForest / ExtraTrees), también tras un ``StandardScaler``.
+
+Antes de escribir el archivo se comprueba la paridad con el estimador
+original: ``predict_proba`` debe coincidir (``--atol``) y la clase predicha
+ser la misma en todas las filas.  El ``.npz`` guarda el sha256 de
+``model.joblib``; hay que recompilar cada vez que se reentrena.  Las filas salen de ``--features`` (CSV o
+parquet con las columnas de ``FEATURE_COLUMNS``, p. ej. las de
+entrenamiento) o, si no se pasa, de radiografías de ``--xray-dir`` (o
+sintéticas) procesadas con el propio handler.
+
+``--self-test`` no toca ``model.joblib``: ajusta Pipelines sintéticos (uno y
+dos ``StandardScaler`` seguidos de cada estimador soportado), los exporta y
+comprueba la paridad de cada uno.
+
+Uso:
+  python scripts/compile_predictor.py
+  python scripts/compile_predictor.py --features features_train.csv
+  python scripts/compile_predictor.py --xray-dir ~/chest_xray/train/NORMAL --samples 500
+  python scripts/compile_predictor.py --self-test
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from handler_loader import load_handler_module
+from sample_inputs import ROOT_DIR, xray_jpegs
+
+DEFAULT_MODEL_DIR = ROOT_DIR / "modelos" / "neumonia"
+
+
+def feature_rows(module, args):
+    """Matriz de características (DataFrame con ``FEATURE_COLUMNS``) para la comprobación."""
+    import pandas as pd
+
+    if args.features:
+        if args.features.endswith(".parquet"):
+            frame = pd.read_parquet(args.features)
+        else:
+            frame = pd.read_csv(args.features)
+        missing = [c for c in module.FEATURE_COLUMNS if c not in frame.columns]
+        if missing:
+            raise SystemExit(f"Faltan columnas en {args.features}: {missing}")
+        return frame[module.FEATURE_COLUMNS]
+    images = xray_jpegs(args.samples, args.seed, args.xray_dir)
+    return module._prepare_dataframe([module._features(module._decode(image)) for image in images])
+
+
+def check_parity(estimator, compiled, frame, atol):
+    import numpy as np
+
+    expected = estimator.predict_proba(frame)
+    actual = compiled.predict_proba(frame)
+    max_diff = float(np.abs(expected - actual).max()) if len(frame) else 0.0
+    same_labels = bool((estimator.predict(frame) == compiled.predict(frame)).all())
+    return {"rows": len(frame), "max_abs_diff": max_diff, "same_predictions": same_labels,
+            "ok": max_diff <= atol and same_labels}
+
+
+def self_test(compiled_predictor, atol, seed=0):
+    """Paridad de ``export()`` con Pipelines sintéticos; devuelve un resultado por caso."""
+    import numpy as np
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.tree import DecisionTreeClassifier
+
+    rng = np.random.default_rng(seed)
+    columns = [f"f{i}" for i in range(6)]
+    # Escalas y medias muy distintas para que un mal fundido de escaladores se note
+    X = rng.normal(loc=rng.uniform(-50, 50, 6), scale=rng.uniform(0.1, 20, 6), size=(400, 6))
+    y = np.where(X[:, 0] / X[:, 0].std() + X[:, 1] / X[:, 1].std() > 0, "PNEUMONIA", "NORMAL")
+    estimators = {
+        "logistic": lambda: LogisticRegression(max_iter=1000),
+        "tree": lambda: DecisionTreeClassifier(max_depth=5, random_state=seed),
+        "forest": lambda: RandomForestClassifier(n_estimators=10, max_depth=5, random_state=seed),
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, make in estimators.items():
+            for scalers in (1, 2):
+                pipeline = make_pipeline(*[StandardScaler() for _ in range(scalers)], make()).fit(X, y)
+                if scalers == 2:
+                    # Ajustado sobre datos ya escalados, el segundo quedaría en media 0 y
+                    # escala 1 y no probaría nada: se le dan otras y se reajusta el estimador
+                    second = pipeline.steps[1][1]
+                    second.mean_ = rng.uniform(-2, 2, 6)
+                    second.scale_ = rng.uniform(0.2, 5, 6)
+                    pipeline.steps[-1][1].fit(pipeline[:-1].transform(X), y)
+                path = os.path.join(tmp, f"{name}_{scalers}.npz")
+                compiled_predictor.export(pipeline, path, columns)
+                parity = check_parity(pipeline, compiled_predictor.load(path), X, atol)
+                results.append({"estimator": name, "scalers": scalers, **parity})
+    return results
+
+
+def _timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=str(DEFAULT_MODEL_DIR))
+    parser.add_argument("--features", help="CSV o parquet con las características de entrenamiento")
+    parser.add_argument("--xray-dir", help="Radiografías para calcular las características con el handler")
+    parser.add_argument("--samples", type=int, default=200, help="Imágenes a procesar sin --features")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--atol", type=float, default=1e-9, help="Diferencia máxima admitida en predict_proba")
+    parser.add_argument("--output", help="Destino (por defecto <model-dir>/model.npz)")
+    parser.add_argument("--self-test", action="store_true",
+                        help="Solo comprueba export() con Pipelines sintéticos de uno y dos escaladores")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(os.path.abspath(args.model_dir), "code"))
+    import compiled_predictor
+
+    if args.self_test:
+        results = self_test(compiled_predictor, args.atol, args.seed)
+        print(json.dumps(results, indent=2))
+        failed = [r for r in results if not r["ok"]]
+        if failed:
+            raise SystemExit(f"{len(failed)} de {len(results)} casos sin paridad")
+        return
+
+    import joblib
+
+    module = load_handler_module(args.model_dir)
+
+    joblib_path = os.path.join(args.model_dir, "model.joblib")
+    estimator = joblib.load(joblib_path)
+    output = args.output or os.path.join(args.model_dir, "model.npz")
+    fd, tmp_path = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(os.path.abspath(output)))
+    os.close(fd)
+    try:
+        summary = compiled_predictor.export(estimator, tmp_path, module.FEATURE_COLUMNS,
+                                            source_sha256=compiled_predictor.file_sha256(joblib_path))
+        compiled = compiled_predictor.load(tmp_path)
+        frame = feature_rows(module, args)
+        parity = check_parity(estimator, compiled, frame, args.atol)
+        print(json.dumps({**summary, "parity": parity}, indent=2))
+        if not parity["ok"]:
+            raise SystemExit("El predictor compilado no reproduce al estimador; no se escribe model.npz")
+        os.replace(tmp_path, output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    row = frame.iloc[:1]
+    print(f"Carga: joblib {_timed(lambda: joblib.load(joblib_path), 5):.2f} ms, "
+          f"npz {_timed(lambda: compiled_predictor.load(output), 5):.2f} ms")
+    print(f"predict_proba (1 fila): sklearn {_timed(lambda: estimator.predict_proba(row), 200):.3f} ms, "
+          f"compilado {_timed(lambda: compiled.predict_proba(row), 200):.3f} ms")
+    print(f"Predictor guardado en {output}")
+
+
+if __name__ == "__main__":
+    main()
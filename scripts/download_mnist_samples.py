@@ -2,15 +2,28 @@
 Descarga 100 dígitos aleatorios de MNIST y los guarda como PNG para subirlos a S3
 o servirlos localmente en el carrusel de Digit Recognizer.
 
+Además ejecuta los dos handlers MNIST (CNN clásica e Hybrid_QNN) en lote sobre
+las muestras y escribe ``predictions.json``: por archivo, su sha256, la
+etiqueta real y la respuesta de cada modelo (mismo formato que el endpoint),
+más los tiempos de inferencia.  El frontend lo usa para responder los clics
+del carrusel sin llamar a la API.  Se sube a S3 junto al manifest.
+
+Uso:
+  python scripts/download_mnist_samples.py               # descarga + índice
+  python scripts/download_mnist_samples.py --index-only  # recalcula el índice
+
 Requisitos:
   pip install torchvision pillow
 """
 
+import argparse
+import base64
+import hashlib
+import json
 import random
+import time
 from pathlib import Path
 
-from torchvision import datasets
-
 
 # Soporta ejecución como script y desde notebooks (donde __file__ no existe).
 try:
@@ -20,11 +33,21 @@ except NameError:
 
 OUTPUT_DIR = ROOT_DIR / "page" / "public" / "mnist_samples"
 DATA_DIR = ROOT_DIR / "data" / "mnist"
+INDEX_PATH = OUTPUT_DIR / "predictions.json"
 NUM_IMAGES = 100
 SEED = 42
 
+# Handlers que se precalculan; las claves son las que usan el frontend y la Lambda
+INDEX_MODELS = {
+    "mnist_classical": ROOT_DIR / "modelos" / "mnist" / "mnist_classical",
+    "mnist_quantum": ROOT_DIR / "modelos" / "mnist" / "mnist_quantum",
+}
+INDEX_BATCH_SIZE = 32
+
+
+def download_samples():
+    from torchvision import datasets
 
-def main():
     random.seed(SEED)
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -45,5 +68,68 @@ def main():
     print(f"Manifest creado en {manifest_path}")
 
 
+def build_prediction_index(sample_dir=OUTPUT_DIR, index_path=INDEX_PATH, batch_size=INDEX_BATCH_SIZE):
+    """Corre ambos handlers en lote sobre las muestras y escribe el índice de predicciones."""
+    import sys
+
+    # Desde notebooks scripts/ no está en sys.path
+    sys.path.insert(0, str(ROOT_DIR / "scripts"))
+    from handler_loader import Handler
+
+    files = sorted(sample_dir.glob("mnist_*_label*.png"))
+    if not files:
+        raise FileNotFoundError(f"No hay muestras MNIST en {sample_dir}")
+    contents = [path.read_bytes() for path in files]
+    bodies = [json.dumps({"input": base64.b64encode(data).decode("ascii")}) for data in contents]
+
+    samples = {
+        path.name: {
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "label": int(path.stem.rsplit("label", 1)[1]),
+        }
+        for path, data in zip(files, contents)
+    }
+    models = {}
+    for key, model_dir in INDEX_MODELS.items():
+        handler = Handler(str(model_dir)).load()
+        started = time.perf_counter()
+        for start in range(0, len(bodies), batch_size):
+            chunk = files[start:start + batch_size]
+            inputs = [handler.input_fn(body, "application/json") for body in bodies[start:start + batch_size]]
+            for path, prediction in zip(chunk, handler.predict_many(inputs)):
+                samples[path.name][key] = json.loads(handler.output_fn(prediction, "application/json"))
+        seconds = time.perf_counter() - started
+        correct = sum(1 for entry in samples.values() if entry[key]["predicted_class"] == entry["label"])
+        models[key] = {
+            "batch_size": batch_size,
+            "total_ms": round(seconds * 1000.0, 2),
+            "ms_per_sample": round(seconds * 1000.0 / len(files), 3),
+            "accuracy": round(correct / len(files), 4),
+        }
+        print(f"{key}: {len(files)} muestras en {seconds:.2f} s, accuracy {correct / len(files):.2%}")
+
+    index = {
+        "version": 1,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "models": models,
+        "samples": samples,
+    }
+    index_path.write_text(json.dumps(index, separators=(",", ":")))
+    print(f"Índice de predicciones guardado en {index_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-only", action="store_true", help="No descarga; recalcula el índice")
+    parser.add_argument("--no-index", action="store_true", help="Solo descarga las muestras")
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not args.index_only:
+        download_samples()
+    if not args.no_index:
+        build_prediction_index(batch_size=args.batch_size)
+
+
 if __name__ == "__main__":
     main()
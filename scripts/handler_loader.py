@@ -0,0 +1,186 @@
+"""
+Carga local de los handlers de SageMaker (``<modelo>/code/inference.py``).
+
+Cada directorio de ``modelos/`` se empaqueta por separado, así que sus módulos
+comparten nombres (``inference``, ``modelcnn``...) y los handlers MNIST
+importan ``code.modelcnn``.  ``load_handler_module`` importa cada handler bajo un
+nombre propio, con un paquete ``code`` temporal que apunta a su directorio, y
+retira después los módulos hermanos de ``sys.modules`` para que varios
+handlers convivan en el mismo proceso.
+
+También define cómo agrupar entradas de varias peticiones en una sola llamada
+a ``predict_fn`` (``collate``) y cómo repartir la salida (``split``):
+  - si ``input_fn`` devuelve listas, se concatenan;
+  - si el handler declara ``ACCEPTS_INPUT_LIST = True``, las entradas
+    individuales se agrupan en una lista;
+  - en otro caso el handler no admite lotes y se invoca petición a petición.
+"""
+
+import importlib.util
+import os
+import re
+import sys
+import types
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+DEFAULT_CONTENT_TYPE = "application/json"
+
+
+def rss_mb() -> float:
+    """RSS actual del proceso en MiB (lee /proc; 0.0 fuera de Linux)."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return 0.0
+
+
+def discover_handlers(root: str) -> dict:
+    """Mapea nombre → directorio para cada modelo bajo ``root`` que tenga ``code/inference.py``."""
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d != "__pycache__")
+        if os.path.basename(dirpath) == "code" and "inference.py" in filenames:
+            model_dir = os.path.dirname(dirpath)
+            found[os.path.basename(model_dir)] = model_dir
+    return found
+
+
+def _module_name(model_dir: str) -> str:
+    slug = re.sub(r"\W+", "_", os.path.abspath(model_dir)).strip("_")
+    return f"handler_{slug}"
+
+
+def load_handler_module(model_dir: str) -> types.ModuleType:
+    """Importa ``<model_dir>/code/inference.py`` aislado de otros handlers."""
+    code_dir = os.path.join(os.path.abspath(model_dir), "code")
+    entry_point = os.path.join(code_dir, "inference.py")
+    if not os.path.isfile(entry_point):
+        raise FileNotFoundError(f"No existe {entry_point}")
+
+    name = _module_name(model_dir)
+    if name in sys.modules:
+        return sys.modules[name]
+
+    # Guarda el módulo estándar ``code`` (y cualquier handler previo) para restaurarlo
+    saved = {k: sys.modules.pop(k) for k in list(sys.modules) if k == "code" or k.startswith("code.")}
+    before = set(sys.modules)
+    package = types.ModuleType("code")
+    package.__path__ = [code_dir]
+    package.__file__ = os.path.join(code_dir, "__init__.py")
+    sys.modules["code"] = package
+    sys.path.insert(0, code_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(name, entry_point)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+    finally:
+        sys.path.remove(code_dir)
+        # Retira ``code.*`` y los módulos hermanos importados como top-level;
+        # el handler conserva sus referencias.
+        for key in set(sys.modules) - before:
+            if key == name:
+                continue
+            origin = getattr(sys.modules[key], "__file__", None) or ""
+            if key == "code" or key.startswith("code.") or origin.startswith(code_dir + os.sep):
+                del sys.modules[key]
+        sys.modules.update(saved)
+    return module
+
+
+class Handler:
+    """Un handler de SageMaker cargado en este proceso."""
+
+    def __init__(self, model_dir: str):
+        self.model_dir = os.path.abspath(model_dir)
+        self.name = os.path.basename(os.path.normpath(model_dir))
+        self.module = load_handler_module(model_dir)
+        self.model = None
+
+    def load(self) -> "Handler":
+        if self.model is None:
+            self.model = self.module.model_fn(self.model_dir)
+        return self
+
+    def unload(self) -> None:
+        """Suelta el modelo; el módulo sigue importado para una recarga rápida."""
+        self.model = None
+
+    @property
+    def accepts_input_list(self) -> bool:
+        return bool(getattr(self.module, "ACCEPTS_INPUT_LIST", False))
+
+    def input_fn(self, body: Any, content_type: str = DEFAULT_CONTENT_TYPE) -> Any:
+        return self.module.input_fn(body, content_type)
+
+    def predict_fn(self, data: Any) -> Any:
+        return self.module.predict_fn(data, self.model)
+
+    def output_fn(self, prediction: Any, accept: str = DEFAULT_CONTENT_TYPE) -> Any:
+        return self.module.output_fn(prediction, accept)
+
+    def invoke(self, body: Any, content_type: str = DEFAULT_CONTENT_TYPE, accept: str = DEFAULT_CONTENT_TYPE) -> Any:
+        """Ciclo completo input_fn → predict_fn → output_fn para una petición."""
+        return self.output_fn(self.predict_fn(self.input_fn(body, content_type)), accept)
+
+    def predict_many(self, inputs: Sequence[Any]) -> List[Any]:
+        """Ejecuta varias entradas con una sola llamada a ``predict_fn`` cuando el handler lo permite."""
+        collated = collate(self, inputs)
+        if collated is None:
+            return [self.predict_fn(data) for data in inputs]
+        batch, layout = collated
+        return split(self.predict_fn(batch), layout)
+
+
+def collate(handler: Handler, inputs: Sequence[Any]) -> Optional[Tuple[List[Any], List[Tuple[bool, int]]]]:
+    """
+    Agrupa las salidas de ``input_fn`` de varias peticiones en un único lote.
+
+    Devuelve ``(lote, layout)`` donde ``layout`` guarda por petición si su
+    entrada era una lista y cuántos elementos aportó, o ``None`` si el
+    handler no admite lotes.
+    """
+    all_lists = all(isinstance(data, list) for data in inputs)
+    if not all_lists and not handler.accepts_input_list:
+        return None
+    batch: List[Any] = []
+    layout: List[Tuple[bool, int]] = []
+    for data in inputs:
+        if isinstance(data, list):
+            batch.extend(data)
+            layout.append((True, len(data)))
+        else:
+            batch.append(data)
+            layout.append((False, 1))
+    return batch, layout
+
+
+def split(prediction: Any, layout: List[Tuple[bool, int]]) -> List[Any]:
+    """
+    Reparte la salida de ``predict_fn`` entre las peticiones de un lote.
+
+    Tensores y arrays se cortan por filas conservando la dimensión de lote
+    (los ``output_fn`` MNIST leen ``prediction[0]``); las listas se cortan en
+    sublistas o, para entradas individuales, en su único elemento.
+    """
+    parts = []
+    start = 0
+    for was_list, size in layout:
+        end = start + size
+        if hasattr(prediction, "shape"):
+            parts.append(prediction[start:end])
+        elif was_list:
+            parts.append(prediction[start:end])
+        else:
+            parts.append(prediction[start])
+        start = end
+    return parts
@@ -0,0 +1,142 @@
+"""
+Memoria por worker de ``serve_local.py --workers N`` con y sin ``--preload``.
+
+Para cada modo arranca el servidor, espera a ``/ping``, envía unas peticiones
+de calentamiento (así cada worker toca sus pesos como en producción) y lee
+``/proc/<pid>/smaps_rollup`` del padre y de cada worker:
+  - Rss: memoria residente del proceso, contando páginas compartidas;
+  - Pss: Rss con las páginas compartidas repartidas entre quienes las mapean;
+  - Private: páginas que solo tiene ese proceso (incluye las copiadas por COW).
+La suma de Pss del grupo es la memoria real que ocupa el servidor, la cifra
+que decide cuántos workers caben en la instancia (p. ej. ml.m5.large, 8 GiB).
+
+Uso:
+  python scripts/measure_worker_memory.py --model-dir modelos/neumonia --workers 4
+  python scripts/measure_worker_memory.py --model-dir modelos/sentimientos/model_pysentimiento \
+    --workers 2 --requests 32 --output bench/worker_memory.json
+
+Solo Linux (usa /proc).
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+from sample_inputs import samples_for
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+MODES = {"per-worker": [], "preload": ["--preload"]}
+
+
+def smaps_rollup(pid: int) -> Dict[str, float]:
+    """Campos de ``smaps_rollup`` en MiB, más ``Private`` (limpias + sucias)."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as fh:
+        for line in fh:
+            key, _, rest = line.partition(":")
+            if key in SMAPS_FIELDS:
+                values[key] = int(rest.split()[0]) / 1024.0
+    values["Private"] = values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0)
+    return {k: round(v, 1) for k, v in values.items()}
+
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        text = (task / "children").read_text().split()
+        children.extend(int(c) for c in text)
+    return sorted(children)
+
+
+def wait_ready(port: int, workers: int, parent: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if parent.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {parent.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ping", timeout=1) as response:
+                if response.status == 200 and len(child_pids(parent.pid)) >= workers:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"El servidor no respondió /ping en {timeout:.0f} s")
+
+
+def warm_up(port: int, handler_name: str, requests: int) -> None:
+    for sample in samples_for(handler_name, requests):
+        request = urllib.request.Request(f"http://127.0.0.1:{port}/invocations", data=sample.body,
+                                         headers={"Content-Type": sample.content_type}, method="POST")
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+
+
+def measure_mode(mode: str, args) -> Dict:
+    command = [sys.executable, str(SCRIPTS_DIR / "serve_local.py"), "--model-dir", args.model_dir,
+               "--workers", str(args.workers), "--port", str(args.port), *MODES[mode]]
+    print(f"[{mode}] {' '.join(command)}", flush=True)
+    parent = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        started = time.perf_counter()
+        wait_ready(args.port, args.workers, parent, args.timeout)
+        ready_seconds = time.perf_counter() - started
+        warm_up(args.port, os.path.basename(os.path.normpath(args.model_dir)), args.requests)
+        time.sleep(args.settle)
+        workers = {pid: smaps_rollup(pid) for pid in child_pids(parent.pid)}
+        result = {
+            "mode": mode,
+            "ready_seconds": round(ready_seconds, 2),
+            "parent": smaps_rollup(parent.pid),
+            "workers": workers,
+        }
+    finally:
+        parent.terminate()
+        try:
+            parent.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            parent.kill()
+
+    rows = list(result["workers"].values())
+    result["worker_mean"] = {k: round(sum(r[k] for r in rows) / len(rows), 1) for k in ("Rss", "Pss", "Private")}
+    result["group_pss_mb"] = round(result["parent"]["Pss"] + sum(r["Pss"] for r in rows), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--requests", type=int, default=16, help="Peticiones de calentamiento por modo")
+    parser.add_argument("--settle", type=float, default=1.0, help="Segundos de espera antes de medir")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["per-worker", "preload"])
+    parser.add_argument("--output", help="Archivo JSON para los resultados")
+    args = parser.parse_args()
+
+    results = [measure_mode(mode, args) for mode in args.modes]
+
+    print(f"\n{'modo':<12}{'listo (s)':>10}{'Rss/worker':>12}{'Pss/worker':>12}{'Priv/worker':>13}{'Pss total':>11}")
+    for r in results:
+        mean = r["worker_mean"]
+        print(f"{r['mode']:<12}{r['ready_seconds']:>10}{mean['Rss']:>12}{mean['Pss']:>12}"
+              f"{mean['Private']:>13}{r['group_pss_mb']:>11}")
+    print("(MiB; Pss total incluye al proceso padre)")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump({"model_dir": args.model_dir, "workers": args.workers, "results": results}, fh, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Registro multi-modelo con carga perezosa y expulsión LRU por presupuesto de memoria.
+
+Permite que un solo proceso (y una sola instancia) sirva todo el catálogo de
+``modelos/``: cada handler se carga con su ``model_fn`` la primera vez que se
+usa, se contabiliza el RSS que añadió su carga y, si el total supera el
+presupuesto, se descargan los modelos usados hace más tiempo.
+
+La contabilidad por modelo es aproximada: es la diferencia de RSS del
+proceso antes y después de ``model_fn``, ampliada con la que añade su primera
+petición (los pesos mapeados en memoria, como ``model.safetensors`` o los
+``joblib`` con ``mmap_mode``, solo ocupan RSS cuando se leen), y el asignador
+puede no devolver al sistema toda la memoria de un modelo expulsado.  Con
+``sizes_mb`` se fija la huella de un modelo en lugar de medirla.
+
+La carga de un modelo (``model_fn``, que puede tardar segundos) ocurre fuera
+del candado del registro: las peticiones a modelos ya cargados no esperan, y
+las que piden el mismo modelo mientras se carga esperan a esa misma carga.
+Las cargas de modelos distintos se hacen de una en una, para que la
+diferencia de RSS de cada una no incluya la de otra ni se sumen dos picos.
+"""
+
+import contextlib
+import gc
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from handler_loader import Handler, rss_mb
+
+
+logger = logging.getLogger("model_registry")
+
+
+class _Entry:
+    """Un modelo cargado: su handler, su lote dinámico y su huella de memoria."""
+
+    def __init__(self, handler: Handler, footprint_mb: float, batcher: Any = None, measured: bool = True):
+        self.handler = handler
+        self.footprint_mb = footprint_mb
+        self.batcher = batcher
+        self.in_use = 0
+        # RSS al terminar la carga; la primera petición completa la medición
+        self.rss_after_load = rss_mb()
+        self.pending_measure = measured
+
+
+class ModelRegistry:
+    """
+    Catálogo ``nombre → directorio`` con carga perezosa y expulsión LRU.
+
+    ``memory_budget_mb`` limita la suma de huellas de los modelos cargados;
+    el modelo recién cargado nunca se expulsa, y tampoco los que tienen
+    peticiones en curso.  ``batcher_factory`` (opcional) crea un
+    ``DynamicBatcher`` por modelo cargado y se detiene al expulsarlo.
+    ``sizes_mb`` (opcional) fija la huella de los modelos que nombra.
+    """
+
+    def __init__(self, catalog: Dict[str, str], memory_budget_mb: float,
+                 batcher_factory: Optional[Callable[[Handler], Any]] = None,
+                 events_path: Optional[str] = None, sizes_mb: Optional[Dict[str, float]] = None):
+        self.catalog = dict(catalog)
+        self.memory_budget_mb = memory_budget_mb
+        self.sizes_mb = dict(sizes_mb or {})
+        self.batcher_factory = batcher_factory
+        self.events_path = events_path
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self._loaded: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Última huella conocida por modelo, para hacer sitio antes de recargarlo
+        self._known_footprint: Dict[str, float] = {}
+        self._handlers: Dict[str, Handler] = {}
+        self._lock = threading.RLock()
+        # Cargas en curso por modelo y candado que las serializa (no bloquea los aciertos)
+        self._loading: Dict[str, Future] = {}
+        self._load_lock = threading.Lock()
+
+    @property
+    def used_mb(self) -> float:
+        return sum(entry.footprint_mb for entry in self._loaded.values())
+
+    @contextlib.contextmanager
+    def use(self, name: str) -> Iterator[_Entry]:
+        """Obtiene (cargando si hace falta) un modelo y lo protege de la expulsión mientras se usa."""
+        entry = self._acquire(name)
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                if entry.pending_measure:
+                    entry.pending_measure = False
+                    self._remeasure(name, entry)
+
+    def _acquire(self, name: str, count: bool = True) -> _Entry:
+        if name not in self.catalog:
+            raise KeyError(f"Modelo desconocido: {name}")
+        while True:
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    if count:
+                        self.hits += 1
+                    self._loaded.move_to_end(name)
+                    entry.in_use += 1
+                    return entry
+                if count:
+                    self.misses += 1
+                    count = False
+                future = self._loading.get(name)
+                owner = future is None
+                if owner:
+                    future = self._loading[name] = Future()
+            if owner:
+                return self._load_and_register(name, future)
+            # Otra petición ya lo está cargando: se espera a esa carga.  Si el
+            # modelo se expulsa antes de marcarlo en uso, se vuelve a intentar.
+            future.result()
+
+    def preload(self, name: str) -> None:
+        """Carga un modelo sin contarlo como acceso (arranque con ``--preload``)."""
+        entry = self._acquire(name, count=False)
+        with self._lock:
+            entry.in_use -= 1
+
+    def _load_and_register(self, name: str, future: Future) -> _Entry:
+        try:
+            with self._load_lock:
+                with self._lock:
+                    self._evict(self._footprint_hint(name), keep=None)
+                entry = self._load(name)
+            with self._lock:
+                self._loaded[name] = entry
+                entry.in_use += 1
+                self._evict(0.0, keep=name)
+        except BaseException as exc:
+            with self._lock:
+                del self._loading[name]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            del self._loading[name]
+        future.set_result(entry)
+        return entry
+
+    def _footprint_hint(self, name: str) -> float:
+        return self.sizes_mb.get(name, self._known_footprint.get(name, 0.0))
+
+    def _remeasure(self, name: str, entry: _Entry) -> None:
+        """Suma a la huella el RSS que añadió la primera petición (páginas mapeadas leídas)."""
+        grown = max(rss_mb() - entry.rss_after_load, 0.0)
+        if not grown or self._loaded.get(name) is not entry:
+            return
+        entry.footprint_mb += grown
+        self._known_footprint[name] = entry.footprint_mb
+        self._event("remeasure", name, footprint_mb=round(entry.footprint_mb, 1), first_request_mb=round(grown, 1))
+        self._evict(0.0, keep=name)
+
+    def start_batchers(self, batcher_factory: Callable[[Handler], Any]) -> None:
+        """
+        Fija ``batcher_factory`` y crea los lotes de los modelos ya cargados.
+
+        Los hilos no sobreviven a ``fork``: con modelos precargados en el
+        proceso padre, cada worker llama a esto después de bifurcarse.
+        """
+        with self._lock:
+            self.batcher_factory = batcher_factory
+            for entry in self._loaded.values():
+                if entry.batcher is None:
+                    entry.batcher = batcher_factory(entry.handler)
+
+    def _load(self, name: str) -> _Entry:
+        """Ejecuta ``model_fn``; se llama con ``_load_lock`` y sin ``_lock``."""
+        handler = self._handlers.get(name) or Handler(self.catalog[name])
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        handler.load()
+        seconds = time.perf_counter() - started
+        configured = name in self.sizes_mb
+        footprint = self.sizes_mb[name] if configured else max(rss_mb() - rss_before, 0.0)
+        batcher = self.batcher_factory(handler) if self.batcher_factory else None
+        entry = _Entry(handler, footprint, batcher, measured=not configured)
+        with self._lock:
+            self._handlers[name] = handler
+            self._known_footprint[name] = footprint
+            self.loads += 1
+            self._event("load", name, footprint_mb=round(footprint, 1), seconds=round(seconds, 3))
+        return entry
+
+    def _evict(self, incoming_mb: float, keep: Optional[str]) -> None:
+        """Expulsa modelos LRU hasta que ``used + incoming`` quepa en el presupuesto."""
+        for name in list(self._loaded):
+            if self.used_mb + incoming_mb <= self.memory_budget_mb:
+                break
+            entry = self._loaded[name]
+            if name == keep or entry.in_use:
+                continue
+            del self._loaded[name]
+            if entry.batcher is not None:
+                entry.batcher.stop()
+            entry.handler.unload()
+            gc.collect()
+            self.evictions += 1
+            self._event("evict", name, footprint_mb=round(entry.footprint_mb, 1))
+
+    def _event(self, kind: str, name: str, **fields: Any) -> None:
+        event = {"event": kind, "model": name, "ts": time.time(), "used_mb": round(self.used_mb, 1),
+                 "rss_mb": round(rss_mb(), 1), **fields}
+        line = json.dumps(event)
+        logger.info(line)
+        if self.events_path:
+            with open(self.events_path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "memory_budget_mb": self.memory_budget_mb,
+                "used_mb": round(self.used_mb, 1),
+                "rss_mb": round(rss_mb(), 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "catalog": sorted(self.catalog),
+                "loaded": {
+                    name: {
+                        "footprint_mb": round(entry.footprint_mb, 1),
+                        "in_use": entry.in_use,
+                        **({"batching": entry.batcher.stats()} if entry.batcher is not None else {}),
+                    }
+                    for name, entry in self._loaded.items()
+                },
+            }
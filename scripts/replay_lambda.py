@@ -0,0 +1,449 @@
+"""
+Reproduce tráfico de API Gateway contra ``lambda_handler`` sin AWS.
+
+Lee eventos capturados (API Gateway REST v1 o HTTP API v2) y los envía a
+``lambda_function.lambda_handler`` en este mismo proceso, con los clientes
+``sagemaker-runtime`` y ``bedrock-runtime`` sustituidos por falsos en memoria:
+  - cada endpoint/modelo tiene una distribución de latencia y una tasa de
+    error configurables (``--latency``, ``--error-rate``);
+  - un endpoint de SageMaker puede delegar en el handler local real
+    (``--delegate mnist-classical-endpoint=modelos/mnist/mnist_classical``).
+
+Formatos de captura aceptados (uno por línea o un arreglo JSON):
+  - eventos JSON tal cual;
+  - exportaciones de CloudWatch con líneas ``EVENT: {...}`` (lo que imprime la Lambda).
+Sin ``--events`` se generan eventos sintéticos para las rutas MNIST y el chat.
+
+Modos de carga:
+  - lazo cerrado: ``--concurrency N`` clientes que envían la siguiente
+    petición en cuanto reciben la respuesta;
+  - lazo abierto: ``--rate R`` llegadas Poisson por segundo (la latencia
+    incluye la espera en cola si la concurrencia no alcanza).
+
+El reporte separa la latencia en tiempo upstream (dentro de los clientes
+falsos) y overhead del proxy (el resto de ``lambda_handler``), por ruta.
+
+Uso:
+  python scripts/replay_lambda.py --events capturas.jsonl --concurrency 8 --requests 2000
+  python scripts/replay_lambda.py --rate 50 --duration 30 \
+    --latency mnist-classical-endpoint=lognormal:40,0.5 --error-rate mnist-quantum-endpoint=0.02 \
+    --delegate mnist-quantum-endpoint=modelos/mnist/mnist_quantum --output reporte.json
+"""
+
+import argparse
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from sample_inputs import ROOT_DIR, spanish_texts, mnist_pngs
+
+
+DEFAULT_LATENCY = "lognormal:50,0.4"
+DEFAULT_BEDROCK_LATENCY = "lognormal:900,0.5"
+
+
+class FakeUpstreamError(Exception):
+    """Error inyectado por un cliente falso (la Lambda lo convierte en 500)."""
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Distribución de latencia en milisegundos a partir de un texto:
+    ``const:ms``, ``uniform:min,max``, ``normal:media,desv`` o ``lognormal:mediana,sigma``.
+    """
+    kind, _, raw = spec.partition(":")
+    params = [float(v) for v in raw.split(",") if v]
+    if kind == "const" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal" and len(params) == 2:
+        mu = math.log(params[0])
+        return lambda rng: rng.lognormvariate(mu, params[1])
+    raise ValueError(f"Distribución de latencia no válida: '{spec}'")
+
+
+class UpstreamTimer(threading.local):
+    """Acumula, por hilo, el tiempo pasado dentro de los clientes falsos."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.target = None
+
+    def reset(self) -> None:
+        self.seconds = 0.0
+        self.target = None
+
+
+class _FakeClientBase:
+    def __init__(self, timer: UpstreamTimer, latencies: Dict[str, str], error_rates: Dict[str, float],
+                 default_latency: str, seed: int):
+        self.timer = timer
+        self._latency = {name: parse_latency(spec) for name, spec in latencies.items()}
+        self._default_latency = parse_latency(default_latency)
+        self._error_rates = error_rates
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _simulate(self, target: str) -> None:
+        with self._rng_lock:
+            delay_ms = self._latency.get(target, self._default_latency)(self._rng)
+            fail = self._rng.random() < self._error_rates.get(target, 0.0)
+        time.sleep(delay_ms / 1000.0)
+        if fail:
+            raise FakeUpstreamError(f"Error simulado en {target}")
+
+    @contextlib.contextmanager
+    def _timed(self, target: str):
+        self.timer.target = target
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timer.seconds += time.perf_counter() - started
+
+
+class FakeSageMakerRuntime(_FakeClientBase):
+    """``invoke_endpoint`` falso; responde con un handler local o con una predicción simulada."""
+
+    def __init__(self, *args, delegates: Optional[Dict[str, Any]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delegates = delegates or {}
+
+    def invoke_endpoint(self, EndpointName: str, Body: Any, ContentType: str = "application/json",
+                        Accept: str = "application/json", **_: Any) -> dict:
+        with self._timed(EndpointName):
+            handler = self.delegates.get(EndpointName)
+            if handler is not None:
+                payload = handler.invoke(Body, ContentType, Accept)
+                if isinstance(payload, str):
+                    payload = payload.encode("utf-8")
+            else:
+                self._simulate(EndpointName)
+                payload = self._canned(EndpointName)
+        return {"Body": io.BytesIO(payload), "ContentType": Accept}
+
+    def _canned(self, endpoint: str) -> bytes:
+        if "deepseek" in endpoint or "quick-start" in endpoint:
+            return json.dumps({"response": "Respuesta simulada."}).encode()
+        with self._rng_lock:
+            logits = [self._rng.random() for _ in range(10)]
+        total = sum(logits)
+        probabilities = [v / total for v in logits]
+        # Mismo esquema que el output_fn de los handlers MNIST
+        return json.dumps({
+            "predicted_class": probabilities.index(max(probabilities)),
+            "probabilities": [f"{p:.6f}" for p in probabilities],
+        }).encode()
+
+
+class FakeBedrockRuntime(_FakeClientBase):
+    """``invoke_model`` falso con el formato de respuesta de cada familia de modelos."""
+
+    def invoke_model(self, modelId: str, body: Any, **_: Any) -> dict:
+        with self._timed(modelId):
+            self._simulate(modelId)
+            text = "Respuesta simulada de Bedrock."
+            if "claude-3" in modelId:
+                result = {"content": [{"type": "text", "text": text}]}
+            elif "nova" in modelId:
+                result = {"output": {"message": {"content": [{"text": text}]}}}
+            else:
+                result = {"completion": text}
+        return {"body": io.BytesIO(json.dumps(result).encode())}
+
+
+def load_events(path: str) -> List[dict]:
+    """Eventos de un JSONL, un arreglo JSON o un log de CloudWatch con líneas ``EVENT: {...}``."""
+    with open(path, encoding="utf-8") as fh:
+        text = fh.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        return json.loads(stripped)
+    events = []
+    for line in text.splitlines():
+        if "EVENT:" in line:
+            line = line.split("EVENT:", 1)[1]
+        line = line.strip()
+        if line.startswith("{"):
+            events.append(json.loads(line))
+    if not events:
+        raise ValueError(f"No se encontraron eventos en {path}")
+    return events
+
+
+def _v2_event(path: str, body: dict) -> dict:
+    return {
+        "version": "2.0",
+        "rawPath": path,
+        "requestContext": {"http": {"method": "POST", "path": path}},
+        "headers": {"content-type": "application/json"},
+        "body": json.dumps(body),
+        "isBase64Encoded": False,
+    }
+
+
+def synthetic_events(n: int, seed: int = 0) -> List[dict]:
+    """Mezcla de eventos HTTP API v2: dígitos MNIST a ambos endpoints y algunos mensajes de chat."""
+    rng = random.Random(seed)
+    pngs = mnist_pngs(n, seed)
+    texts = spanish_texts(n, seed, max_words=30)
+    events = []
+    for i in range(n):
+        roll = rng.random()
+        if roll < 0.45:
+            path = "/predict/mnist_classical"
+        elif roll < 0.9:
+            path = "/predict/mnist_hybrid"
+        else:
+            events.append(_v2_event("/api/bedrock-chat", {"prompt": texts[i]}))
+            continue
+        events.append(_v2_event(path, {"input": base64.b64encode(pngs[i]).decode("ascii")}))
+    return events
+
+
+def event_route(event: dict) -> str:
+    method = (event.get("requestContext", {}).get("http", {}).get("method") or event.get("httpMethod") or "")
+    return f"{method.upper()} {(event.get('rawPath') or event.get('path') or '').lower()}"
+
+
+def load_lambda_module(sagemaker_client, bedrock_client):
+    """
+    Importa ``lambda_function`` y sustituye sus clientes por los falsos.
+
+    Si boto3 no está instalado (no hace falta para reproducir), se registra un
+    módulo ``boto3`` mínimo cuyo ``client()`` devuelve directamente los falsos.
+    """
+    if importlib.util.find_spec("boto3") is None and "boto3" not in sys.modules:
+        clients = {"sagemaker-runtime": sagemaker_client, "bedrock-runtime": bedrock_client}
+        boto3 = types.ModuleType("boto3")
+        boto3.client = lambda service, **_: clients[service]
+        sys.modules["boto3"] = boto3
+    os.environ.setdefault("AWS_REGION", "us-east-1")
+    os.environ.setdefault("AWS_DEFAULT_REGION", os.environ["AWS_REGION"])
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "replay")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "replay")
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR))
+    import lambda_function
+
+    lambda_function.sagemaker_runtime = sagemaker_client
+    lambda_function.bedrock_runtime = bedrock_client
+    # Los endpoints sombra (SHADOW_ENDPOINTS) también van al SageMaker falso
+    lambda_function.shadow._client = sagemaker_client
+    return lambda_function
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))], 3)
+
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99),
+            "mean": round(sum(ordered) / len(ordered), 3), "max": round(ordered[-1], 3)}
+
+
+class Recorder:
+    """Resultados por petición, agregados por ruta al final."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: List[dict] = []
+
+    def add(self, sample: dict) -> None:
+        with self._lock:
+            self.samples.append(sample)
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        by_route = defaultdict(list)
+        for sample in self.samples:
+            by_route[sample["route"]].append(sample)
+        by_route["*"] = self.samples
+
+        routes = {}
+        for route, samples in sorted(by_route.items()):
+            statuses = defaultdict(int)
+            for s in samples:
+                statuses[str(s["status"])] += 1
+            routes[route] = {
+                "requests": len(samples),
+                "status": dict(statuses),
+                "error_rate": round(sum(1 for s in samples if s["status"] >= 500) / len(samples), 4),
+                "latency_ms": _percentiles([s["total_ms"] for s in samples]),
+                "queue_ms": _percentiles([s["queue_ms"] for s in samples]),
+                "upstream_ms": _percentiles([s["upstream_ms"] for s in samples]),
+                "proxy_overhead_ms": _percentiles([s["proxy_ms"] for s in samples]),
+            }
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_rps": round(len(self.samples) / wall_seconds, 3) if wall_seconds else 0.0,
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+            "routes": routes,
+        }
+
+
+class Replayer:
+    def __init__(self, lambda_module, timer: UpstreamTimer, recorder: Recorder):
+        self.lambda_module = lambda_module
+        self.timer = timer
+        self.recorder = recorder
+
+    def send(self, event: dict, scheduled: Optional[float] = None) -> None:
+        self.timer.reset()
+        started = time.perf_counter()
+        try:
+            response = self.lambda_module.lambda_handler(event, None)
+            status = int(response.get("statusCode", 0))
+        except Exception:  # la Lambda captura todo; esto sería un fallo del propio proxy
+            status = 599
+        finished = time.perf_counter()
+        upstream_ms = self.timer.seconds * 1000.0
+        handler_ms = (finished - started) * 1000.0
+        queue_ms = (started - scheduled) * 1000.0 if scheduled is not None else 0.0
+        self.recorder.add({
+            "route": event_route(event),
+            "status": status,
+            "total_ms": handler_ms + queue_ms,
+            "queue_ms": queue_ms,
+            "upstream_ms": upstream_ms,
+            "proxy_ms": max(handler_ms - upstream_ms, 0.0),
+        })
+
+    def closed_loop(self, events: List[dict], concurrency: int, total: int, deadline: Optional[float]) -> None:
+        counter = iter(range(total))
+        lock = threading.Lock()
+
+        def worker():
+            while deadline is None or time.perf_counter() < deadline:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                self.send(events[i % len(events)])
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def open_loop(self, events: List[dict], rate: float, concurrency: int, total: int,
+                  deadline: Optional[float], seed: int) -> None:
+        rng = random.Random(seed)
+        next_arrival = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for i in range(total):
+                next_arrival += rng.expovariate(rate)
+                if deadline is not None and next_arrival >= deadline:
+                    break
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, events[i % len(events)], next_arrival)
+
+
+def _parse_mapping(items: Optional[List[str]], cast=str) -> Dict[str, Any]:
+    mapping = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Se esperaba NOMBRE=VALOR y se recibió '{item}'")
+        mapping[key] = cast(value)
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", help="Captura de eventos (JSONL, arreglo JSON o log de CloudWatch)")
+    parser.add_argument("--synthetic", type=int, default=200, help="Eventos sintéticos si no se pasa --events")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, help="Llegadas por segundo (lazo abierto); sin él, lazo cerrado")
+    parser.add_argument("--requests", type=int, help="Peticiones a enviar (por defecto, una pasada por la captura)")
+    parser.add_argument("--duration", type=float, help="Límite de tiempo en segundos")
+    parser.add_argument("--latency", action="append", metavar="DESTINO=DIST",
+                        help="Latencia por endpoint/modelo, p. ej. mnist-classical-endpoint=lognormal:40,0.5")
+    parser.add_argument("--default-latency", default=DEFAULT_LATENCY)
+    parser.add_argument("--bedrock-latency", default=DEFAULT_BEDROCK_LATENCY)
+    parser.add_argument("--error-rate", action="append", metavar="DESTINO=FRACCION")
+    parser.add_argument("--delegate", action="append", metavar="ENDPOINT=DIR_MODELO",
+                        help="Atiende un endpoint con el handler local de modelos/")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quiet-lambda", action=argparse.BooleanOptionalAction, default=True,
+                        help="Descarta los print de la Lambda durante la reproducción")
+    parser.add_argument("--output", help="Archivo JSON para el reporte")
+    args = parser.parse_args()
+
+    latencies = _parse_mapping(args.latency)
+    error_rates = _parse_mapping(args.error_rate, float)
+    delegates = {}
+    if args.delegate:
+        from handler_loader import Handler
+
+        for endpoint, model_dir in _parse_mapping(args.delegate).items():
+            print(f"Cargando {model_dir} para {endpoint}...")
+            delegates[endpoint] = Handler(model_dir).load()
+
+    timer = UpstreamTimer()
+    sagemaker = FakeSageMakerRuntime(timer, latencies, error_rates, args.default_latency, args.seed,
+                                     delegates=delegates)
+    bedrock = FakeBedrockRuntime(timer, latencies, error_rates, args.bedrock_latency, args.seed + 1)
+    lambda_module = load_lambda_module(sagemaker, bedrock)
+
+    events = load_events(args.events) if args.events else synthetic_events(args.synthetic, args.seed)
+    total = args.requests or (len(events) if args.duration is None else sys.maxsize)
+    recorder = Recorder()
+    replayer = Replayer(lambda_module, timer, recorder)
+
+    mode = f"lazo abierto a {args.rate} rps" if args.rate else f"lazo cerrado con {args.concurrency} clientes"
+    print(f"Reproduciendo {len(events)} eventos ({mode})...", flush=True)
+    started = time.perf_counter()
+    deadline = started + args.duration if args.duration else None
+    sink = open(os.devnull, "w") if args.quiet_lambda else None
+    with contextlib.redirect_stdout(sink) if sink else contextlib.nullcontext():
+        if args.rate:
+            replayer.open_loop(events, args.rate, args.concurrency, total, deadline, args.seed)
+        else:
+            replayer.closed_loop(events, args.concurrency, total, deadline)
+    if sink:
+        sink.close()
+    report = recorder.report(time.perf_counter() - started)
+    report["config"] = {
+        "mode": "open" if args.rate else "closed",
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "delegates": sorted(delegates),
+        "latency": latencies,
+        "error_rate": error_rates,
+    }
+
+    for route, stats in report["routes"].items():
+        print(f"{route}: {stats['requests']} peticiones, errores {stats['error_rate']:.1%}, "
+              f"p50 {stats['latency_ms']['p50']} ms, p99 {stats['latency_ms']['p99']} ms "
+              f"(upstream p50 {stats['upstream_ms']['p50']} ms, overhead p50 {stats['proxy_overhead_ms']['p50']} ms)")
+    print(f"Throughput {report['throughput_rps']} rps, pico de RSS {report['peak_rss_mb']} MiB")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Reporte guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
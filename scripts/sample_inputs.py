@@ -0,0 +1,136 @@
+"""
+Entradas representativas para ejercitar los handlers localmente.
+
+Genera peticiones con el mismo formato que envían el frontend y la Lambda:
+  - MNIST: PNG 28x28 en base64 (``{"input": ...}``); usa los PNG de
+    ``page/public/mnist_samples`` si existen y si no dibuja dígitos sintéticos.
+  - Neumonía: JPEG en escala de grises de varios tamaños (``image/jpeg``);
+    usa radiografías reales de ``--xray-dir`` si se pasan.
+  - Sentimientos: textos en español de longitudes mezcladas (``{"input": ...}``).
+
+Todas las funciones son deterministas para una semilla dada, de modo que dos
+corridas del benchmark usan exactamente las mismas entradas.
+"""
+
+import base64
+import io
+import json
+import random
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MNIST_SAMPLES_DIR = ROOT_DIR / "page" / "public" / "mnist_samples"
+
+# Tipo de entrada por nombre de directorio del handler
+HANDLER_KINDS = {
+    "mnist_classical": "mnist",
+    "mnist_quantum": "mnist",
+    "neumonia": "xray",
+    "svm_countvectorizer": "text",
+    "svm_tfidfvectorizer": "text",
+    "model_pysentimiento": "text",
+}
+
+XRAY_SIDES = (256, 512, 1024, 2048)
+
+_WORDS = (
+    "el la los las un una servicio comida película producto entrega precio calidad atención "
+    "excelente pésimo bueno malo regular increíble horrible rápido lento amable grosero "
+    "me encantó no volvería recomiendo nunca siempre muy poco bastante demasiado todo nada "
+    "pero aunque además sin embargo llegó tarde temprano frío caliente barato caro "
+    "hotel restaurante tienda aplicación pedido personal habitación envío"
+).split()
+
+
+class Sample(NamedTuple):
+    body: bytes
+    content_type: str
+    description: str
+
+
+def handler_kind(handler_name: str) -> str:
+    if handler_name not in HANDLER_KINDS:
+        raise ValueError(f"No hay entradas de ejemplo para el handler '{handler_name}'")
+    return HANDLER_KINDS[handler_name]
+
+
+def spanish_texts(n: int, seed: int = 0, min_words: int = 3, max_words: int = 120) -> List[str]:
+    """Textos con longitudes repartidas log-uniformemente entre ``min_words`` y ``max_words``."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        length = int(round(min_words * (max_words / min_words) ** rng.random()))
+        texts.append(" ".join(rng.choice(_WORDS) for _ in range(length)).capitalize() + ".")
+    return texts
+
+
+def mnist_pngs(n: int, seed: int = 0) -> List[bytes]:
+    """PNG 28x28 de dígitos: muestras reales del carrusel o dígitos dibujados con PIL."""
+    files = sorted(MNIST_SAMPLES_DIR.glob("mnist_*.png")) if MNIST_SAMPLES_DIR.is_dir() else []
+    if files:
+        rng = random.Random(seed)
+        return [rng.choice(files).read_bytes() for _ in range(n)]
+
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    pngs = []
+    for _ in range(n):
+        img = Image.new("L", (28, 28), 0)
+        draw = ImageDraw.Draw(img)
+        draw.text((rng.randint(6, 12), rng.randint(4, 10)), str(rng.randint(0, 9)), fill=255)
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        pngs.append(buffer.getvalue())
+    return pngs
+
+
+def synthetic_xray(side: int, seed: int = 0) -> bytes:
+    """JPEG en escala de grises con dos campos pulmonares, costillas y ruido."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    h, w = side, int(side * 0.85)
+    img = np.full((h, w), 180, dtype=np.uint8)
+    for cx in (w // 3, 2 * w // 3):
+        cv2.ellipse(img, (cx, h // 2), (w // 7, h // 3), 0, 0, 360, 60, -1)
+    for y in range(h // 6, 5 * h // 6, max(h // 14, 1)):
+        cv2.line(img, (w // 8, y), (7 * w // 8, y + h // 20), 210, max(side // 128, 1))
+    noise = rng.normal(0, 12, img.shape)
+    img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    img = cv2.GaussianBlur(img, (5, 5), 0)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("No se pudo codificar la radiografía sintética")
+    return encoded.tobytes()
+
+
+def xray_jpegs(n: int, seed: int = 0, xray_dir: Optional[str] = None) -> List[bytes]:
+    """Radiografías reales de ``xray_dir`` o sintéticas alternando los tamaños de ``XRAY_SIDES``."""
+    if xray_dir:
+        files = sorted(p for p in Path(xray_dir).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg"))
+        if files:
+            rng = random.Random(seed)
+            return [rng.choice(files).read_bytes() for _ in range(n)]
+    cache = {side: synthetic_xray(side, seed) for side in XRAY_SIDES}
+    return [cache[XRAY_SIDES[i % len(XRAY_SIDES)]] for i in range(n)]
+
+
+def samples_for(handler_name: str, n: int, seed: int = 0, xray_dir: Optional[str] = None) -> List[Sample]:
+    """``n`` peticiones de un solo elemento para el handler ``handler_name``."""
+    kind = handler_kind(handler_name)
+    if kind == "mnist":
+        return [
+            Sample(json.dumps({"input": base64.b64encode(png).decode("ascii")}).encode(), "application/json", "png28")
+            for png in mnist_pngs(n, seed)
+        ]
+    if kind == "xray":
+        return [Sample(jpeg, "image/jpeg", f"jpeg{len(jpeg) // 1024}kb") for jpeg in xray_jpegs(n, seed, xray_dir)]
+    return [
+        Sample(json.dumps({"input": [text]}, ensure_ascii=False).encode("utf-8"), "application/json",
+               f"text{len(text.split())}w")
+        for text in spanish_texts(n, seed)
+    ]
@@ -0,0 +1,400 @@
+"""
+Servidor local compatible con el contrato de inferencia de SageMaker.
+
+Carga cualquier handler de ``modelos/`` (directorio con ``code/inference.py``
+y sus artefactos) y expone:
+  GET  /ping         200 cuando el modelo está cargado
+  POST /invocations  input_fn → predict_fn → output_fn
+  GET  /stats        contadores de peticiones y tamaño medio de lote
+
+Con ``--catalog modelos`` sirve todos los handlers del catálogo desde un solo
+proceso (``model_registry.ModelRegistry``): cada modelo se carga al primer
+uso y los menos usados se descargan al superar ``--memory-budget-mb``
+(``--model-size-mb nombre=MB`` fija la huella de un modelo en vez de
+medirla).  El modelo se elige con ``POST /models/<nombre>/invoke`` o con la
+cabecera ``X-Amzn-SageMaker-Target-Model`` en ``/invocations``;
+``GET /models`` devuelve eventos agregados, tasa de aciertos y memoria por
+modelo.
+
+Las peticiones concurrentes se agrupan en lotes (hasta ``--max-batch-size``
+peticiones o ``--max-batch-delay-ms`` de espera) antes de llamar a
+``predict_fn``; ``input_fn`` y ``output_fn`` corren en el hilo de cada
+petición.  Sirve como banco de pruebas de throughput y como entrypoint de
+contenedor (puerto 8080 por defecto, como SageMaker).
+
+Con ``--workers N`` el proceso abre el socket y se bifurca en N workers que
+aceptan conexiones sobre él, como el servidor de modelos de SageMaker.  Sin
+``--preload`` cada worker llama a ``model_fn`` (N copias de los pesos); con
+``--preload`` el modelo se carga una vez en el padre, se congela el GC
+(``gc.freeze``) y los workers comparten las páginas de pesos por
+copy-on-write.  ``scripts/measure_worker_memory.py`` compara ambos modos.
+Los hilos no sobreviven a ``fork``: los lotes dinámicos se crean en cada
+worker, y un pool de OpenMP creado en el padre deja colgados a los hijos.
+Durante la precarga ``PRELOAD_MODEL=1`` está en el entorno, así que
+``thread_planner.finalize`` no mide ni calibra (``THREAD_PLAN``) dentro de
+``model_fn``; los calentamientos de los handlers sí ejecutan inferencias y
+hay que desactivarlos al precargar con ``--workers``:
+``SENTIMENT_WARMUP=0`` (pysentimiento) y ``MNIST_WARMUP_BATCHES=""``
+(Hybrid_QNN).
+
+Uso:
+  python scripts/serve_local.py --model-dir modelos/sentimientos/svm_countvectorizer
+  curl -X POST localhost:8080/invocations -H 'Content-Type: application/json' \
+    -d '{"input": "me encantó"}'
+
+  python scripts/serve_local.py --catalog modelos --memory-budget-mb 3000
+  python scripts/serve_local.py --model-dir modelos/neumonia --workers 4 --preload
+  curl -X POST localhost:8080/models/neumonia/invoke -H 'Content-Type: image/jpeg' \
+    --data-binary @radiografia.jpeg
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, List
+
+from handler_loader import DEFAULT_CONTENT_TYPE, Handler, discover_handlers
+from model_registry import ModelRegistry
+
+
+logger = logging.getLogger("serve_local")
+
+TARGET_MODEL_HEADER = "X-Amzn-SageMaker-Target-Model"
+
+
+class RouteNotFound(Exception):
+    """La ruta o el modelo pedido no existen (HTTP 404)."""
+
+
+class _Pending:
+    """Una petición en espera de su resultado dentro de un lote."""
+
+    __slots__ = ("data", "result", "error", "done")
+
+    def __init__(self, data: Any):
+        self.data = data
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class DynamicBatcher:
+    """
+    Agrupa entradas concurrentes y las envía juntas a ``predict_fn``.
+
+    Un único hilo consume la cola: toma la primera petición, espera como
+    máximo ``max_delay_ms`` a que lleguen más (hasta ``max_batch_size``) y
+    ejecuta el lote.  Si el handler no admite lotes, las peticiones del lote
+    se ejecutan una a una en el mismo hilo.
+    """
+
+    def __init__(self, handler: Handler, max_batch_size: int = 8, max_delay_ms: float = 5.0):
+        self.handler = handler
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max_delay_ms / 1000.0
+        self.requests = 0
+        self.batches = 0
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{handler.name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, data: Any) -> Any:
+        pending = _Pending(data)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join(timeout=1.0)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_batch_delay_ms": self.max_delay * 1000.0,
+        }
+
+    def _collect(self) -> List[_Pending]:
+        batch = [self._queue.get(timeout=0.1)]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                batch = self._collect()
+            except queue.Empty:
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = self.handler.predict_many([p.data for p in batch])
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:  # el error se propaga a todas las peticiones del lote
+                logger.exception("Error en predict_fn para un lote de %d peticiones", len(batch))
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+
+def _accept(header_value: str) -> str:
+    if not header_value or header_value.strip() == "*/*":
+        return DEFAULT_CONTENT_TYPE
+    return header_value.split(",")[0].strip()
+
+
+class SingleModelRoutes:
+    """Enrutamiento de un solo handler: todo ``/invocations`` va al mismo lote dinámico."""
+
+    def __init__(self, handler: Handler, batcher: DynamicBatcher):
+        self.handler = handler
+        self.batcher = batcher
+
+    def ready(self) -> bool:
+        return self.handler.model is not None
+
+    def stats(self) -> dict:
+        return {"pid": os.getpid(), **self.batcher.stats()}
+
+    @contextlib.contextmanager
+    def resolve(self, path: str, headers):
+        if path != "/invocations":
+            raise RouteNotFound(f"Ruta no encontrada: {path}")
+        yield self.handler, self.batcher
+
+
+class CatalogRoutes:
+    """Enrutamiento multi-modelo sobre un ``ModelRegistry``."""
+
+    def __init__(self, registry: ModelRegistry):
+        self.registry = registry
+
+    def ready(self) -> bool:
+        return True
+
+    def stats(self) -> dict:
+        return {"pid": os.getpid(), **self.registry.stats()}
+
+    @contextlib.contextmanager
+    def resolve(self, path: str, headers):
+        parts = path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "models" and parts[2] == "invoke":
+            name = parts[1]
+        elif path == "/invocations" and headers.get(TARGET_MODEL_HEADER):
+            name = headers.get(TARGET_MODEL_HEADER)
+        else:
+            raise RouteNotFound(f"Ruta no encontrada: {path}")
+        if name not in self.registry.catalog:
+            raise RouteNotFound(f"Modelo desconocido: {name}")
+        with self.registry.use(name) as entry:
+            yield entry.handler, entry.batcher
+
+
+def make_request_handler(routes):
+    class InvocationHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):  # silencia el log por petición de http.server
+            logger.debug(fmt, *args)
+
+        def _send(self, status: int, body: Any, content_type: str = DEFAULT_CONTENT_TYPE) -> None:
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/ping":
+                self._send(200 if routes.ready() else 503, json.dumps({"status": "healthy"}))
+            elif self.path in ("/stats", "/models"):
+                self._send(200, json.dumps(routes.stats()))
+            else:
+                self._send(404, json.dumps({"error": f"Ruta no encontrada: {self.path}"}))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            # Cabecera completa, como la pasa SageMaker: multipart necesita el boundary
+            content_type = self.headers.get("Content-Type") or DEFAULT_CONTENT_TYPE
+            accept = _accept(self.headers.get("Accept"))
+            try:
+                with routes.resolve(self.path, self.headers) as (handler, batcher):
+                    data = handler.input_fn(body, content_type)
+                    prediction = batcher.submit(data)
+                    self._send(200, handler.output_fn(prediction, accept), accept)
+            except RouteNotFound as e:
+                self._send(404, json.dumps({"error": str(e)}))
+            except ValueError as e:
+                self._send(400, json.dumps({"error": str(e)}))
+            except Exception as e:
+                logger.exception("Error procesando la petición")
+                self._send(500, json.dumps({"error": f"Internal server error: {e}"}))
+
+    return InvocationHandler
+
+
+def serve_forked(server: ThreadingHTTPServer, workers: int, build_routes: Callable[[], Any]) -> None:
+    """
+    Bifurca ``workers`` procesos que atienden el socket ya abierto de ``server``.
+
+    ``build_routes`` corre en cada worker después del ``fork`` (crea los hilos
+    de lote y, si no hubo precarga, carga el modelo).  El padre solo espera y
+    reenvía SIGTERM/SIGINT a los workers.
+    """
+    children = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                server.RequestHandlerClass = make_request_handler(build_routes())
+                logger.info("Worker %d listo (pid %d)", index, os.getpid())
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                logger.exception("El worker %d terminó con error", index)
+                status = 1
+            finally:
+                os._exit(status)
+        children.append(pid)
+
+    def stop_children(signum, frame):
+        for child in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(child, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop_children)
+    try:
+        for _ in children:
+            pid, status = os.wait()
+            logger.info("Worker pid %d terminó (estado %d)", pid, status)
+    except KeyboardInterrupt:
+        stop_children(signal.SIGINT, None)
+        for _ in children:
+            with contextlib.suppress(ChildProcessError):
+                os.wait()
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=os.environ.get("SM_MODEL_DIR", "/opt/ml/model"),
+                        help="Directorio del modelo (con code/inference.py)")
+    parser.add_argument("--catalog", help="Directorio raíz con varios modelos (p. ej. modelos/) para servir todos")
+    parser.add_argument("--memory-budget-mb", type=float, default=float(os.environ.get("MEMORY_BUDGET_MB", 4096)),
+                        help="Presupuesto de RSS para los modelos cargados en modo catálogo")
+    parser.add_argument("--events-file", help="JSONL donde registrar eventos de carga/expulsión del catálogo")
+    parser.add_argument("--model-size-mb", action="append", default=[], metavar="NOMBRE=MB",
+                        help="Huella fija de un modelo del catálogo en lugar de medirla (repetible)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SAGEMAKER_BIND_TO_PORT", 8080)))
+    parser.add_argument("--max-batch-size", type=int, default=int(os.environ.get("MAX_BATCH_SIZE", 8)))
+    parser.add_argument("--max-batch-delay-ms", type=float, default=float(os.environ.get("MAX_BATCH_DELAY_MS", 5)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SAGEMAKER_MODEL_SERVER_WORKERS", 1)),
+                        help="Procesos worker que comparten el puerto")
+    parser.add_argument("--preload", action="store_true", default=os.environ.get("PRELOAD_MODEL", "0") == "1",
+                        help="Carga los modelos en el padre antes de bifurcar (pesos compartidos por copy-on-write)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def new_batcher(handler: Handler) -> DynamicBatcher:
+        return DynamicBatcher(handler, args.max_batch_size, args.max_batch_delay_ms)
+
+    forked = args.workers > 1
+    preload = args.preload or not forked
+    if forked and args.preload:
+        # model_fn se ejecuta en el padre antes de fork: sin inferencias de
+        # medición del plan de hilos (thread_planner.py)
+        os.environ["PRELOAD_MODEL"] = "1"
+    else:
+        os.environ.pop("PRELOAD_MODEL", None)
+    if args.catalog:
+        catalog = discover_handlers(args.catalog)
+        sizes_mb = {}
+        for spec in args.model_size_mb:
+            name, _, size = spec.partition("=")
+            if name not in catalog or not size:
+                parser.error(f"--model-size-mb {spec}: se espera NOMBRE=MB con un modelo de {sorted(catalog)}")
+            sizes_mb[name] = float(size)
+        registry = ModelRegistry(catalog, args.memory_budget_mb, events_path=args.events_file, sizes_mb=sizes_mb)
+        if args.preload:
+            for name in sorted(catalog):
+                registry.preload(name)
+        description = f"catálogo {sorted(catalog)} (presupuesto {args.memory_budget_mb:.0f} MiB)"
+
+        def build_routes():
+            registry.start_batchers(new_batcher)
+            return CatalogRoutes(registry)
+    else:
+        handler = Handler(args.model_dir)
+        if preload:
+            handler.load()
+        description = handler.name
+
+        def build_routes():
+            handler.load()
+            return SingleModelRoutes(handler, new_batcher(handler))
+
+    if forked:
+        server = ThreadingHTTPServer((args.host, args.port), BaseHTTPRequestHandler)
+        server.daemon_threads = True
+        if args.preload:
+            # Lo cargado hasta aquí pasa a la generación permanente: el GC de
+            # los workers no lo recorre ni ensucia sus páginas compartidas.
+            gc.collect()
+            gc.freeze()
+        logger.info("Sirviendo %s en http://%s:%d con %d workers (%s)", description, args.host, args.port,
+                    args.workers, "precargado" if args.preload else "carga por worker")
+        # Lo que carguen los workers ya corre después de fork
+        os.environ.pop("PRELOAD_MODEL", None)
+        serve_forked(server, args.workers, build_routes)
+        return
+
+    routes = build_routes()
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(routes))
+    server.daemon_threads = True
+    logger.info("Sirviendo %s en http://%s:%d (lote máx. %d, espera máx. %.1f ms)",
+                description, args.host, args.port, args.max_batch_size, args.max_batch_delay_ms)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if isinstance(routes, SingleModelRoutes):
+            routes.batcher.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Ajusta workers × hilos intra-op de un handler PyTorch y guarda ``thread_plan.json``.
+
+Para cada número de núcleos (``--cpus``, por defecto todos los disponibles)
+prueba las combinaciones que los ocupan sin sobresuscribir: hilos = 1, 2,
+4... y workers = núcleos // hilos.  Cada worker es un proceso con afinidad a
+esos núcleos, su propia copia del modelo (como en el servidor de SageMaker) y
+``torch.set_num_threads(hilos)``; todos arrancan a la vez y durante
+``--seconds`` ejecutan lotes completos (input_fn → predict_fn → output_fn).
+
+Se elige la combinación con más throughput cuya latencia p95 por lote no pase
+de ``--max-p95-ms`` y se escribe en ``<model-dir>/thread_plan.json``.
+``build_artifacts.py`` lo empaqueta con el modelo y el handler lo aplica con
+``THREAD_PLAN=profile`` (ver ``thread_planner.py``); el número de workers
+recomendado se configura con ``SAGEMAKER_MODEL_SERVER_WORKERS``.
+
+Uso:
+  python scripts/tune_threads.py --model-dir modelos/mnist/mnist_classical
+  python scripts/tune_threads.py --model-dir modelos/sentimientos/model_pysentimiento \
+    --cpus 2 4 --batch-size 8 --max-workers 4
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmark_handlers import percentile
+from handler_loader import DEFAULT_CONTENT_TYPE, Handler
+from sample_inputs import samples_for
+
+
+def _worker(model_dir: str, cpu_ids: List[int], threads: int, batch_size: int, seconds: float, seed: int,
+            barrier, queue) -> None:
+    os.sched_setaffinity(0, cpu_ids)
+    # El handler no debe aplicar su propio plan: los hilos los fija este script
+    os.environ["THREAD_PLAN"] = "off"
+    import torch
+
+    torch.set_num_threads(threads)
+    handler = Handler(model_dir).load()
+    samples = samples_for(handler.name, batch_size * 8, seed)
+    batches = [samples[i:i + batch_size] for i in range(0, len(samples), batch_size)]
+
+    def run(batch):
+        inputs = [handler.input_fn(s.body, s.content_type) for s in batch]
+        for prediction in handler.predict_many(inputs):
+            handler.output_fn(prediction, DEFAULT_CONTENT_TYPE)
+
+    run(batches[0])
+    barrier.wait()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        run(batches[len(latencies) % len(batches)])
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    queue.put(latencies)
+
+
+def run_candidate(model_dir: str, cpu_ids: List[int], workers: int, threads: int, args) -> Dict[str, Any]:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(model_dir, cpu_ids, threads, args.batch_size, args.seconds, args.seed,
+                                          barrier, queue))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    latencies = []
+    for _ in processes:
+        latencies.extend(queue.get())
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return {
+        "cpus": len(cpu_ids),
+        "workers": workers,
+        "intra_op_threads": threads,
+        "throughput_items_per_s": round(len(latencies) * args.batch_size / args.seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+    }
+
+
+def candidates(cpus: int, max_workers: Optional[int]) -> List[tuple]:
+    pairs = []
+    threads = 1
+    while threads <= cpus:
+        workers = cpus // threads
+        if not max_workers or workers <= max_workers:
+            pairs.append((workers, threads))
+        threads *= 2
+    if cpus not in [t for _, t in pairs]:
+        pairs.append((1, cpus))
+    return pairs
+
+
+def choose(results: List[Dict[str, Any]], max_p95_ms: Optional[float]) -> Dict[str, Any]:
+    eligible = [r for r in results if max_p95_ms is None or r["p95_ms"] <= max_p95_ms] or results
+    return max(eligible, key=lambda r: r["throughput_items_per_s"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--cpus", nargs="+", type=int, help="Núcleos a probar (por defecto, todos los disponibles)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Peticiones por lote")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duración de cada combinación")
+    parser.add_argument("--max-workers", type=int, help="Límite de workers (memoria: una copia del modelo por worker)")
+    parser.add_argument("--max-p95-ms", type=float, help="Latencia p95 máxima aceptable por lote")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Destino (por defecto <model-dir>/thread_plan.json)")
+    args = parser.parse_args()
+
+    available = sorted(os.sched_getaffinity(0))
+    cpu_counts = args.cpus or [len(available)]
+    all_results, plans = [], []
+    for cpus in cpu_counts:
+        if cpus > len(available):
+            parser.error(f"Solo hay {len(available)} núcleos disponibles")
+        cpu_ids = available[:cpus]
+        results = []
+        for workers, threads in candidates(cpus, args.max_workers):
+            result = run_candidate(args.model_dir, cpu_ids, workers, threads, args)
+            print(f"  {cpus} núcleos: {workers} workers × {threads} hilos → "
+                  f"{result['throughput_items_per_s']:.1f} items/s, p95 {result['p95_ms']:.2f} ms", flush=True)
+            results.append(result)
+        best = choose(results, args.max_p95_ms)
+        print(f"{cpus} núcleos: se elige {best['workers']} workers × {best['intra_op_threads']} hilos", flush=True)
+        plans.append(best)
+        all_results.extend(results)
+
+    output = args.output or os.path.join(args.model_dir, "thread_plan.json")
+    with open(output, "w", encoding="utf-8") as fh:
+        json.dump({
+            "handler": os.path.basename(os.path.normpath(args.model_dir)),
+            "batch_size": args.batch_size,
+            "plans": plans,
+            "candidates": all_results,
+        }, fh, indent=2)
+    print(f"Plan guardado en {output}")
+
+
+if __name__ == "__main__":
+    main()
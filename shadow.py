@@ -0,0 +1,205 @@
+"""
+Shadow-traffic mirroring for the SageMaker routes of the Lambda proxy.
+
+Before promoting a new model version (a retrained ``Hybrid_QNN``, the TF-IDF
+SVM, ...) a sampled fraction of production requests is also sent to a shadow
+endpoint.  The primary route never waits for it:
+
+  - ``mirror()`` submits the shadow invocation to a small thread pool as soon
+    as the request is routed, so it overlaps with the primary call; when the
+    pool is saturated the request is simply not mirrored;
+  - the shadow client has its own connect/read timeouts (``SHADOW_TIMEOUT_S``)
+    and no retries, so a slow candidate cannot pile up work;
+  - ``compare()`` hands the primary's response to the pool and returns
+    immediately; a background task waits for the shadow (within the same cap)
+    and appends the agreement and both latencies to the sink.
+
+The sink (``SHADOW_SINK``) is a JSONL file: one ``record`` line per mirrored
+request (route, endpoints, agreement, max probability difference, latencies
+or the shadow error) and a ``summary`` line every ``SHADOW_SUMMARY_EVERY``
+records with the running agreement rate and latency percentiles.
+
+Lambda freezes the container once the handler returns, so background work
+runs in the remaining time of the invocation or is resumed on the next one;
+records can arrive late but are never on the user's path.  Nothing is
+mirrored unless ``SHADOW_ENDPOINTS`` is set.
+
+Environment variables (read at import):
+  SHADOW_ENDPOINTS       route=endpoint pairs, comma separated, e.g.
+                         "/predict/mnist_hybrid=mnist-quantum-v2"
+  SHADOW_SAMPLE_RATE     fraction of requests mirrored (0.05)
+  SHADOW_TIMEOUT_S       cap on each shadow invocation (2.0)
+  SHADOW_MAX_INFLIGHT    concurrent shadow calls; beyond that, skip (4)
+  SHADOW_SINK            JSONL path for the stats (/tmp/shadow_stats.jsonl)
+  SHADOW_SUMMARY_EVERY   records between summary lines (100)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional
+
+SHADOW_ENDPOINTS = dict(
+    pair.split("=", 1) for pair in os.environ.get("SHADOW_ENDPOINTS", "").split(",") if "=" in pair
+)
+SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", "0.05"))
+TIMEOUT_S = float(os.environ.get("SHADOW_TIMEOUT_S", "2.0"))
+MAX_INFLIGHT = int(os.environ.get("SHADOW_MAX_INFLIGHT", "4"))
+SINK_PATH = os.environ.get("SHADOW_SINK", "/tmp/shadow_stats.jsonl")
+SUMMARY_EVERY = int(os.environ.get("SHADOW_SUMMARY_EVERY", "100"))
+
+# Keys under which the handlers return their predicted label
+PREDICTION_KEYS = ("predicted_class", "predicted_label", "prediction", "predictions", "label")
+
+_client = None
+_pool: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_inflight = threading.BoundedSemaphore(MAX_INFLIGHT) if MAX_INFLIGHT > 0 else None
+_stats: Dict[str, Any] = {"records": 0, "agree": 0, "errors": 0, "skipped": 0,
+                          "primary_ms": [], "shadow_ms": []}
+
+
+def _shadow_client():
+    """SageMaker client for shadow calls only: strict timeouts, no retries."""
+    global _client
+    if _client is None:
+        import boto3
+        from botocore.config import Config
+
+        _client = boto3.client("sagemaker-runtime", config=Config(
+            connect_timeout=TIMEOUT_S, read_timeout=TIMEOUT_S, retries={"max_attempts": 0}))
+    return _client
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                # Shadow calls plus the comparisons waiting on them
+                _pool = ThreadPoolExecutor(max_workers=max(1, MAX_INFLIGHT) * 2, thread_name_prefix="shadow")
+    return _pool
+
+
+def _invoke(endpoint: str, body: str, content_type: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        response = _shadow_client().invoke_endpoint(EndpointName=endpoint, ContentType=content_type, Body=body)
+        result = response["Body"].read().decode("utf-8")
+        return {"body": result, "latency_ms": (time.perf_counter() - started) * 1000.0}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "latency_ms": (time.perf_counter() - started) * 1000.0}
+    finally:
+        _inflight.release()
+
+
+def mirror(route: str, body: str, content_type: str = "application/json") -> Optional[Future]:
+    """Start the shadow call for a sampled request; ``None`` when not mirrored."""
+    endpoint = SHADOW_ENDPOINTS.get(route)
+    if endpoint is None or _inflight is None or random.random() >= SAMPLE_RATE:
+        return None
+    if not _inflight.acquire(blocking=False):
+        with _lock:
+            _stats["skipped"] += 1
+        return None
+    try:
+        return _executor().submit(_invoke, endpoint, body, content_type)
+    except RuntimeError:  # interpreter shutting down
+        _inflight.release()
+        return None
+
+
+def _prediction(body: Any) -> Dict[str, Any]:
+    """Predicted label and probabilities of a handler response, whatever its shape."""
+    try:
+        parsed = json.loads(body) if isinstance(body, (str, bytes)) else body
+    except ValueError:
+        return {"label": body, "probabilities": None}
+    if not isinstance(parsed, dict):
+        return {"label": parsed, "probabilities": None}
+    label = next((parsed[k] for k in PREDICTION_KEYS if k in parsed), None)
+    probabilities = parsed.get("probabilities") or parsed.get("proba")
+    try:
+        probabilities = [float(p) for p in probabilities] if probabilities else None
+    except (TypeError, ValueError):
+        probabilities = None
+    return {"label": label, "probabilities": probabilities}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))], 1) if ordered else 0.0
+
+
+def _write(lines: List[Dict[str, Any]]) -> None:
+    with open(SINK_PATH, "a", encoding="utf-8") as fh:
+        for line in lines:
+            fh.write(json.dumps(line) + "\n")
+
+
+def _compare(route: str, shadow_future: Future, primary_body: Any, primary_ms: float) -> None:
+    try:
+        shadow = shadow_future.result(timeout=TIMEOUT_S)
+    except FutureTimeout:
+        shadow = {"error": "timeout", "latency_ms": None}
+    record: Dict[str, Any] = {"type": "record", "ts": round(time.time(), 3), "route": route,
+                              "shadow_endpoint": SHADOW_ENDPOINTS.get(route), "primary_ms": round(primary_ms, 1),
+                              "shadow_ms": round(shadow["latency_ms"], 1) if shadow.get("latency_ms") else None}
+    if "error" in shadow:
+        record["error"] = shadow["error"]
+    else:
+        primary, candidate = _prediction(primary_body), _prediction(shadow["body"])
+        record["agree"] = primary["label"] == candidate["label"]
+        record["primary_label"], record["shadow_label"] = primary["label"], candidate["label"]
+        if primary["probabilities"] and candidate["probabilities"] \
+                and len(primary["probabilities"]) == len(candidate["probabilities"]):
+            record["max_prob_diff"] = round(max(abs(a - b) for a, b in
+                                                zip(primary["probabilities"], candidate["probabilities"])), 6)
+
+    lines = [record]
+    with _lock:
+        _stats["records"] += 1
+        _stats["primary_ms"].append(primary_ms)
+        if "error" in record:
+            _stats["errors"] += 1
+        else:
+            _stats["agree"] += int(record["agree"])
+            _stats["shadow_ms"].append(record["shadow_ms"])
+        if SUMMARY_EVERY and _stats["records"] % SUMMARY_EVERY == 0:
+            lines.append(summary())
+        # The latency windows only feed the percentiles of the next summary
+        if len(_stats["primary_ms"]) > SUMMARY_EVERY * 10:
+            del _stats["primary_ms"][:-SUMMARY_EVERY]
+            del _stats["shadow_ms"][:-SUMMARY_EVERY]
+        try:
+            _write(lines)
+        except OSError as e:
+            print(f"Shadow sink not writable ({SINK_PATH}): {e}")
+
+
+def compare(route: str, shadow_future: Optional[Future], primary_body: Any, primary_ms: float) -> None:
+    """Queue the comparison of a mirrored request with the primary response; never blocks."""
+    if shadow_future is None:
+        return
+    try:
+        _executor().submit(_compare, route, shadow_future, primary_body, primary_ms)
+    except RuntimeError:
+        pass
+
+
+def summary() -> Dict[str, Any]:
+    """Running agreement and latency stats (call with ``_lock`` held or for a best-effort read)."""
+    compared = _stats["records"] - _stats["errors"]
+    return {
+        "type": "summary",
+        "ts": round(time.time(), 3),
+        "records": _stats["records"],
+        "agreement": round(_stats["agree"] / compared, 4) if compared else None,
+        "errors": _stats["errors"],
+        "skipped_saturated": _stats["skipped"],
+        "primary_ms": {"p50": _percentile(_stats["primary_ms"], 50), "p95": _percentile(_stats["primary_ms"], 95)},
+        "shadow_ms": {"p50": _percentile(_stats["shadow_ms"], 50), "p95": _percentile(_stats["shadow_ms"], 95)},
+    }